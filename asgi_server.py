@@ -0,0 +1,391 @@
+"""
+ASGI entry point: the same /api/* routes served on an async server
+
+    uvicorn asgi_server:app --workers 4
+
+The read routes that carry most of the traffic run on the event loop with
+async drivers (see async_db.py): GET /api/submissions/<category>,
+/api/submission/<category>/<id>, /api/stats and /api/analytics. They build
+their queries with the same helpers as the Flask views and return the same
+bodies, ETags, 304s, compression and CORS headers, and share the worker's
+response cache and metrics.
+
+With read replicas configured (server.replica_router), the native routes
+read from them like the Flask routes do, including the stickiness cookie
+that keeps a client on the primary after it writes.
+
+Every other request (writes, exports, PDFs, pages) goes to the Flask app,
+run in a thread pool by WSGIBridge, so the write paths keep a single
+implementation in server.py. A slow request there holds one thread, never
+the event loop.
+"""
+
+import asyncio
+import io
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie
+
+import async_db
+import compression
+import metrics
+import migrations
+import rollups
+import server
+from response_cache import CachedResponse, etag_matches, make_etag
+
+# ASGI_DB_POOL_SIZE: async reader connections per worker (default DB_POOL_MAX)
+# ASGI_WSGI_THREADS: threads running Flask for the routes not served natively
+ASGI_DB_POOL_SIZE = int(os.environ.get('ASGI_DB_POOL_SIZE', server.pool.max_size))
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+
+JSON_MIMETYPE = 'application/json'
+CORS_HEADERS = server.CORS_HEADERS
+
+
+class Request:
+    """The parts of an HTTP request scope the native routes read"""
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.cookies = parse_cookie(self.headers.get('cookie', ''))
+
+
+def json_body(payload):
+    """Encode like jsonify() outside debug mode (compact, sorted keys)"""
+    return (server.app.json.dumps(payload, indent=None, separators=(',', ':')) + '\n').encode()
+
+
+def error(message, status):
+    return status, {"status": "error", "message": message}
+
+
+class Response:
+
+    def __init__(self, body=b'', status=200, headers=None, mimetype=JSON_MIMETYPE):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        if mimetype and status != 304:
+            self.headers['Content-Type'] = mimetype
+        self.mimetype = mimetype
+
+    def compress(self, accept_encoding):
+        """compression.compress_response() for a buffered ASGI response"""
+        if (self.status != 200 or 'Content-Encoding' in self.headers
+                or self.mimetype not in compression.COMPRESSIBLE_MIMETYPES):
+            return
+        self.headers['Vary'] = 'Accept-Encoding'
+        if len(self.body) < server.COMPRESS_MIN_SIZE:
+            return
+        encoding = compression.negotiate_encoding(accept_encoding)
+        if encoding is None:
+            return
+        self.body = compression.compress(self.body, encoding)
+        self.headers['Content-Encoding'] = encoding
+        etag = self.headers.get('ETag')
+        if etag and etag.endswith('"'):
+            self.headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+
+    async def send(self, send):
+        headers = [(k.encode('latin-1'), v.encode('latin-1')) for k, v in self.headers.items()]
+        headers += [(k.encode('latin-1'), v.encode('latin-1')) for k, v in CORS_HEADERS]
+        if self.status != 304:
+            headers.append((b'content-length', str(len(self.body)).encode()))
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': self.body})
+
+
+class WSGIBridge:
+    """Run a WSGI app for an ASGI HTTP scope on a thread pool
+
+    The request body is read in full first. Each response is produced on
+    one pool thread (streamed responses keep their Flask context on the
+    thread that opened it) and handed to the loop chunk by chunk through a
+    small queue, so exports stay incremental and a slow client holds back
+    the producer.
+    """
+
+    QUEUE_CHUNKS = 8
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    @staticmethod
+    def environ(scope, body):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': (scope.get('client') or ('127.0.0.1', 0))[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def run(self, environ, loop, queue):
+        """Call the app and iterate its response on this thread, queueing messages for the loop"""
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            put(('start', int(status.split(' ', 1)[0]),
+                 [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]))
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            put(('end', None))
+
+    async def __call__(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.QUEUE_CHUNKS)
+        producer = loop.run_in_executor(self.executor, self.run,
+                                        self.environ(scope, b''.join(chunks)), loop, queue)
+        started = False
+        try:
+            while True:
+                kind, *item = await queue.get()
+                if kind == 'end':
+                    break
+                if kind == 'start':
+                    await send({'type': 'http.response.start', 'status': item[0], 'headers': item[1]})
+                    started = True
+                else:
+                    await send({'type': 'http.response.body', 'body': item[0], 'more_body': True})
+        except BaseException:
+            # Client gone: let the producer finish into a queue nobody reads
+            loop.create_task(self.drain(queue))
+            raise
+        try:
+            await producer
+        except Exception:
+            if started:
+                raise
+            await Response(json_body({"status": "error", "message": "Internal server error"}), 500).send(send)
+            return
+        await send({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    async def drain(queue):
+        while (await queue.get())[0] != 'end':
+            pass
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsyncApp:
+    """ASGI application: native async read routes, Flask for the rest"""
+
+    def __init__(self, wsgi_app):
+        self.fallback = WSGIBridge(wsgi_app, ASGI_WSGI_THREADS)
+        self.db = None
+        self._opening = None
+        self.replica_executor = None
+        # (method, pattern, Flask rule for metrics, handler)
+        self.routes = [
+            ('GET', re.compile(r'/api/submissions/(?P<category>[^/]+)'), '/api/submissions/<category>',
+             self.get_submissions_by_category),
+            ('GET', re.compile(r'/api/submission/(?P<category>[^/]+)/(?P<id>\d+)'),
+             '/api/submission/<category>/<int:id>', self.get_submission_by_id),
+            ('GET', re.compile(r'/api/stats'), '/api/stats', self.get_statistics),
+            ('GET', re.compile(r'/api/analytics'), '/api/analytics', self.get_analytics),
+        ]
+
+    async def startup(self):
+        if self.db is None:
+            if self._opening is None:
+                self._opening = asyncio.ensure_future(async_db.open_database(
+                    server.DB_MODE, server.pool, ASGI_DB_POOL_SIZE, sqlite_path=server.DB_PATH,
+                    sqlite_pragmas=server.SQLITE_PRAGMAS, dsn=server.DATABASE_URL))
+            self.db = await self._opening
+        return self.db
+
+    async def shutdown(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = self._opening = None
+        if self.replica_executor is not None:
+            self.replica_executor.shutdown(wait=False)
+            self.replica_executor = None
+        self.fallback.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        for method, pattern, rule, handler in self.routes:
+            if scope['method'] == method:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    await self.dispatch(Request(scope), rule, handler, match.groupdict(), send)
+                    return
+        await self.fallback(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispatch(self, request, rule, handler, params, send):
+        timings = metrics.RequestTimings() if server.METRICS_ENABLED else None
+        try:
+            db = self.reader(await self.startup(), request)
+            response = await handler(db, request, timings, **params)
+        except Exception as e:
+            response = Response(json_body({"status": "error", "message": str(e)}), 500)
+        response.compress(request.headers.get('accept-encoding'))
+        await response.send(send)
+        if timings is not None:
+            timings.status = response.status
+            server.request_metrics.record(request.method, rule, timings)
+
+    def reader(self, db, request):
+        """The database a native route reads: a replica unless the client wrote recently"""
+        router = server.replica_router
+        if router is None or server.reads_from_primary(request.cookies):
+            return db
+        if self.replica_executor is None:
+            self.replica_executor = ThreadPoolExecutor(max_workers=ASGI_DB_POOL_SIZE,
+                                                       thread_name_prefix='replica-db')
+        return async_db.ReplicaReads(router, db, self.replica_executor, server.PARAM)
+
+    async def cached(self, db, request, tables, view, timings):
+        """cached_response() for a native view returning (status, payload)"""
+        if not (server.RESPONSE_CACHE_ENABLED and tables):
+            status, payload = await view()
+            return Response(json_body(payload), status)
+
+        rows = await db.fetch('SELECT table_name, data_version FROM table_stats', timings=timings)
+        versions = {row['table_name']: row['data_version'] for row in rows if row['table_name'] in tables}
+        key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+        etag = make_etag(key, versions)
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            server.response_cache.record_not_modified()
+            return Response(status=304, headers=headers, mimetype=None)
+        entry = server.response_cache.get(key, etag)
+        if entry is None:
+            status, payload = await view()
+            body = json_body(payload)
+            if status != 200:
+                return Response(body, status)
+            entry = CachedResponse(etag, body, 200, JSON_MIMETYPE)
+            server.response_cache.put(key, entry)
+        return Response(entry.body, entry.status, headers, entry.mimetype)
+
+    async def get_submissions_by_category(self, db, request, timings, category):
+        async def view():
+            table_name = server.CATEGORY_TABLES.get(category)
+            if not table_name:
+                return error("Invalid category", 400)
+            try:
+                token = request.args.get('cursor')
+                after = server.decode_cursor(token) if token else None
+                sql, params, limit = server.page_query(table_name, request.args, after)
+            except server.InvalidQuery as e:
+                return error(str(e), 400)
+            rows, next_position = server.page_result(await db.fetch(sql, params, timings), limit)
+            return 200, {
+                "status": "success",
+                "data": rows,
+                "next_cursor": server.encode_cursor(next_position) if next_position else None
+            }
+        return await self.cached(db, request, server.category_tables(category), view, timings)
+
+    async def get_submission_by_id(self, db, request, timings, category, id):
+        table_name = server.CATEGORY_TABLES.get(category)
+        if not table_name:
+            return Response(json_body({"status": "error", "message": "Invalid category"}), 400)
+        rows = await db.fetch(f'SELECT * FROM {table_name} WHERE id = ?', (int(id),), timings)
+        if not rows:
+            return Response(json_body({"status": "error", "message": "Record not found"}), 404)
+        return Response(json_body({"status": "success", "data": rows[0]}), 200,
+                        {'ETag': server.record_etag(rows[0]['row_version'])})
+
+    async def get_statistics(self, db, request, timings):
+        async def view():
+            rows = await db.fetch('SELECT table_name, row_count FROM table_stats', timings=timings)
+            counts = {row['table_name']: row['row_count'] for row in rows}
+            stats = {table: counts.get(table, 0) for table in server.CATEGORY_TABLES.values()}
+            stats['total_submissions'] = server.total_submissions(counts)
+            return 200, {"status": "success", "data": stats}
+        return await self.cached(db, request, list(migrations.COUNTED_TABLES), view, timings)
+
+    async def get_analytics(self, db, request, timings):
+        async def view():
+            try:
+                group_by = rollups.parse_group_by(request.args.get('group_by'))
+            except rollups.AnalyticsQueryError as e:
+                return error(str(e), 400)
+            filters = {key: request.args[key] for key in migrations.ROLLUP_KEYS if request.args.get(key)}
+            sql, params = rollups.query(server.DB_MODE, group_by, filters)
+            groups = await db.fetch(sql, params, timings)
+            return 200, {
+                "status": "success",
+                "group_by": group_by,
+                "data": [rollups.summarize(row, group_by) for row in groups]
+            }
+        return await self.cached(db, request, [rollups.SOURCE_TABLE], view, timings)
+
+
+app = AsyncApp(server.app)
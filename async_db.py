@@ -0,0 +1,215 @@
+"""
+Async database access for the ASGI server (asgi_server.py)
+
+One reader pool per worker process, chosen by DB_MODE:
+- sqlite: aiosqlite connections, each with its own thread, opened with the
+  server's pragmas and query_only, handed out in arrival order
+- postgres: an asyncpg pool; ? and %s placeholders become $1, $2, ...
+- sqlserver: pyodbc has no async API, so queries run on the server's
+  connection pool in a thread pool sized to it
+
+SQLite or Postgres without its async driver takes the thread pool path as
+well. fetch() returns rows as column -> value dicts, like rows_to_dicts().
+
+With read replicas configured, each request's reads go through
+ReplicaReads instead: the server's ReplicaRouter picks the replica (with
+the same health checks, lag limit and failover to the primary as the Flask
+routes) and the query runs in a worker thread on that replica's pool.
+"""
+
+import asyncio
+import itertools
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import aiosqlite
+    HAS_AIOSQLITE = True
+except ImportError:
+    HAS_AIOSQLITE = False
+
+try:
+    import asyncpg
+    HAS_ASYNCPG = True
+except ImportError:
+    HAS_ASYNCPG = False
+
+PLACEHOLDER = re.compile(r'\?|%s')
+
+
+def numbered(sql):
+    """Rewrite ? / %s placeholders as asyncpg's $1, $2, ..."""
+    counter = itertools.count(1)
+    return PLACEHOLDER.sub(lambda _: f'${next(counter)}', sql)
+
+
+def _record(timings, started, rows):
+    if timings is not None:
+        timings.add('query', time.perf_counter() - started)
+        timings.queries += 1
+        timings.rows += len(rows)
+
+
+class SqliteDatabase:
+    """aiosqlite connections; every query takes one for its duration
+
+    Waiting queries are served first come, first served (asyncio.Semaphore
+    does not let a newcomer overtake a woken waiter, where a Queue would).
+    """
+
+    driver = 'aiosqlite'
+
+    def __init__(self, path, pragmas, size):
+        self.path = path
+        self.pragmas = pragmas
+        self.size = size
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+        self._conns = []
+
+    async def open(self):
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            for name, value in self.pragmas + [('query_only', 1)]:
+                await conn.execute(f'PRAGMA {name} = {value}')
+            self._conns.append(conn)
+            self._idle.append(conn)
+        return self
+
+    async def fetch(self, sql, params=(), timings=None):
+        async with self._slots:
+            conn = self._idle.pop()
+            started = time.perf_counter()
+            try:
+                async with conn.execute(sql, params) as cursor:
+                    rows = [dict(row) for row in await cursor.fetchall()]
+            finally:
+                self._idle.append(conn)
+        _record(timings, started, rows)
+        return rows
+
+    async def close(self):
+        for conn in self._conns:
+            await conn.close()
+        self._conns = []
+
+
+def _encode_timestamp(value):
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else str(value)
+
+
+class PostgresDatabase:
+    """asyncpg pool; timestamps accept the ISO strings page cursors carry"""
+
+    driver = 'asyncpg'
+
+    def __init__(self, dsn, min_size, max_size):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    @staticmethod
+    async def _init(conn):
+        # psycopg2 sends parameters as literals, so a cursor's created_at
+        # string compares with a TIMESTAMP column; asyncpg wants a datetime
+        await conn.set_type_codec('timestamp', schema='pg_catalog', format='text',
+                                  encoder=_encode_timestamp, decoder=datetime.fromisoformat)
+
+    async def open(self):
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size,
+                                              max_size=self.max_size, init=self._init)
+        return self
+
+    async def fetch(self, sql, params=(), timings=None):
+        started = time.perf_counter()
+        rows = [dict(row) for row in await self.pool.fetch(numbered(sql), *params)]
+        _record(timings, started, rows)
+        return rows
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+
+class ThreadedDatabase:
+    """Blocking queries on the server's connection pool, run in worker threads"""
+
+    driver = 'threads'
+
+    def __init__(self, pool, marker, threads):
+        self.pool = pool
+        self.marker = marker
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='async-db')
+
+    async def open(self):
+        return self
+
+    def _fetch(self, sql, params):
+        return _query(self.pool.acquire(), self.marker, sql, params)
+
+    async def fetch(self, sql, params=(), timings=None):
+        started = time.perf_counter()
+        rows = await asyncio.get_running_loop().run_in_executor(self.executor, self._fetch, sql, params)
+        _record(timings, started, rows)
+        return rows
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def _query(conn, marker, sql, params):
+    """Run one query on a pooled connection, then return the connection"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute(PLACEHOLDER.sub(marker, sql), tuple(params))
+        rows = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+    finally:
+        conn.close()
+
+
+class ReplicaReads:
+    """One request's reads on a replica chosen by a replicas.ReplicaRouter
+
+    Every query asks for the replica the first one used, so a request reads
+    one replica unless it fails over. When no replica is usable the query
+    goes to `primary` (the worker's reader pool).
+    """
+
+    def __init__(self, router, primary, executor, marker):
+        self.router = router
+        self.primary = primary
+        self.executor = executor
+        self.marker = marker
+        self.replica = None
+
+    def _fetch(self, sql, params):
+        replica, conn = self.router.acquire(self.replica)
+        if replica is None:
+            return None
+        self.replica = replica
+        return _query(conn, self.marker, sql, params)
+
+    async def fetch(self, sql, params=(), timings=None):
+        started = time.perf_counter()
+        rows = await asyncio.get_running_loop().run_in_executor(self.executor, self._fetch, sql, params)
+        if rows is None:
+            return await self.primary.fetch(sql, params, timings)
+        _record(timings, started, rows)
+        return rows
+
+
+async def open_database(db_mode, pool, size, sqlite_path=None, sqlite_pragmas=(), dsn=None):
+    """Open the reader pool for db_mode (see module docstring)"""
+    if db_mode == 'sqlite' and HAS_AIOSQLITE:
+        return await SqliteDatabase(sqlite_path, list(sqlite_pragmas), size).open()
+    if db_mode == 'postgres' and HAS_ASYNCPG:
+        return await PostgresDatabase(dsn, 1, size).open()
+    return await ThreadedDatabase(pool, '%s' if db_mode == 'postgres' else '?', size).open()
@@ -0,0 +1,259 @@
+"""
+Write-behind writer for the form_submissions_log audit trail
+
+Handlers call in_transaction(cursor, events) before committing and
+after_commit(events) afterwards; only one of them does anything, depending on
+the mode.
+
+In 'async' mode the events are handed over after the handler's transaction
+commits. They are appended to a local spool file (so they survive a crash)
+and a background thread inserts them in batched multi-row INSERTs once
+`batch_size` events are waiting or `flush_interval` seconds have passed.
+
+In 'strict' mode events are inserted synchronously inside the caller's
+transaction, exactly as before.
+
+Spool layout (one set of files per worker process):
+    audit-<pid>.jsonl        events not yet handed to the flusher
+    audit-<pid>-<n>.seg      a rotated batch waiting to be written
+After a batch commits its segment file is deleted. When an async writer is
+created it claims the spool files of processes that are no longer running
+(and any left under its own pid by an earlier process, as happens when a
+container restart reuses pids) and replays them, so delivery is
+at-least-once. Segment files are never renamed over an existing file.
+"""
+
+import glob
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import bulk
+
+LOG_COLUMNS = ['form_category', 'form_id', 'action', 'ip_address', 'submitted_at']
+
+
+def audit_event(form_category, form_id, action, ip_address):
+    """Event tuple in LOG_COLUMNS order, stamped with the current UTC time
+
+    Both modes stamp events here rather than with the database default, so
+    submitted_at is UTC on every database (NOW() and GETDATE() would give
+    the server's local time on PostgreSQL and SQL Server).
+    """
+    return (form_category, form_id, action, ip_address,
+            now_utc().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def now_utc():
+    """The clock audit timestamps are on: naive UTC, like the submitted_at column"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class AuditWriter:
+    """Batches audit log inserts per worker process (see module docstring)"""
+
+    def __init__(self, get_conn, db_mode, spool_dir, mode='async', batch_size=500,
+                 flush_interval=1.0, fsync=False, on_flush=None):
+        if mode not in ('async', 'strict'):
+            raise ValueError("mode must be 'async' or 'strict'")
+        self.get_conn = get_conn
+        self.db_mode = db_mode
+        self.spool_dir = spool_dir
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        # on_flush(cursor, count) runs inside each flush transaction
+        self.on_flush = on_flush
+        self._reset_state()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_state)
+        if not self.strict:
+            self.recover()
+
+    @property
+    def strict(self):
+        return self.mode == 'strict'
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._lock = threading.Condition(threading.Lock())
+        self._flush_lock = threading.Lock()
+        self._spool = None
+        self._spooled = 0
+        self._segment_seq = 0
+        self._thread = None
+        self._stopping = False
+        self.counters = {'queued': 0, 'written': 0, 'batches': 0, 'failures': 0, 'recovered': 0}
+
+    # -- producer side ---------------------------------------------------
+
+    def in_transaction(self, cursor, events):
+        """Strict mode: insert events inside the caller's open transaction"""
+        if self.strict and events:
+            self._insert_rows(cursor, events)
+
+    def after_commit(self, events):
+        """Async mode: spool committed events for the background flusher"""
+        if self.strict or not events:
+            return
+        if self._pid != os.getpid():
+            self._reset_state()
+        lines = ''.join(json.dumps(list(e)) + '\n' for e in events)
+        with self._lock:
+            self._ensure_started()
+            if self._spool is None:
+                self._spool = open(self._spool_path(), 'a', encoding='utf-8')
+            self._spool.write(lines)
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+            self._spooled += len(events)
+            self.counters['queued'] += len(events)
+            if self._spooled >= self.batch_size:
+                self._lock.notify()
+
+    # -- flusher side ----------------------------------------------------
+
+    def _spool_path(self):
+        return os.path.join(self.spool_dir, f'audit-{self._pid}.jsonl')
+
+    def recover(self):
+        """Claim orphaned spool files and start flushing them if there are any"""
+        with self._lock:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._claim_orphans()
+            if self._segments():
+                self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._claim_orphans()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _claim_orphans(self):
+        """Take over spool files left behind by processes that have exited"""
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, 'audit-*'))):
+            try:
+                pid = int(os.path.basename(path).split('-')[1].split('.')[0])
+            except (IndexError, ValueError):
+                continue
+            if pid == self._pid:
+                # Our segments are flushed as they are; an unopened spool
+                # under our pid was left by an earlier process with it
+                if path != self._spool_path() or self._spool is not None:
+                    continue
+            elif _pid_alive(pid):
+                continue
+            target = self._next_segment_path()
+            try:
+                os.rename(path, target)
+            except OSError:
+                continue  # another worker claimed it first
+            self.counters['recovered'] += 1
+
+    def _next_segment_path(self):
+        """First unused segment name after the last one (files may predate this process)"""
+        while True:
+            self._segment_seq += 1
+            path = os.path.join(self.spool_dir, f'audit-{self._pid}-{self._segment_seq}.seg')
+            if not os.path.exists(path):
+                return path
+
+    def _rotate(self):
+        """Move spooled events into a segment file for flushing"""
+        with self._lock:
+            if self._spool is None or self._spooled == 0:
+                return
+            self._spool.close()
+            self._spool = None
+            self._spooled = 0
+            os.rename(self._spool_path(), self._next_segment_path())
+
+    def _segments(self):
+        def seq(path):
+            return int(path.rsplit('-', 1)[1].split('.')[0])
+        return sorted(glob.glob(os.path.join(self.spool_dir, f'audit-{self._pid}-*.seg')), key=seq)
+
+    def flush(self):
+        """Write every spooled event to the database now; returns rows written"""
+        if self.strict:
+            return 0
+        with self._flush_lock:
+            self._rotate()
+            written = 0
+            for path in self._segments():
+                with open(path, encoding='utf-8') as f:
+                    events = [tuple(json.loads(line)) for line in f if line.strip()]
+                if events:
+                    self._insert(events)
+                os.remove(path)
+                written += len(events)
+            return written
+
+    def _insert(self, events):
+        conn = self.get_conn()
+        try:
+            self._insert_rows(conn.cursor(), events)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.counters['written'] += len(events)
+        self.counters['batches'] += 1
+
+    def _insert_rows(self, cursor, events):
+        size = bulk.chunk_size(self.db_mode, LOG_COLUMNS, self.batch_size)
+        for start in range(0, len(events), size):
+            bulk.insert_many(cursor, self.db_mode, 'form_submissions_log', LOG_COLUMNS,
+                             events[start:start + size], returning=False)
+        if self.on_flush:
+            self.on_flush(cursor, len(events))
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            with self._lock:
+                if not self._stopping and self._spooled < self.batch_size:
+                    self._lock.wait(backoff)
+                stopping = self._stopping
+            try:
+                self.flush()
+                backoff = self.flush_interval
+            except Exception:
+                # Segments stay on disk and are retried on the next cycle
+                self.counters['failures'] += 1
+                backoff = min(backoff * 2 if backoff else 1.0, 30.0)
+            if stopping:
+                return
+
+    def close(self, timeout=5):
+        """Flush outstanding events and stop the background thread"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        with self._lock:
+            self._stopping = True
+            self._lock.notify()
+        thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.counters, mode=self.mode, spooled=self._spooled,
+                        pending_segments=len(self._segments()))
+        return data
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,292 @@
+"""
+Monthly partitions of the form_submissions_log audit trail
+
+PostgreSQL uses native declarative partitioning (migration 9):
+form_submissions_log is partitioned by RANGE (submitted_at) with one
+partition per month, form_submissions_log_pYYYYMM, and a DEFAULT partition
+that catches rows no month partition exists for yet. ensure_partitions()
+creates the coming months ahead of time and moves any rows the default
+partition picked up into their month.
+
+SQLite and SQL Server have no partitioning, so they get rolling tables:
+new rows go to form_submissions_log_current, roll() moves each finished
+month into its own form_submissions_log_pYYYYMM table, and
+form_submissions_log is a UNION ALL view over all of them with an
+INSTEAD OF INSERT trigger, so every reader and writer keeps using the one
+name.
+
+Months are UTC months, like the submitted_at timestamps. Month partitions
+older than the retention period are written to gzipped NDJSON files (one
+per month, listed in the archive directory's manifest.json) and then
+dropped; archive files past their own retention are deleted. Queries over recent activity name only the partitions that
+can hold it (recent_source()).
+"""
+
+import json
+import os
+import re
+from datetime import date, datetime, timezone
+
+import export
+
+LOG_TABLE = 'form_submissions_log'
+CURRENT_TABLE = 'form_submissions_log_current'
+DEFAULT_PARTITION = 'form_submissions_log_default'
+PARTITION_PREFIX = 'form_submissions_log_p'
+PARTITION_NAME = re.compile(r'^form_submissions_log_p(\d{4})(\d{2})$')
+INSERT_TRIGGER = 'form_submissions_log_insert'
+# Every column but id, which the current table assigns
+INSERT_COLUMNS = ('form_category', 'form_id', 'action', 'user_info', 'ip_address', 'submitted_at')
+ARCHIVED_STAT = 'form_submissions_log_archived'
+MANIFEST = 'manifest.json'
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month:%Y%m}'
+
+
+def partition_month(name):
+    """First day of the month a partition table holds, or None for other tables"""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def timestamp_text(day):
+    return f'{day:%Y-%m-%d} 00:00:00'
+
+
+def lock(cursor, db_mode):
+    """Serialize partition maintenance across workers for the rest of the transaction
+
+    SQLite needs nothing more: the caller's write transaction holds the
+    database write lock.
+    """
+    if db_mode == 'postgres':
+        cursor.execute('SELECT pg_advisory_xact_lock(846537002)')
+    elif db_mode == 'sqlserver':
+        cursor.execute("EXEC sp_getapplock @Resource = 'audit_partitions', "
+                       "@LockMode = 'Exclusive', @LockOwner = 'Transaction'")
+
+
+def list_partitions(cursor, db_mode):
+    """[(month, table name)] of the month partitions, oldest first"""
+    if db_mode == 'postgres':
+        cursor.execute("SELECT c.relname FROM pg_inherits i "
+                       "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                       f"WHERE p.relname = '{LOG_TABLE}'")
+    elif db_mode == 'sqlserver':
+        cursor.execute(f"SELECT name FROM sys.tables WHERE name LIKE '{LOG_TABLE}[_]p%'")
+    else:
+        cursor.execute(f"SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '{LOG_TABLE}_p%'")
+    names = [row[0] for row in cursor.fetchall()]
+    return sorted((partition_month(name), name) for name in names if partition_month(name))
+
+
+def view_statements(db_mode, months):
+    """(Re)create the form_submissions_log view over the current table and `months`"""
+    selects = ' UNION ALL '.join(f'SELECT * FROM {name}'
+                                 for name in [CURRENT_TABLE] + [partition_name(m) for m in months])
+    columns = ', '.join(INSERT_COLUMNS)
+    if db_mode == 'sqlserver':
+        return [
+            f'CREATE OR ALTER VIEW {LOG_TABLE} AS {selects}',
+            f'CREATE OR ALTER TRIGGER {INSERT_TRIGGER} ON {LOG_TABLE} INSTEAD OF INSERT AS '
+            f"INSERT INTO {CURRENT_TABLE} ({columns}) SELECT {columns.replace('submitted_at', 'COALESCE(submitted_at, GETUTCDATE())')} FROM inserted",
+        ]
+    values = ', '.join(f'new.{c}' for c in INSERT_COLUMNS).replace(
+        'new.submitted_at', 'COALESCE(new.submitted_at, CURRENT_TIMESTAMP)')
+    # Dropping the view drops its trigger too
+    return [
+        f'DROP VIEW IF EXISTS {LOG_TABLE}',
+        f'CREATE VIEW {LOG_TABLE} AS {selects}',
+        f'CREATE TRIGGER {INSERT_TRIGGER} INSTEAD OF INSERT ON {LOG_TABLE} '
+        f'BEGIN INSERT INTO {CURRENT_TABLE} ({columns}) VALUES ({values}); END',
+    ]
+
+
+def month_table_ddl(db_mode, name):
+    """A rolled month's table: the log's columns, ids copied from the current table"""
+    if db_mode == 'sqlserver':
+        return [
+            f"IF OBJECT_ID('{name}', 'U') IS NULL CREATE TABLE {name} ("
+            'id INT PRIMARY KEY, form_category NVARCHAR(255) NOT NULL, form_id INT, '
+            'action NVARCHAR(255) NOT NULL, user_info NVARCHAR(MAX), '
+            'ip_address NVARCHAR(255), submitted_at DATETIME)',
+        ]
+    return [
+        f'CREATE TABLE IF NOT EXISTS {name} ('
+        'id INTEGER PRIMARY KEY, form_category TEXT NOT NULL, form_id INTEGER, '
+        'action TEXT NOT NULL, user_info TEXT, ip_address TEXT, submitted_at TIMESTAMP)',
+        f'CREATE INDEX IF NOT EXISTS idx_{name}_form ON {name} (form_category, form_id)',
+    ]
+
+
+def ensure_partitions(cursor, db_mode, today, ahead=2):
+    """Postgres: create month partitions through `ahead` months from now, plus
+    any month the default partition holds rows for; returns the names created
+    """
+    if db_mode != 'postgres':
+        return []
+    lock(cursor, db_mode)
+    existing = {month for month, _ in list_partitions(cursor, db_mode)}
+    current = month_start(today)
+    wanted = {add_months(current, i) for i in range(ahead + 1)}
+    cursor.execute(f"SELECT DISTINCT date_trunc('month', submitted_at) FROM {DEFAULT_PARTITION}")
+    wanted.update(month_start(row[0]) for row in cursor.fetchall() if row[0] is not None)
+
+    created = []
+    for month in sorted(wanted - existing):
+        name = partition_name(month)
+        bounds = (timestamp_text(month), timestamp_text(add_months(month, 1)))
+        cursor.execute(f'CREATE TABLE {name} (LIKE {LOG_TABLE} INCLUDING DEFAULTS)')
+        # ATTACH refuses while the default partition holds rows of the month
+        cursor.execute(f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+                       f'WHERE submitted_at >= %s AND submitted_at < %s RETURNING *) '
+                       f'INSERT INTO {name} SELECT * FROM moved', bounds)
+        cursor.execute(f"ALTER TABLE {LOG_TABLE} ATTACH PARTITION {name} "
+                       f"FOR VALUES FROM ('{bounds[0]}') TO ('{bounds[1]}')")
+        created.append(name)
+    return created
+
+
+def roll(cursor, db_mode, today):
+    """SQLite/SQL Server: move finished months out of the current table into
+    their month tables; returns {table name: rows moved}
+    """
+    if db_mode == 'postgres':
+        return {}
+    lock(cursor, db_mode)
+    marker = '?'
+    current = timestamp_text(month_start(today))
+    month_sql = ("CONVERT(CHAR(7), submitted_at, 126)" if db_mode == 'sqlserver'
+                 else "strftime('%Y-%m', submitted_at)")
+    cursor.execute(f'SELECT DISTINCT {month_sql} FROM {CURRENT_TABLE} WHERE submitted_at < {marker}',
+                   (current,))
+    months = sorted(date(int(text[:4]), int(text[5:7]), 1) for (text,) in cursor.fetchall() if text)
+
+    moved = {}
+    for month in months:
+        name = partition_name(month)
+        bounds = (timestamp_text(month), timestamp_text(add_months(month, 1)))
+        for sql in month_table_ddl(db_mode, name):
+            cursor.execute(sql)
+        where = f'submitted_at >= {marker} AND submitted_at < {marker}'
+        cursor.execute(f'INSERT INTO {name} SELECT * FROM {CURRENT_TABLE} WHERE {where}', bounds)
+        cursor.execute(f'DELETE FROM {CURRENT_TABLE} WHERE {where}', bounds)
+        moved[name] = cursor.rowcount
+    if months:
+        for sql in view_statements(db_mode, [month for month, _ in list_partitions(cursor, db_mode)]):
+            cursor.execute(sql)
+    return moved
+
+
+def expired_partitions(cursor, db_mode, today, keep_months):
+    """[(month, name)] of partitions whose month ended more than keep_months ago"""
+    cutoff = add_months(month_start(today), -keep_months)
+    return [(month, name) for month, name in list_partitions(cursor, db_mode) if month < cutoff]
+
+
+def drop_statements(cursor, db_mode, name):
+    """Statements that remove one month partition from the log"""
+    if db_mode == 'postgres':
+        return [f'ALTER TABLE {LOG_TABLE} DETACH PARTITION {name}', f'DROP TABLE {name}']
+    months = [month for month, other in list_partitions(cursor, db_mode) if other != name]
+    return view_statements(db_mode, months) + [f'DROP TABLE {name}']
+
+
+def write_archive(conn, db_mode, name, path):
+    """Write a partition's rows to `path` as gzipped NDJSON; returns the row count"""
+    rows = export.iter_rows(conn, db_mode, f'SELECT * FROM {name} ORDER BY id')
+    count = [0]
+
+    def counted():
+        yield next(rows)
+        for row in rows:
+            count[0] += 1
+            yield row
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in export.gzip_chunks(export.chunked(export.ENCODERS['ndjson'](counted()))):
+                f.write(chunk)
+        os.replace(tmp, path)
+    finally:
+        rows.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return count[0]
+
+
+def archive_file_name(month, manifest):
+    """Next unused file name for a month (late rows may archive a month twice)"""
+    taken = {f['file'] for f in manifest['months'].get(f'{month:%Y-%m}', {}).get('files', [])}
+    name, n = f'{LOG_TABLE}-{month:%Y-%m}.ndjson.gz', 1
+    while name in taken:
+        n += 1
+        name = f'{LOG_TABLE}-{month:%Y-%m}-{n}.ndjson.gz'
+    return name
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'months': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def record_archive(manifest, month, file_name, rows):
+    entry = manifest['months'].setdefault(f'{month:%Y-%m}', {'files': [], 'rows': 0})
+    entry['files'].append({'file': file_name, 'rows': rows,
+                           'archived_at': datetime.now(timezone.utc).isoformat(timespec='seconds')})
+    entry['rows'] += rows
+
+
+def prune_archives(directory, manifest, today, retention_months):
+    """Delete archive files of months older than retention_months; returns the months removed"""
+    if not retention_months:
+        return []
+    cutoff = f'{add_months(month_start(today), -retention_months):%Y-%m}'
+    removed = []
+    for key in sorted(manifest['months']):
+        if key >= cutoff:
+            continue
+        for entry in manifest['months'][key]['files']:
+            path = os.path.join(directory, entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+        del manifest['months'][key]
+        removed.append(key)
+    return removed
+
+
+def recent_source(cursor, db_mode, since):
+    """FROM clause holding every log row submitted at or after `since` (a date)
+
+    Postgres prunes partitions by itself given a submitted_at condition; on
+    SQLite/SQL Server the view would read every month table, so only the
+    current table and the month tables from since's month on are named.
+    """
+    if db_mode == 'postgres':
+        return LOG_TABLE
+    first = month_start(since)
+    names = [CURRENT_TABLE] + [name for month, name in list_partitions(cursor, db_mode) if month >= first]
+    return '(' + ' UNION ALL '.join(f'SELECT * FROM {name}' for name in names) + ') recent'
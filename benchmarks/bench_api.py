@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+API benchmark: throughput, latency percentiles and memory per route
+
+Loads a synthetic dataset (see synthetic_data.py) into a fresh SQLite
+database through the batch endpoints, then drives the real routes either
+in-process through the Flask test client or over HTTP with a multi-threaded
+load generator against a threaded local server.
+
+    python benchmarks/bench_api.py                      # test client
+    python benchmarks/bench_api.py --mode http -c 8     # 8 concurrent clients
+    python benchmarks/bench_api.py --save-baseline      # record baseline.json
+    python benchmarks/bench_api.py --check              # exit 1 on regression
+
+A route regresses when its p95 latency rises, or its throughput falls, by
+more than --tolerance (default 50%, since timings on shared machines are noisy) against the stored baseline for the same
+mode. Baselines are machine-specific: re-record after changing hardware.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_data
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+SEARCH_WORDS = ('hearing', 'main st', 'administration building', 'board room', 'approving',
+                'ad valorem', 'public hearing increase')
+
+
+def make_scenarios(dataset, max_ids):
+    """{name: fn(rng) -> (method, path, json body or None)}"""
+    counties = synthetic_data.TEXAS_COUNTIES
+    units = [r['taxingUnit'] for r in dataset['tax-rate-calculation'][:500]]
+    rate_inputs = dataset['tax-rate-calculation'][:1000]
+
+    def new_form(rng):
+        record = dict(rng.choice(dataset['tax-rate-calculation']))
+        record['taxingUnit'] += ' (bench)'
+        return record
+
+    return {
+        'GET /api/submissions': lambda rng: (
+            'GET', '/api/submissions?limit=50', None),
+        'GET /api/submissions/tax-rate?county': lambda rng: (
+            'GET', f'/api/submissions/tax-rate?county={quote(rng.choice(counties))}&limit=100', None),
+        'GET /api/submissions/notices?taxing_unit': lambda rng: (
+            'GET', f'/api/submissions/notices?taxing_unit={quote(rng.choice(units))}', None),
+        'GET /api/submission/tax-rate/<id>': lambda rng: (
+            'GET', f'/api/submission/tax-rate/{rng.randint(1, max_ids)}', None),
+        'GET /api/search': lambda rng: (
+            'GET', f'/api/search?q={quote(rng.choice(SEARCH_WORDS))}', None),
+        'GET /api/stats': lambda rng: (
+            'GET', '/api/stats', None),
+        'POST /api/tax-rate-calculation': lambda rng: (
+            'POST', '/api/tax-rate-calculation', new_form(rng)),
+        'POST /api/rates/compute (100 units)': lambda rng: (
+            'POST', '/api/rates/compute', rng.sample(rate_inputs, 100)),
+        'GET /api/export/water_district_forms': lambda rng: (
+            'GET', '/api/export/water_district_forms?format=ndjson', None),
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def run_client(client, scenario, requests, seed):
+    """Sequential requests through the Flask test client"""
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        method, path, body = scenario(rng)
+        t = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        latencies.append(time.perf_counter() - t)
+        errors += response.status_code >= 400
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def run_http(base_url, scenario, requests, concurrency, seed):
+    """`requests` HTTP requests spread over `concurrency` client threads"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(index, count):
+        rng = random.Random(seed + index)
+        mine, failed = [], 0
+        for _ in range(count):
+            method, path, body = scenario(rng)
+            data = json.dumps(body).encode() if body is not None else None
+            req = urllib.request.Request(base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+            t = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req) as response:
+                    response.read()
+            except urllib.error.HTTPError as e:
+                e.read()
+                failed += 1
+            mine.append(time.perf_counter() - t)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(worker, range(concurrency), shares))
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+
+def peak_allocation_kib(client, scenario, requests, seed):
+    """Peak Python heap allocated while serving a few requests (separate pass,
+    since tracemalloc slows everything down)"""
+    rng = random.Random(seed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for _ in range(requests):
+            method, path, body = scenario(rng)
+            client.open(path, method=method, json=body).get_data()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def start_http_server(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for routes that got slower than the baseline"""
+    problems = []
+    for name, current in results['routes'].items():
+        base = baseline['routes'].get(name)
+        if not base:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+        if current['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            problems.append(f"{name}: {current['throughput_rps']} req/s vs baseline "
+                            f"{base['throughput_rps']} req/s")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='HTTP client threads')
+    parser.add_argument('-n', '--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--units-per-county', type=int, default=10)
+    parser.add_argument('--years', default='2023,2024,2025')
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--route', action='append', help='only run routes containing this text')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help='compare with baseline.json')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args(argv)
+
+    # The server reads its configuration at import time
+    work_dir = tempfile.mkdtemp(prefix='tit-bench-')
+    os.environ['SQLITE_PATH'] = os.path.join(work_dir, 'bench.db')
+    os.environ['AUDIT_SPOOL_DIR'] = os.path.join(work_dir, 'audit_spool')
+    import server
+
+    try:
+        years = tuple(int(y) for y in args.years.split(','))
+        dataset = synthetic_data.generate(args.units_per_county, years, args.seed)
+        client = server.app.test_client()
+        started = time.perf_counter()
+        loaded = synthetic_data.load(client, dataset)
+        server.audit_writer.flush()
+        print(f"Loaded {loaded} forms for {len(synthetic_data.TEXAS_COUNTIES)} counties "
+              f"in {time.perf_counter() - started:.1f}s ({args.mode} mode)\n")
+
+        scenarios = make_scenarios(dataset, len(dataset['tax-rate-calculation']))
+        if args.route:
+            scenarios = {k: v for k, v in scenarios.items() if any(r in k for r in args.route)}
+
+        http_server = base_url = None
+        if args.mode == 'http':
+            http_server, base_url = start_http_server(server.app)
+
+        results = {
+            'mode': args.mode,
+            'config': {'units_per_county': args.units_per_county, 'years': list(years),
+                       'requests': args.requests, 'seed': args.seed,
+                       'concurrency': args.concurrency if args.mode == 'http' else 1},
+            'forms_loaded': loaded,
+            'routes': {},
+        }
+        print(f"{'route':<44} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>9}")
+        for name, scenario in scenarios.items():
+            # Export streams whole tables; fewer iterations keep the run short
+            n = max(1, args.requests // 10) if '/export/' in name else args.requests
+            run_client(client, scenario, min(20, n), args.seed)  # warm up
+            if args.mode == 'http':
+                stats = run_http(base_url, scenario, n, args.concurrency, args.seed)
+            else:
+                stats = run_client(client, scenario, n, args.seed)
+            stats['peak_alloc_kib'] = peak_allocation_kib(client, scenario, min(20, n), args.seed)
+            results['routes'][name] = stats
+            print(f"{name:<44} {stats['throughput_rps']:>9} {stats['p50_ms']:>9} "
+                  f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['peak_alloc_kib']:>9}"
+                  + (f"  ({stats['errors']} errors)" if stats['errors'] else ''))
+
+        results['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"\nmax RSS: {results['max_rss_kib'] / 1024:.1f} MiB")
+        if http_server:
+            http_server.shutdown()
+    finally:
+        server.audit_writer.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[args.mode] = results
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+        print(f"Baseline saved to {BASELINE_PATH}")
+    if args.check:
+        if args.mode not in baselines:
+            print(f"No {args.mode} baseline in {BASELINE_PATH}; run with --save-baseline first")
+            return 2
+        problems = compare(results, baselines[args.mode], args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} of the {args.mode} baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the sync (gunicorn) and async (uvicorn) servers side by side
+
+Loads a synthetic dataset into a throwaway SQLite database, then starts each
+server configuration as a real subprocess on the same database and drives it
+with many concurrent keep-alive HTTP clients (asyncio, one connection per
+client) for every scenario. Reports throughput, p50/p95/p99 latency and
+errors per scenario and server.
+
+    python benchmarks/bench_asgi.py                   # 128 clients
+    python benchmarks/bench_asgi.py -c 256 -n 4000
+    python benchmarks/bench_asgi.py --cache           # keep the response cache on
+
+The response cache is off by default so reads reach the database; with it
+on, repeated GETs mostly measure the cache. The load generator shares the
+machine with the servers, so compare servers within one run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic_data
+from bench_api import summarize
+
+SERVERS = {
+    'gunicorn sync': lambda port, workers, threads: [
+        sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'server:app'],
+    'gunicorn gthread': lambda port, workers, threads: [
+        sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+        '-b', f'127.0.0.1:{port}', 'server:app'],
+    'uvicorn asgi': lambda port, workers, threads: [
+        sys.executable, '-m', 'uvicorn', 'asgi_server:app', '--workers', str(workers),
+        '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+}
+
+
+def make_scenarios(dataset, max_ids):
+    """{name: fn(rng) -> (method, path, json body or None)}"""
+    counties = synthetic_data.TEXAS_COUNTIES
+
+    def read(rng):
+        return rng.choice((
+            ('GET', f'/api/submissions/tax-rate?county={quote(rng.choice(counties))}&limit=50', None),
+            ('GET', f'/api/submission/tax-rate/{rng.randint(1, max_ids)}', None),
+            ('GET', '/api/stats', None),
+            ('GET', f'/api/analytics?group_by=tax_year&county={quote(rng.choice(counties))}', None),
+        ))
+
+    def new_form(rng):
+        record = dict(rng.choice(dataset['tax-rate-calculation']))
+        record['taxingUnit'] += f' (bench {rng.random()})'
+        return record
+
+    return {
+        'GET /api/submissions/tax-rate?county': lambda rng: (
+            'GET', f'/api/submissions/tax-rate?county={quote(rng.choice(counties))}&limit=50', None),
+        'GET /api/submission/tax-rate/<id>': lambda rng: (
+            'GET', f'/api/submission/tax-rate/{rng.randint(1, max_ids)}', None),
+        'GET /api/analytics?group_by=county': lambda rng: (
+            'GET', '/api/analytics?group_by=county', None),
+        'mixed (90% reads, 10% POST)': lambda rng: (
+            ('POST', '/api/tax-rate-calculation', new_form(rng)) if rng.random() < 0.1 else read(rng)),
+    }
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, whether the server closes the connection)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status, headers.get('connection') == 'close'
+
+
+async def client(port, scenario, count, seed, latencies, errors):
+    rng = random.Random(seed)
+    reader = writer = None
+    for _ in range(count):
+        method, path, body = scenario(rng)
+        data = json.dumps(body).encode() if body is not None else b''
+        request = (f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n'
+                   f'Content-Length: {len(data)}\r\n\r\n').encode() + data
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            status, closed = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            errors[0] += status >= 400
+        except (OSError, asyncio.IncompleteReadError):
+            errors[0] += 1
+            closed = True
+        if closed and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(port, scenario, requests, concurrency, seed):
+    latencies, errors = [], [0]
+    per_client = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, scenario, n, seed + i, latencies, errors)
+                           for i, n in enumerate(per_client)))
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(command, env, port, timeout=30):
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                s.sendall(b'GET /api/stats HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+                if s.recv(16).startswith(b'HTTP/1.1 200'):
+                    return process
+        except OSError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{command[2]} did not start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-c', '--concurrency', type=int, default=128, help='concurrent connections')
+    parser.add_argument('-n', '--requests', type=int, default=3000, help='requests per scenario')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=16, help='threads per gthread worker')
+    parser.add_argument('--units-per-county', type=int, default=10)
+    parser.add_argument('--years', default='2023,2024,2025')
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--server', action='append', choices=SERVERS, help='only run these servers')
+    parser.add_argument('--cache', action='store_true', help='leave the response cache on')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='tit-bench-asgi-')
+    env = dict(os.environ, SQLITE_PATH=os.path.join(work_dir, 'bench.db'),
+               AUDIT_SPOOL_DIR=os.path.join(work_dir, 'audit_spool'),
+               RESPONSE_CACHE='on' if args.cache else 'off')
+    os.environ.update(env)
+    import server
+
+    results = {'config': {'concurrency': args.concurrency, 'requests': args.requests,
+                          'workers': args.workers, 'threads': args.threads, 'cache': args.cache},
+               'servers': {}}
+    try:
+        years = tuple(int(y) for y in args.years.split(','))
+        dataset = synthetic_data.generate(args.units_per_county, years, args.seed)
+        loaded = synthetic_data.load(server.app.test_client(), dataset)
+        server.audit_writer.flush()
+        print(f"Loaded {loaded} forms; {args.concurrency} clients, {args.workers} worker(s)\n")
+        scenarios = make_scenarios(dataset, len(dataset['tax-rate-calculation']))
+
+        for name in args.server or SERVERS:
+            port = free_port()
+            process = start_server(SERVERS[name](port, args.workers, args.threads), env, port)
+            try:
+                routes = results['servers'][name] = {}
+                for scenario_name, scenario in scenarios.items():
+                    routes[scenario_name] = stats = asyncio.run(
+                        run_load(port, scenario, args.requests, args.concurrency, args.seed))
+                    print(f"{name:17} {scenario_name:38} {stats['throughput_rps']:8.1f} req/s  "
+                          f"p50 {stats['p50_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  "
+                          f"errors {stats['errors']}")
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            print()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
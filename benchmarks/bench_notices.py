@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: batch notice generation from stored tax rate calculations
+
+1. Template rendering alone: the compiled templates against parsing the
+   form's template source for every notice.
+2. The batch path end to end: read every calculation for one tax year from
+   SQLite, classify, render, and optionally insert into public_notices
+   (what `flask --app server generate-notices --tax-year Y --save` does).
+
+Usage: python benchmarks/bench_notices.py [--units-per-county 40]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notice_templates
+import synthetic_data
+
+
+def calculation_rows(records):
+    """Tax rate calculation bodies as the snake_case rows the database returns"""
+    return [{
+        'taxing_unit': r['taxingUnit'], 'county': r['county'], 'tax_year': int(r['taxYear']),
+        'current_total_value': r['currentTotalValue'], 'proposed_rate': r['proposedRate'],
+        'no_new_revenue_rate': r['noNewRevenueRate'], 'voter_approval_rate': r['voterApprovalRate'],
+        'de_minimis_rate': r['deMinimisRate'],
+    } for r in records]
+
+
+def render_uncompiled(row):
+    """What rendering costs without the compiled cache: parse every template again"""
+    env = notice_templates.environment
+    notice_type = notice_templates.classify(row)
+    form = notice_templates.NOTICE_FORMS[notice_type][0]
+    env.cache.clear()
+    template = env.from_string(notice_templates.TEMPLATES[form])
+    return template.render(unit=row['taxing_unit'], year=row['tax_year'], hearing='TBA',
+                           proposed_rate=row['proposed_rate'],
+                           no_new_revenue_rate=row['no_new_revenue_rate'],
+                           voter_approval_rate=row['voter_approval_rate'],
+                           de_minimis_rate=row['de_minimis_rate'], levy=None, rates_table=True,
+                           show_de_minimis=False, above_nnr=True, above_va=False)
+
+
+def timed(label, count, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<44} {count:>8} {elapsed:>8.2f}s {count / elapsed:>10.0f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--units-per-county', type=int, default=40)
+    parser.add_argument('--year', type=int, default=2025)
+    args = parser.parse_args()
+
+    data = synthetic_data.generate(args.units_per_county, years=(args.year,))
+    rows = calculation_rows(data['tax-rate-calculation'])
+    sample = rows[:2000]
+    print(f"{'':<44} {'notices':>8} {'time':>9} {'rate':>11}")
+    timed('render, compiled templates', len(rows),
+          lambda: list(notice_templates.generate_notices(rows)))
+    timed('render, template parsed per notice', len(sample),
+          lambda: [render_uncompiled(row) for row in sample])
+
+    work_dir = tempfile.mkdtemp(prefix='tit-notice-bench-')
+    os.environ['SQLITE_PATH'] = os.path.join(work_dir, 'bench.db')
+    os.environ['AUDIT_SPOOL_DIR'] = os.path.join(work_dir, 'audit_spool')
+    import server
+    try:
+        synthetic_data.load(server.app.test_client(),
+                            {'tax-rate-calculation': data['tax-rate-calculation']})
+        args_year = {'tax_year': str(args.year), 'meeting_date': f'{args.year}-08-20'}
+        with server.app.app_context():
+            timed(f'generate, all of {args.year} from SQLite', len(rows),
+                  lambda: sum(1 for _ in server.generated_notices(args_year)))
+            county = {'county': 'Harris', 'tax_year': str(args.year)}
+            count = sum(1 for _ in server.generated_notices(county))
+            timed('generate, one county (Harris)', count,
+                  lambda: sum(1 for _ in server.generated_notices(county)))
+        runner = server.app.test_cli_runner()
+        result = runner.invoke(args=['generate-notices', '--tax-year', str(args.year), '--save'])
+        print(f"\nflask generate-notices --tax-year {args.year} --save: {result.output.strip()}")
+        server.audit_writer.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
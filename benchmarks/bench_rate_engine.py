@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark: vectorized rate engine vs. a pure-Python loop
+
+Usage: python benchmarks/bench_rate_engine.py [units ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_engine
+
+
+def make_units(n, seed=42):
+    rng = random.Random(seed)
+    units = []
+    for _ in range(n):
+        current = rng.uniform(5e6, 5e10)
+        units.append({
+            'lastYearLevy': current * rng.uniform(0.002, 0.008),
+            'lastYearDebtRate': rng.uniform(0, 0.3),
+            'currentTotalValue': current,
+            'newPropertyValue': current * rng.uniform(0, 0.08),
+            'lostPropertyLevy': rng.uniform(0, 50000),
+            'proposedMORate': rng.uniform(0.1, 0.7),
+            'proposedDebtRate': rng.choice([0, rng.uniform(0, 0.3)]),
+            'isDisasterArea': rng.random() < 0.05,
+        })
+    return units
+
+
+def best_of(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main(sizes):
+    # kernel: arrays in, arrays out; columnar: JSON-style lists in and out
+    # (the /api/rates/compute "columns" path); rows: list of dicts in and out
+    print(f"{'units':>8} {'loop':>10} {'kernel':>10} {'columnar':>10} {'rows':>10}   (ms, best of 5)")
+    for n in sizes:
+        units = make_units(n)
+        arrays = rate_engine.to_columns(units)
+        lists = {key: [u[key] for u in units] for key in rate_engine.INPUT_FIELDS}
+        loop = best_of(lambda: rate_engine.compute_rates_loop(units))
+        kernel = best_of(lambda: rate_engine.compute_rates(arrays))
+        columnar = best_of(lambda: rate_engine.compute_columnar(lists))
+        rows = best_of(lambda: rate_engine.compute_batch(units))
+        print(f"{n:>8} {loop * 1000:>10.2f} {kernel * 1000:>10.2f} "
+              f"{columnar * 1000:>10.2f} {rows * 1000:>10.2f}   "
+              f"kernel {loop / kernel:.0f}x, columnar {loop / columnar:.1f}x faster than loop")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent writers and readers against one SQLite database
+
+Starts several worker processes, as gunicorn would, each importing the
+server with a given SQLITE_PROFILE. Writer processes POST single forms while
+reader processes page through listings and stream exports. Reports write
+throughput, p95 write latency, failed writes ("database is locked") and read
+throughput for each profile.
+
+Usage: python benchmarks/bench_sqlite_concurrency.py [--writers 4] [--readers 2]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_data
+
+PROFILES = (
+    ('legacy', {'SQLITE_PROFILE': 'legacy'}),
+    ('production', {'SQLITE_PROFILE': 'production'}),
+    ('production + writer lock', {'SQLITE_PROFILE': 'production', 'SQLITE_WRITER_LOCK': 'true'}),
+)
+
+
+def import_server(db_path, env):
+    os.environ['SQLITE_PATH'] = db_path
+    os.environ['AUDIT_SPOOL_DIR'] = os.path.join(os.path.dirname(db_path), 'audit_spool')
+    os.environ.update(env)
+    import server
+    return server
+
+
+def writer(db_path, env, records, threads, start_at, results):
+    """POST each record from `threads` threads; report latencies and failures"""
+    server = import_server(db_path, env)
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def run(part):
+        client = server.app.test_client()
+        mine, failed = [], 0
+        for record in part:
+            t = time.perf_counter()
+            response = client.post('/api/tax-rate-calculation', json=record)
+            mine.append(time.perf_counter() - t)
+            failed += response.status_code != 201
+        with lock:
+            latencies.extend(mine)
+            failures.append(failed)
+
+    time.sleep(max(0.0, start_at - time.time()))
+    started = time.perf_counter()
+    workers = [threading.Thread(target=run, args=(records[i::threads],)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    server.audit_writer.close()
+    results.put({'kind': 'write', 'latencies': latencies, 'failures': sum(failures),
+                 'elapsed': elapsed})
+
+
+def reader(db_path, env, duration, start_at, results):
+    """Alternate listing pages and a full export until `duration` has passed"""
+    server = import_server(db_path, env)
+    client = server.app.test_client()
+    time.sleep(max(0.0, start_at - time.time()))
+    reads, failures, deadline = 0, 0, time.time() + duration
+    while time.time() < deadline:
+        for path in ('/api/submissions/tax-rate?limit=500',
+                     '/api/export/tax_rate_calculations?format=csv'):
+            response = client.get(path)
+            response.get_data()
+            reads += 1
+            failures += response.status_code != 200
+    results.put({'kind': 'read', 'rate': reads / duration, 'failures': failures})
+
+
+def seed_database(db_path, env, data):
+    server = import_server(db_path, env)
+    synthetic_data.load(server.app.test_client(), data)
+    server.audit_writer.close()
+
+
+def run_profile(name, env, data, args):
+    work_dir = tempfile.mkdtemp(prefix='tit-sqlite-bench-')
+    db_path = os.path.join(work_dir, 'bench.db')
+    ctx = multiprocessing.get_context('spawn')
+    try:
+        seeder = ctx.Process(target=seed_database, args=(db_path, env, {
+            'tax-rate-calculation': data['tax-rate-calculation']}))
+        seeder.start()
+        seeder.join()
+
+        records = data['tax-rate-calculation'][:args.writes]
+        results = ctx.Queue()
+        start_at = time.time() + 3  # let every process finish importing first
+        processes = [ctx.Process(target=writer, args=(db_path, env, records[i::args.writers],
+                                                      args.threads, start_at, results))
+                     for i in range(args.writers)]
+        processes += [ctx.Process(target=reader, args=(db_path, env, args.read_seconds, start_at, results))
+                      for _ in range(args.readers)]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    writes = [r for r in collected if r['kind'] == 'write']
+    latencies = sorted(l for r in writes for l in r['latencies'])
+    write_failures = sum(r['failures'] for r in writes)
+    elapsed = max(r['elapsed'] for r in writes)
+    reads = sum(r['rate'] for r in collected if r['kind'] == 'read')
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0
+    print(f"{name:<26} {len(latencies) / elapsed:>9.1f} {p95:>9.1f} "
+          f"{write_failures:>9} {reads:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--writers', type=int, default=4, help='writer processes')
+    parser.add_argument('--threads', type=int, default=4, help='threads per writer process')
+    parser.add_argument('--readers', type=int, default=2, help='reader processes')
+    parser.add_argument('--writes', type=int, default=2000, help='forms posted in total')
+    parser.add_argument('--read-seconds', type=float, default=5.0)
+    parser.add_argument('--profile', action='append', help='only run these profiles')
+    args = parser.parse_args()
+
+    data = synthetic_data.generate(units_per_county=4, years=(2024, 2025))
+    print(f"{args.writers} writer processes x {args.threads} threads, "
+          f"{args.readers} reader processes, {args.writes} writes\n")
+    print(f"{'profile':<26} {'writes/s':>9} {'p95 ms':>9} {'failed':>9} {'reads/s':>9}")
+    for name, env in PROFILES:
+        if not args.profile or name in args.profile:
+            run_profile(name, env, data, args)
+
+
+if __name__ == '__main__':
+    main()
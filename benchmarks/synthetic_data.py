@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Synthetic Truth-in-Taxation data for benchmarks
+
+Generates taxing units in all 254 Texas counties and, for each unit and tax
+year, the forms it would file: a tax rate calculation (rates computed with
+rate_engine), a public notice, a ballot when the proposed rate exceeds the
+voter-approval rate, school district forms for ISDs and water district forms
+for MUDs/WCIDs. Records use the JSON keys the save routes accept, so they can
+be loaded through the real batch endpoints.
+
+Usage: python benchmarks/synthetic_data.py [units_per_county] > data.ndjson
+"""
+
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notice_templates
+import rate_engine
+
+TEXAS_COUNTIES = (
+    'Anderson', 'Andrews', 'Angelina', 'Aransas', 'Archer', 'Armstrong', 'Atascosa',
+    'Austin', 'Bailey', 'Bandera', 'Bastrop', 'Baylor', 'Bee', 'Bell', 'Bexar', 'Blanco',
+    'Borden', 'Bosque', 'Bowie', 'Brazoria', 'Brazos', 'Brewster', 'Briscoe', 'Brooks',
+    'Brown', 'Burleson', 'Burnet', 'Caldwell', 'Calhoun', 'Callahan', 'Cameron', 'Camp',
+    'Carson', 'Cass', 'Castro', 'Chambers', 'Cherokee', 'Childress', 'Clay', 'Cochran',
+    'Coke', 'Coleman', 'Collin', 'Collingsworth', 'Colorado', 'Comal', 'Comanche',
+    'Concho', 'Cooke', 'Coryell', 'Cottle', 'Crane', 'Crockett', 'Crosby', 'Culberson',
+    'Dallam', 'Dallas', 'Dawson', 'Deaf Smith', 'Delta', 'Denton', 'DeWitt', 'Dickens',
+    'Dimmit', 'Donley', 'Duval', 'Eastland', 'Ector', 'Edwards', 'El Paso', 'Ellis',
+    'Erath', 'Falls', 'Fannin', 'Fayette', 'Fisher', 'Floyd', 'Foard', 'Fort Bend',
+    'Franklin', 'Freestone', 'Frio', 'Gaines', 'Galveston', 'Garza', 'Gillespie',
+    'Glasscock', 'Goliad', 'Gonzales', 'Gray', 'Grayson', 'Gregg', 'Grimes', 'Guadalupe',
+    'Hale', 'Hall', 'Hamilton', 'Hansford', 'Hardeman', 'Hardin', 'Harris', 'Harrison',
+    'Hartley', 'Haskell', 'Hays', 'Hemphill', 'Henderson', 'Hidalgo', 'Hill', 'Hockley',
+    'Hood', 'Hopkins', 'Houston', 'Howard', 'Hudspeth', 'Hunt', 'Hutchinson', 'Irion',
+    'Jack', 'Jackson', 'Jasper', 'Jeff Davis', 'Jefferson', 'Jim Hogg', 'Jim Wells',
+    'Johnson', 'Jones', 'Karnes', 'Kaufman', 'Kendall', 'Kenedy', 'Kent', 'Kerr',
+    'Kimble', 'King', 'Kinney', 'Kleberg', 'Knox', 'La Salle', 'Lamar', 'Lamb',
+    'Lampasas', 'Lavaca', 'Lee', 'Leon', 'Liberty', 'Limestone', 'Lipscomb', 'Live Oak',
+    'Llano', 'Loving', 'Lubbock', 'Lynn', 'Madison', 'Marion', 'Martin', 'Mason',
+    'Matagorda', 'Maverick', 'McCulloch', 'McLennan', 'McMullen', 'Medina', 'Menard',
+    'Midland', 'Milam', 'Mills', 'Mitchell', 'Montague', 'Montgomery', 'Moore', 'Morris',
+    'Motley', 'Nacogdoches', 'Navarro', 'Newton', 'Nolan', 'Nueces', 'Ochiltree',
+    'Oldham', 'Orange', 'Palo Pinto', 'Panola', 'Parker', 'Parmer', 'Pecos', 'Polk',
+    'Potter', 'Presidio', 'Rains', 'Randall', 'Reagan', 'Real', 'Red River', 'Reeves',
+    'Refugio', 'Roberts', 'Robertson', 'Rockwall', 'Runnels', 'Rusk', 'Sabine',
+    'San Augustine', 'San Jacinto', 'San Patricio', 'San Saba', 'Schleicher', 'Scurry',
+    'Shackelford', 'Shelby', 'Sherman', 'Smith', 'Somervell', 'Starr', 'Stephens',
+    'Sterling', 'Stonewall', 'Sutton', 'Swisher', 'Tarrant', 'Taylor', 'Terrell', 'Terry',
+    'Throckmorton', 'Titus', 'Tom Green', 'Travis', 'Trinity', 'Tyler', 'Upshur', 'Upton',
+    'Uvalde', 'Val Verde', 'Van Zandt', 'Victoria', 'Walker', 'Waller', 'Ward',
+    'Washington', 'Webb', 'Wharton', 'Wheeler', 'Wichita', 'Wilbarger', 'Willacy',
+    'Williamson', 'Wilson', 'Winkler', 'Wise', 'Wood', 'Yoakum', 'Young', 'Zapata', 'Zavala',
+)
+assert len(TEXAS_COUNTIES) == 254
+
+# (kind, name pattern, relative frequency, typical M&O rate range)
+UNIT_KINDS = (
+    ('county', '{county} County', 0, (0.25, 0.65)),
+    ('city', 'City of {place}', 4, (0.20, 0.75)),
+    ('isd', '{place} ISD', 3, (0.70, 0.95)),
+    ('mud', '{county} County MUD No. {n}', 4, (0.30, 1.00)),
+    ('wcid', '{county} County WCID No. {n}', 1, (0.20, 0.80)),
+    ('hospital', '{county} County Hospital District', 1, (0.05, 0.25)),
+    ('esd', '{county} County ESD No. {n}', 2, (0.03, 0.10)),
+)
+PLACE_SUFFIXES = ('', ' Springs', ' City', ' Creek', ' Hills', 'ville', ' Park', ' Grove')
+SCHOOL_FORMS = {'notice': '50-280', 'budget': '50-859'}
+WATER_FORMS = {'low': '50-874', 'developing': '50-858', 'developed': '50-860'}
+
+
+def taxing_units(rng, units_per_county):
+    """[(kind, name, county, mo_range)] with one county unit per county"""
+    weighted = [kind for kind in UNIT_KINDS for _ in range(kind[2])]
+    units = []
+    for county in TEXAS_COUNTIES:
+        kind = UNIT_KINDS[0]
+        units.append((kind[0], kind[1].format(county=county), county, kind[3]))
+        for n in range(1, units_per_county):
+            kind = rng.choice(weighted)
+            place = county.split()[0] + rng.choice(PLACE_SUFFIXES)
+            name = kind[1].format(county=county, place=place, n=n)
+            units.append((kind[0], name, county, kind[3]))
+    return units
+
+
+def tax_rate_record(rng, name, county, year, mo_range):
+    current = rng.lognormvariate(19, 1.6)
+    last_mo = rng.uniform(*mo_range)
+    last_debt = rng.choice((0.0, rng.uniform(0.02, 0.35)))
+    inputs = {
+        'lastYearLevy': round(current * (last_mo + last_debt) / 100 * rng.uniform(0.85, 1.0), 2),
+        'lastYearDebtRate': round(last_debt, 6),
+        'currentTotalValue': round(current, 2),
+        'newPropertyValue': round(current * rng.uniform(0, 0.08), 2),
+        'lostPropertyLevy': round(rng.uniform(0, 0.002) * current / 100, 2),
+        'proposedMORate': round(last_mo * rng.uniform(0.9, 1.1), 6),
+        'proposedDebtRate': round(last_debt * rng.uniform(0.9, 1.1), 6),
+        'isDisasterArea': rng.random() < 0.03,
+    }
+    record = {
+        'formType': 'disaster' if inputs['isDisasterArea'] else 'standard',
+        'taxingUnit': name,
+        'county': county,
+        'taxYear': str(year),
+        'lastYearMORate': round(last_mo, 6),
+        'totalDebt': round(current * rng.uniform(0, 0.04), 2),
+        'taxIncrements': round(rng.choice((0.0, rng.uniform(0, 50000))), 2),
+    }
+    record.update(inputs)
+    record.update(rate_engine.compute_unit_rates(inputs))
+    return record
+
+
+def notice_record(rng, name, calc, year):
+    """The notice the unit's rates call for, worded by notice_templates"""
+    source = {
+        'taxing_unit': name,
+        'tax_year': year,
+        'current_total_value': calc['currentTotalValue'],
+        'proposed_rate': calc['proposedRate'],
+        'no_new_revenue_rate': calc['noNewRevenueRate'],
+        'voter_approval_rate': calc['voterApprovalRate'],
+        'de_minimis_rate': calc['deMinimisRate'],
+    }
+    return notice_templates.notice_from_calculation(
+        source,
+        meeting_date=f'{year}-08-{rng.randint(10, 31):02d}',
+        meeting_time=rng.choice(('9:00 AM', '10:00 AM', '5:30 PM', '6:00 PM', '7:00 PM')),
+        meeting_location=f'{name} Administration Building, {rng.randint(100, 9999)} Main St',
+    )
+
+
+def ballot_record(rng, name, rate, year):
+    language = rng.choice(('english', 'english', 'spanish'))
+    return {
+        'ballotType': 'voter-approval',
+        'formNumber': '50-884',
+        'taxingUnit': name,
+        'proposedRate': rate,
+        'electionDate': f'{year}-11-0{rng.randint(2, 8)}',
+        'language': language,
+        'ballotText': (f'Approving the ad valorem tax rate of ${rate:.4f} per $100 valuation '
+                       f'in {name} for the current year.'),
+    }
+
+
+def school_record(rng, name, county, year):
+    mo = rng.uniform(0.6692, 0.8546)
+    debt = rng.choice((0.0, rng.uniform(0.05, 0.5)))
+    form_type = rng.choice(tuple(SCHOOL_FORMS))
+    return {
+        'formType': form_type,
+        'formNumber': SCHOOL_FORMS[form_type],
+        'schoolDistrict': name,
+        'county': county,
+        'taxYear': str(year),
+        'currentValue': round(rng.lognormvariate(20, 1.4), 2),
+        'moPortion': round(mo, 6),
+        'debtPortion': round(debt, 6),
+        'totalRate': round(mo + debt, 6),
+        'hasChapter313': rng.random() < 0.1,
+    }
+
+
+def water_record(rng, name, county, year, rate):
+    district_type = rng.choice(tuple(WATER_FORMS))
+    return {
+        'districtType': district_type,
+        'formNumber': WATER_FORMS[district_type],
+        'districtName': name,
+        'county': county,
+        'taxYear': str(year),
+        'proposedRate': rate,
+        'hearingDate': f'{year}-09-{rng.randint(1, 20):02d}',
+        'hearingTime': rng.choice(('10:00 AM', '6:00 PM', '7:00 PM')),
+        'hearingLocation': f'{name} Board Room',
+    }
+
+
+def generate(units_per_county=10, years=(2023, 2024, 2025), seed=2025):
+    """{save route: [records]} for every form category"""
+    rng = random.Random(seed)
+    data = {'tax-rate-calculation': [], 'public-notice': [], 'ballot-petition': [],
+            'school-district': [], 'water-district': []}
+    for kind, name, county, mo_range in taxing_units(rng, units_per_county):
+        for year in years:
+            calc = tax_rate_record(rng, name, county, year, mo_range)
+            data['tax-rate-calculation'].append(calc)
+            data['public-notice'].append(notice_record(rng, name, calc, year))
+            if calc['proposedRate'] > calc['voterApprovalRate']:
+                data['ballot-petition'].append(ballot_record(rng, name, calc['proposedRate'], year))
+            if kind == 'isd':
+                data['school-district'].append(school_record(rng, name, county, year))
+            elif kind in ('mud', 'wcid'):
+                data['water-district'].append(water_record(rng, name, county, year, calc['proposedRate']))
+    return data
+
+
+def load(client, data, batch_size=5000):
+    """POST every record through /api/<route>/batch; returns rows inserted"""
+    inserted = 0
+    for route, records in data.items():
+        for start in range(0, len(records), batch_size):
+            response = client.post(f'/api/{route}/batch', json=records[start:start + batch_size])
+            body = response.get_json()
+            if response.status_code != 201:
+                raise RuntimeError(f"loading {route} failed: {response.status_code} {body}")
+            inserted += body['inserted']
+    return inserted
+
+
+if __name__ == '__main__':
+    dataset = generate(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
+    for route, records in dataset.items():
+        for record in records:
+            print(json.dumps({'route': route, 'record': record}))
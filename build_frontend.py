@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Front-end build for the Truth-in-Taxation portal
+
+Precompiles the JSX in each page's <script type="text/babel"> block with
+esbuild, vendors React, ReactDOM and jsPDF from node_modules, and writes
+everything to dist/ with content-hashed filenames:
+
+    dist/truth-in-taxation-complete.html
+    dist/truth-in-taxation-edge.html
+    dist/assets/app-truth-in-taxation-complete.<hash>.js
+    dist/assets/react.production.min.<hash>.js
+    ...
+    dist/manifest.json
+
+Text assets also get .gz/.br sidecars (see compression.py). server.py serves
+the dist/ pages when they exist and marks dist/assets/ as immutable. The
+source pages keep working unbuilt (CDN + in-browser Babel).
+
+Usage:
+    npm install
+    python build_frontend.py
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import compression
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIST_DIR = os.path.join(BASE_DIR, 'dist')
+ASSET_URL = '/dist/assets/'
+
+PAGES = ('truth-in-taxation-complete.html', 'truth-in-taxation-edge.html')
+
+# Loaded in this order, replacing the CDN <script> tags (Babel is dropped)
+VENDOR_FILES = (
+    os.path.join('node_modules', 'react', 'umd', 'react.production.min.js'),
+    os.path.join('node_modules', 'react-dom', 'umd', 'react-dom.production.min.js'),
+    os.path.join('node_modules', 'jspdf', 'dist', 'jspdf.umd.min.js'),
+)
+
+CDN_SCRIPT = re.compile(r'[ \t]*<script src="https://cdnjs\.cloudflare\.com/[^"]+"></script>\n?')
+BABEL_BLOCK = re.compile(r'<script type="text/babel">(.*?)</script>', re.S)
+
+ESBUILD = os.path.join(BASE_DIR, 'node_modules', '.bin', 'esbuild')
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def write_asset(assets_dir, name, data):
+    """Write data as <stem>.<hash><ext>; returns the hashed filename"""
+    stem, ext = os.path.splitext(name)
+    filename = f'{stem}.{content_hash(data)}{ext}'
+    with open(os.path.join(assets_dir, filename), 'wb') as f:
+        f.write(data)
+    return filename
+
+
+def transpile(source):
+    """JSX -> minified ES2018 using esbuild"""
+    if not os.path.exists(ESBUILD):
+        raise SystemExit("esbuild not found; run `npm install` first")
+    result = subprocess.run(
+        [ESBUILD, '--loader=jsx', '--minify', '--target=es2018', '--charset=utf8'],
+        input=source.encode('utf-8'), capture_output=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr.decode('utf-8', 'replace'))
+    return result.stdout
+
+
+def build(out_dir=DIST_DIR, transpile=transpile, base_dir=BASE_DIR, vendor_files=VENDOR_FILES):
+    """Build every page into out_dir; returns the manifest"""
+    assets_dir = os.path.join(out_dir, 'assets')
+    # Hashed names change with content, so old assets are simply removed
+    shutil.rmtree(assets_dir, ignore_errors=True)
+    os.makedirs(assets_dir)
+
+    vendor = []
+    for path in vendor_files:
+        with open(os.path.join(base_dir, path), 'rb') as f:
+            vendor.append(write_asset(assets_dir, os.path.basename(path), f.read()))
+
+    manifest = {'vendor': vendor, 'pages': {}}
+    for page in PAGES:
+        with open(os.path.join(base_dir, page), encoding='utf-8') as f:
+            html = f.read()
+
+        match = BABEL_BLOCK.search(html)
+        if not match:
+            raise SystemExit(f"{page}: no <script type=\"text/babel\"> block found")
+        if not CDN_SCRIPT.search(html):
+            raise SystemExit(f"{page}: no CDN <script> tags to replace with the vendored files")
+        app_name = f'app-{os.path.splitext(page)[0]}.js'
+        app_js = write_asset(assets_dir, app_name, transpile(match.group(1)))
+
+        vendor_tags = ''.join(f'    <script src="{ASSET_URL}{name}"></script>\n'
+                              for name in vendor)
+        app_tag = f'<script src="{ASSET_URL}{app_js}"></script>'
+        html = html[:match.start()] + app_tag + html[match.end():]
+        first_cdn = CDN_SCRIPT.search(html)
+        html = CDN_SCRIPT.sub('', html)
+        html = html[:first_cdn.start()] + vendor_tags + html[first_cdn.start():]
+
+        with open(os.path.join(out_dir, page), 'w', encoding='utf-8') as f:
+            f.write(html)
+        manifest['pages'][page] = {'app': app_js}
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # .gz/.br sidecars so the server never compresses static files per request
+    manifest['precompressed'] = len(compression.precompress_tree(out_dir))
+    return manifest
+
+
+if __name__ == '__main__':
+    result = build()
+    for page, entry in result['pages'].items():
+        print(f"{page} -> dist/{page} ({entry['app']})")
+    print(f"vendored: {', '.join(result['vendor'])}")
+    print(f"precompressed sidecars: {result['precompressed']}")
@@ -0,0 +1,160 @@
+"""
+Bulk ingest helpers for the Truth-in-Taxation API server
+
+Validation works on the FORM_SPECS entries defined in server.py; inserts use
+one multi-row statement per chunk (executemany on SQLite, execute_values on
+PostgreSQL, multi-row VALUES on SQL Server) and return the new ids in input
+order.
+"""
+
+import json
+
+try:
+    import psycopg2.extras
+    HAS_PSYCOPG2 = True
+except ImportError:
+    HAS_PSYCOPG2 = False
+
+# SQL Server allows at most 2100 parameters and 1000 rows per VALUES list
+SQLSERVER_MAX_PARAMS = 2100
+SQLSERVER_MAX_ROWS = 1000
+
+
+class BatchFormatError(ValueError):
+    """The request body is not a JSON array or NDJSON document"""
+
+
+def parse_batch(body, content_type):
+    """Decode a JSON array (or {"records": [...]}) or NDJSON body
+
+    Returns a list whose items are either records or BatchFormatError
+    instances for NDJSON lines that could not be parsed.
+    """
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        records = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                records.append(BatchFormatError(f"line {number}: {e}"))
+        return records
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise BatchFormatError(f"Invalid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get('records')
+    if not isinstance(data, list):
+        raise BatchFormatError("Body must be a JSON array, {\"records\": [...]} or NDJSON")
+    return data
+
+
+def _coerce(spec, values):
+    """Normalize the numeric and boolean fields present in `values`; returns an error or None"""
+    for key in spec['numeric']:
+        if key not in values:
+            continue
+        value = values[key]
+        if value is None or value == '':
+            values[key] = None
+        elif isinstance(value, bool):
+            return f"{key} must be a number"
+        elif isinstance(value, (int, float)):
+            continue
+        else:
+            try:
+                values[key] = float(value)
+            except (TypeError, ValueError):
+                return f"{key} must be a number"
+    for key in spec['boolean']:
+        value = values.get(key)
+        if value in (None, True, False):
+            continue
+        if value in (0, 1):
+            values[key] = bool(value)
+        else:
+            return f"{key} must be true or false"
+    return None
+
+
+def validate_record(spec, record):
+    """Return (params, None) for a valid record or (None, error message)"""
+    if not isinstance(record, dict):
+        return None, "record must be a JSON object"
+
+    missing = [key for key in spec['required'] if record.get(key) in (None, '')]
+    if missing:
+        return None, f"missing required field(s): {', '.join(missing)}"
+
+    values = {key: record.get(key) for key, _ in spec['fields']}
+    error = _coerce(spec, values)
+    if error:
+        return None, error
+
+    return tuple(values[key] for key, _ in spec['fields']), None
+
+
+def validate_patch(spec, patch, read_only=()):
+    """Return ({column: value}, None) for a valid partial update or (None, error message)"""
+    if not isinstance(patch, dict) or not patch:
+        return None, "Body must be a JSON object of the fields to change"
+
+    columns = dict(spec['fields'])
+    unknown = [key for key in patch if key not in columns]
+    if unknown:
+        return None, f"Unknown field(s): {', '.join(unknown)}"
+    computed = [key for key in patch if key in read_only]
+    if computed:
+        return None, f"{', '.join(computed)} cannot be set; they are computed from the inputs"
+    cleared = [key for key in spec['required'] if key in patch and patch[key] in (None, '')]
+    if cleared:
+        return None, f"required field(s) cannot be empty: {', '.join(cleared)}"
+
+    values = dict(patch)
+    error = _coerce(spec, values)
+    if error:
+        return None, error
+
+    return {columns[key]: value for key, value in values.items()}, None
+
+
+def chunk_size(db_mode, columns, requested):
+    """Rows per statement/transaction for this dialect"""
+    if db_mode == 'sqlserver':
+        return max(1, min(requested, SQLSERVER_MAX_ROWS, (SQLSERVER_MAX_PARAMS - 1) // len(columns)))
+    return requested
+
+
+def insert_many(cursor, db_mode, table, columns, rows, returning=True):
+    """Insert rows with one round trip; return their new ids when `returning`"""
+    column_sql = ', '.join(columns)
+    row_sql = '(' + ', '.join('?' for _ in columns) + ')'
+
+    if db_mode == 'postgres':
+        sql = f'INSERT INTO {table} ({column_sql}) VALUES %s'
+        if returning:
+            sql += ' RETURNING id'
+        result = psycopg2.extras.execute_values(
+            cursor, sql, rows, page_size=len(rows), fetch=returning)
+        return [r[0] for r in result] if returning else None
+
+    if db_mode == 'sqlserver':
+        output = ' OUTPUT INSERTED.id' if returning else ''
+        sql = f"INSERT INTO {table} ({column_sql}){output} VALUES {', '.join(row_sql for _ in rows)}"
+        cursor.execute(sql, [value for row in rows for value in row])
+        if not returning:
+            return None
+        # OUTPUT order is not guaranteed; identities are assigned in VALUES order
+        return sorted(r[0] for r in cursor.fetchall())
+
+    cursor.executemany(f'INSERT INTO {table} ({column_sql}) VALUES {row_sql}', rows)
+    if not returning:
+        return None
+    # AUTOINCREMENT ids within one write transaction are consecutive
+    cursor.execute('SELECT last_insert_rowid()')
+    last_id = cursor.fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
@@ -0,0 +1,150 @@
+"""
+Response compression for the Truth-in-Taxation API server
+
+- negotiate_encoding() picks br or gzip from an Accept-Encoding header
+- compress_response() compresses large JSON/text responses in after_request
+- precompress_tree() writes .gz/.br sidecars for static files once, at build
+  time, so serve_static can send them without compressing per request
+
+Brotli is optional: without the `brotli` package only gzip is offered.
+"""
+
+import gzip
+import os
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+# Preferred first
+SUPPORTED_ENCODINGS = ('br', 'gzip') if HAS_BROTLI else ('gzip',)
+SIDECAR_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/x-ndjson',
+    'image/svg+xml', 'text/html', 'text/css', 'text/csv', 'text/plain',
+    'text/javascript',
+}
+STATIC_EXTENSIONS = ('.html', '.js', '.css', '.json', '.svg', '.txt', '.map')
+
+
+def negotiate_encoding(accept_encoding, available=SUPPORTED_ENCODINGS):
+    """Best encoding in `available` the client accepts (q > 0), or None"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        pieces = part.strip().split(';')
+        name = pieces[0].strip().lower()
+        q = 1.0
+        for param in pieces[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name] = q
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if level is None else level)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def add_vary(response, header='Accept-Encoding'):
+    vary = [v.strip() for v in response.headers.get('Vary', '').split(',') if v.strip()]
+    if header not in vary:
+        vary.append(header)
+        response.headers['Vary'] = ', '.join(vary)
+
+
+def compress_response(response, accept_encoding, min_size=1024):
+    """Compress a buffered Flask response in place when worthwhile"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    add_vary(response)
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Each encoding is a different representation, so it gets its own ETag
+    etag = response.headers.get('ETag')
+    if etag and etag.endswith('"'):
+        response.headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    return response
+
+
+def strip_etag_encoding(etag):
+    """Undo the -br/-gzip suffix compress_response adds to an ETag"""
+    for encoding in SIDECAR_EXTENSIONS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def find_sidecar(path, accept_encoding):
+    """(sidecar path, encoding) for the best fresh precompressed copy of path"""
+    available = [e for e in SUPPORTED_ENCODINGS
+                 if _is_fresh(path + SIDECAR_EXTENSIONS[e], path)]
+    encoding = negotiate_encoding(accept_encoding, available)
+    if encoding is None:
+        return None, None
+    return path + SIDECAR_EXTENSIONS[encoding], encoding
+
+
+def _is_fresh(sidecar, path):
+    try:
+        return os.path.getmtime(sidecar) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def precompress_file(path):
+    """Write path.gz (and path.br) at maximum compression; returns sidecars written"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    for encoding in SUPPORTED_ENCODINGS:
+        level = 11 if encoding == 'br' else 9
+        compressed = compress(data, encoding, level)
+        sidecar = path + SIDECAR_EXTENSIONS[encoding]
+        if len(compressed) >= len(data):
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+            continue
+        with open(sidecar, 'wb') as f:
+            f.write(compressed)
+        written.append(sidecar)
+    return written
+
+
+def precompress_tree(directory, min_size=1024):
+    """Precompress every static text file under directory"""
+    written = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(STATIC_EXTENSIONS) and os.path.getsize(path) >= min_size:
+                written.extend(precompress_file(path))
+    return written
@@ -0,0 +1,249 @@
+"""
+Database connection pool for the Truth-in-Taxation API server
+
+Works with any DB-API driver (psycopg2, pyodbc, sqlite3): the pool is given a
+zero-argument connect function and hands out PooledConnection proxies whose
+close() returns the connection to the pool instead of closing it.
+"""
+
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class PooledConnection:
+    """Proxy around a driver connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            raise RuntimeError("Connection has already been returned to the pool")
+        return self._raw
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        if self._raw is not None:
+            self._pool.release(self)
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class ConnectionPool:
+    """Thread-safe, fork-aware pool of DB-API connections
+
+    - min_size connections are opened the first time a process uses the pool
+    - at most max_size connections exist at once; acquire() waits up to
+      `timeout` seconds for one to be released
+    - connections older than max_lifetime seconds are recycled
+    - a connection idle for more than ping_interval seconds is health-checked
+      with `ping` before it is handed out
+    - after os.fork() the child discards the parent's connections without
+      closing them, so each gunicorn worker builds its own pool
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, max_lifetime=1800,
+                 timeout=30, ping_interval=10, ping=None, name='primary'):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._ping = ping or _default_ping
+        self.name = name
+        self._reset_state()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_state)
+
+    def _reset_state(self):
+        # Connections inherited from a parent process share its sockets, so
+        # they are dropped rather than closed.
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._size = 0
+        self._warmed = False
+        self._counters = {
+            'acquired': 0, 'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0,
+            'created': 0, 'recycled': 0, 'failed_checks': 0, 'discarded': 0,
+        }
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _open(self):
+        raw = self._connect()
+        with self._cond:
+            self._counters['created'] += 1
+        return PooledConnection(self, raw)
+
+    def _close_raw(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn, reason):
+        raw, conn._raw = conn._raw, None
+        if raw is not None:
+            self._close_raw(raw)
+        with self._cond:
+            self._size -= 1
+            self._counters[reason] += 1
+            self._cond.notify()
+
+    def _warm(self):
+        with self._cond:
+            if self._warmed:
+                return
+            self._warmed = True
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                continue
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def acquire(self):
+        """Check out a healthy connection, opening a new one if allowed"""
+        self._check_pid()
+        if not self._warmed:
+            self._warm()
+
+        deadline = None
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    now = time.monotonic()
+                    if deadline is None:
+                        deadline = now + self.timeout
+                        self._counters['waits'] += 1
+                        wait_started = now
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No database connection available in pool '{self.name}' "
+                            f"after {self.timeout}s (max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+                if deadline is not None:
+                    self._counters['wait_seconds'] += time.monotonic() - wait_started
+                    deadline = None
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    conn = None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                now = time.monotonic()
+                if self.max_lifetime and now - conn.created_at > self.max_lifetime:
+                    self._discard(conn, 'recycled')
+                    continue
+                if self.ping_interval is not None and now - conn.last_used > self.ping_interval:
+                    try:
+                        self._ping(conn._raw)
+                    except Exception:
+                        self._discard(conn, 'failed_checks')
+                        continue
+
+            with self._cond:
+                self._counters['acquired'] += 1
+            return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if conn._raw is None:
+            return
+        if self._pid != os.getpid():
+            conn._raw = None
+            return
+        try:
+            conn._raw.rollback()
+        except Exception:
+            self._discard(conn, 'discarded')
+            return
+        conn.last_used = time.monotonic()
+        pooled = PooledConnection(self, conn._raw)
+        pooled.created_at = conn.created_at
+        pooled.last_used = conn.last_used
+        # The caller's proxy is detached so a stale reference cannot reuse
+        # a connection that now belongs to someone else.
+        conn._raw = None
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones close on release"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._warmed = False
+        for conn in idle:
+            self._close_raw(conn._raw)
+            conn._raw = None
+
+    def stats(self):
+        """Snapshot of pool sizing and usage counters"""
+        with self._cond:
+            idle = len(self._idle)
+            data = {
+                'name': self.name,
+                'pid': self._pid,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'max_lifetime': self.max_lifetime,
+                'timeout': self.timeout,
+            }
+            data.update(self._counters)
+        data['wait_seconds'] = round(data['wait_seconds'], 6)
+        return data
+
+
+def _default_ping(raw):
+    cursor = raw.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    # Close the implicit transaction some drivers open for the ping
+    raw.rollback()
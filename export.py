@@ -0,0 +1,128 @@
+"""
+Streaming table export for the Truth-in-Taxation API server
+
+Rows are read through server-side cursors (psycopg2 named cursors, sqlite3 /
+pyodbc forward-only fetchmany) and encoded one at a time, so memory use stays
+flat no matter how large the table is.
+"""
+
+import csv
+import io
+import json
+import uuid
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+# Tables that may be exported, in the order the nightly job writes them
+EXPORT_TABLES = (
+    'tax_rate_calculations',
+    'public_notices',
+    'ballots_petitions',
+    'school_district_forms',
+    'water_district_forms',
+    'form_submissions_log',
+)
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+BATCH_SIZE = 2000
+CHUNK_SIZE = 64 * 1024
+
+
+def json_default(value):
+    """json.dumps fallback for driver types (datetime, Decimal, bytes)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', 'replace')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def iter_rows(conn, db_mode, sql, params=(), batch_size=BATCH_SIZE):
+    """Yield the column list, then each row as a tuple, using a server-side cursor"""
+    if db_mode == 'postgres':
+        cursor = conn.cursor(name=f'export_{uuid.uuid4().hex}')
+        cursor.itersize = batch_size
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchmany(batch_size)
+        yield [desc[0] for desc in cursor.description]
+        while rows:
+            for row in rows:
+                yield tuple(row)
+            rows = cursor.fetchmany(batch_size)
+    finally:
+        cursor.close()
+
+
+def encode_ndjson(rows):
+    """One JSON object per line"""
+    columns = next(rows)
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=json_default) + '\n'
+
+
+def encode_csv(rows):
+    """Header line, then one CSV line per row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(json_default(v) if isinstance(v, (datetime, date, Decimal)) else v
+                        for v in row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'csv': encode_csv,
+}
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    """Join small text pieces into ~size byte chunks"""
+    parts, length = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into a gzip stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_table(conn, db_mode, table_name, fmt='ndjson', gzip=False):
+    """Byte chunks of `table_name` encoded as NDJSON or CSV, optionally gzipped"""
+    if table_name not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table: {table_name}")
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown format: {fmt}")
+    rows = iter_rows(conn, db_mode, f'SELECT * FROM {table_name} ORDER BY id')
+    chunks = chunked(ENCODERS[fmt](rows))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def export_filename(table_name, fmt, gzip=False):
+    stamp = datetime.utcnow().strftime('%Y%m%d')
+    return f"{table_name}-{stamp}.{fmt}{'.gz' if gzip else ''}"
@@ -0,0 +1,134 @@
+"""
+Idempotency keys for the save endpoints
+
+A POST carrying an `Idempotency-Key` header is recorded in the
+idempotency_keys table (migration 8) in the same transaction as the rows it
+writes, together with the response it got. A retry with the same key finds
+that record and gets the original response back without writing anything,
+from any worker. A key reused with a different body is rejected.
+
+Clients that send no key can still be deduplicated by content: in 'content'
+mode the key is a hash of the route, client address and raw body, kept for a
+short window, so a double-clicked or resent form returns the first id.
+
+Keys are stored as truncated SHA-256 digests and expire after their TTL;
+expired rows are deleted at most once per purge interval by whichever
+request comes along.
+"""
+
+import hashlib
+import json
+import time
+
+TABLE = 'idempotency_keys'
+MAX_KEY_LENGTH = 255
+DIGEST_CHARS = 32  # 128 bits of SHA-256, as hex
+
+
+class IdempotencyError(ValueError):
+    """The Idempotency-Key header is unusable"""
+
+
+class KeyReused(IdempotencyError):
+    """The Idempotency-Key was already used for a different request body"""
+
+
+class RequestInProgress(Exception):
+    """A request with the same key has not finished yet"""
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()[:DIGEST_CHARS]
+
+
+class RequestKey:
+    """Where a request's response is recorded: key digest, body digest and expiry"""
+
+    def __init__(self, key_hash, request_hash, ttl, explicit):
+        self.key_hash = key_hash
+        self.request_hash = request_hash
+        self.ttl = ttl
+        self.explicit = explicit
+
+
+def request_key(route, header, body, remote_addr, key_ttl, dedup_mode, dedup_window):
+    """RequestKey for a save request, or None when it is not deduplicated"""
+    if header is not None:
+        header = header.strip()
+        if not header or len(header) > MAX_KEY_LENGTH:
+            raise IdempotencyError(f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+        return RequestKey(digest('key', route, header), digest(body), key_ttl, True)
+    if dedup_mode == 'content':
+        request_hash = digest(body)
+        return RequestKey(digest('content', route, remote_addr, request_hash), request_hash,
+                          dedup_window, False)
+    return None
+
+
+def lookup(cursor, marker, key, now=None):
+    """(status, body) recorded for the key; None when there is no live record
+
+    Raises KeyReused when an explicit key was used with another body and
+    RequestInProgress when the first request has not completed.
+    """
+    now = int(time.time()) if now is None else now
+    cursor.execute(f'SELECT request_hash, status_code, response FROM {TABLE} '
+                   f'WHERE key_hash = {marker} AND expires_at > {marker}', (key.key_hash, now))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    request_hash, status, response = row
+    if request_hash != key.request_hash:
+        if key.explicit:
+            raise KeyReused("Idempotency-Key was already used with a different request body")
+        return None
+    if status is None:
+        raise RequestInProgress()
+    return status, json.loads(response)
+
+
+def claim(cursor, marker, key, now=None):
+    """Insert the key's record (pending) in the caller's transaction
+
+    A concurrent request holding the same key makes the INSERT fail (or wait
+    for that request's transaction, then fail); callers then lookup() again.
+    """
+    now = int(time.time()) if now is None else now
+    cursor.execute(f'DELETE FROM {TABLE} WHERE key_hash = {marker} AND expires_at <= {marker}',
+                   (key.key_hash, now))
+    cursor.execute(f'INSERT INTO {TABLE} (key_hash, request_hash, expires_at) '
+                   f'VALUES ({marker}, {marker}, {marker})',
+                   (key.key_hash, key.request_hash, now + key.ttl))
+
+
+def complete(cursor, marker, key, status, body):
+    """Record the response of a claimed key"""
+    cursor.execute(f'UPDATE {TABLE} SET status_code = {marker}, response = {marker} '
+                   f'WHERE key_hash = {marker}',
+                   (status, json.dumps(body, separators=(',', ':')), key.key_hash))
+
+
+def release(cursor, marker, key):
+    """Forget a claimed key whose request failed, so the client can retry"""
+    cursor.execute(f'DELETE FROM {TABLE} WHERE key_hash = {marker} AND status_code IS NULL',
+                   (key.key_hash,))
+
+
+class Purger:
+    """Deletes expired keys at most once per `interval` seconds per process"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last = 0.0
+
+    def maybe_purge(self, cursor, marker):
+        now = time.time()
+        if now - self.last < self.interval:
+            return 0
+        self.last = now
+        cursor.execute(f'DELETE FROM {TABLE} WHERE expires_at <= {marker}', (int(now),))
+        return max(cursor.rowcount, 0)
@@ -0,0 +1,228 @@
+"""
+Request instrumentation for the Truth-in-Taxation API server
+
+Collects, per worker process:
+- request counts and latency histograms per route (the URL rule, not the
+  raw path, so label cardinality stays fixed)
+- time spent in each phase of a request: waiting for a pooled connection
+  (acquire), running queries (query), converting rows to dicts (rows) and
+  encoding JSON (json)
+- queries executed and rows returned per route
+
+render() produces the Prometheus text exposition format served at
+/api/metrics. Recording is a handful of perf_counter() calls and one short
+locked update per request, so it is cheap enough to leave on in production.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('acquire', 'query', 'rows', 'json')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum]
+        self._values = {}
+
+    def observe(self, labels, value):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        bucket_names = self.labelnames + ('le',)
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(bucket_names, labels + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class RequestTimings:
+    """Phase timings accumulated while one request is handled"""
+
+    __slots__ = ('started', 'phases', 'queries', 'rows', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.rows = 0
+        self.status = 500
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+
+class Metrics:
+    """The metric set recorded by server.py"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter('tit_http_requests_total', 'HTTP requests handled',
+                                ('method', 'route', 'status'))
+        self.latency = Histogram('tit_http_request_duration_seconds',
+                                 'Time from request start to response', ('method', 'route'))
+        self.phases = Histogram('tit_http_request_phase_seconds',
+                                'Time per request spent in each phase', ('route', 'phase'))
+        self.queries = Counter('tit_db_queries_total', 'Queries executed', ('route',))
+        self.rows = Counter('tit_db_rows_total', 'Rows fetched from the database', ('route',))
+        # prefix -> (collect, names of monotonically increasing stats)
+        self._collectors = {}
+
+    def record(self, method, route, timings):
+        elapsed = time.perf_counter() - timings.started
+        with self._lock:
+            self.requests.inc((method, route, str(timings.status)))
+            self.latency.observe((method, route), elapsed)
+            for phase, seconds in timings.phases.items():
+                if seconds:
+                    self.phases.observe((route, phase), seconds)
+            if timings.queries:
+                self.queries.inc((route,), timings.queries)
+                self.rows.inc((route,), timings.rows)
+
+    def add_collector(self, prefix, collect, counters=()):
+        """Export a stats() dict at scrape time as <prefix>_<key> metrics
+
+        Numeric values become gauges, except keys in `counters`.
+        """
+        self._collectors[prefix] = (collect, frozenset(counters))
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.latency, self.phases, self.queries, self.rows):
+                lines.extend(metric.render())
+        for prefix, (collect, counters) in sorted(self._collectors.items()):
+            for key, value in sorted(collect().items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f'{prefix}_{key}'
+                kind = 'counter' if key in counters else 'gauge'
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class TimedConnection:
+    """Connection proxy whose cursors report into a RequestTimings"""
+
+    def __init__(self, conn, timings):
+        self._conn = conn
+        self._timings = timings
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._timings)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class TimedCursor:
+    """Cursor proxy timing execute/fetch calls and counting fetched rows"""
+
+    __slots__ = ('_cursor', '_timings')
+
+    def __init__(self, cursor, timings):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_timings', timings)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._timings.phases['query'] += time.perf_counter() - started
+
+    def execute(self, *args):
+        self._timings.queries += 1
+        self._timed(self._cursor.execute, *args)
+        return self
+
+    def executemany(self, *args):
+        self._timings.queries += 1
+        self._timed(self._cursor.executemany, *args)
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._timings.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed(self._cursor.fetchmany, *args)
+        self._timings.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._timings.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value) if value == value else 'NaN'
+    return str(value)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
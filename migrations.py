@@ -0,0 +1,607 @@
+"""
+Versioned schema migrations for the Truth-in-Taxation database
+
+Each migration has a version number, a description and dialect-specific DDL
+for SQLite, PostgreSQL and SQL Server. Applied versions are recorded in the
+schema_version table, so a worker whose schema is current only runs one
+SELECT at startup. Migrations run under a database-level lock so several
+gunicorn workers starting together apply each migration exactly once.
+"""
+
+from audit_partitions import (ARCHIVED_STAT, CURRENT_TABLE, DEFAULT_PARTITION, LOG_TABLE,
+                              view_statements)
+
+SCHEMA_VERSION_DDL = {
+    'sqlite': '''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY, description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    'postgres': '''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    ''',
+    'sqlserver': '''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='schema_version' AND xtype='U')
+        CREATE TABLE schema_version (
+            version INT PRIMARY KEY, description NVARCHAR(255) NOT NULL,
+            applied_at DATETIME DEFAULT GETDATE()
+        )
+    '''
+}
+
+# Version 1: the tables init_db() used to create on every start
+INITIAL_SCHEMA = {
+    'sqlite': [
+        '''
+        CREATE TABLE IF NOT EXISTS tax_rate_calculations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            form_type TEXT NOT NULL, taxing_unit TEXT NOT NULL,
+            county TEXT, tax_year TEXT,
+            last_year_levy REAL, last_year_mo_rate REAL, last_year_debt_rate REAL,
+            current_total_value REAL, new_property_value REAL, lost_property_levy REAL,
+            proposed_mo_rate REAL, proposed_debt_rate REAL, total_debt REAL,
+            tax_increments REAL, is_disaster_area BOOLEAN,
+            no_new_revenue_rate REAL, voter_approval_rate REAL,
+            de_minimis_rate REAL, proposed_rate REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS public_notices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            notice_type TEXT NOT NULL, form_number TEXT,
+            taxing_unit TEXT NOT NULL, proposed_rate REAL,
+            no_new_revenue_rate REAL, voter_approval_rate REAL,
+            meeting_date TEXT, meeting_time TEXT,
+            meeting_location TEXT, notice_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ballots_petitions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ballot_type TEXT NOT NULL, form_number TEXT,
+            taxing_unit TEXT NOT NULL, proposed_rate REAL,
+            election_date TEXT, language TEXT, ballot_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS school_district_forms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            form_type TEXT NOT NULL, form_number TEXT,
+            school_district TEXT NOT NULL, county TEXT, tax_year TEXT,
+            current_value REAL, mo_portion REAL, debt_portion REAL,
+            total_rate REAL, has_chapter_313 BOOLEAN,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS water_district_forms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            district_type TEXT NOT NULL, form_number TEXT,
+            district_name TEXT NOT NULL, county TEXT, tax_year TEXT,
+            proposed_rate REAL, hearing_date TEXT, hearing_time TEXT,
+            hearing_location TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS form_submissions_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            form_category TEXT NOT NULL, form_id INTEGER,
+            action TEXT NOT NULL, user_info TEXT,
+            ip_address TEXT, submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        '''
+    ],
+    'postgres': [
+        '''
+        CREATE TABLE IF NOT EXISTS tax_rate_calculations (
+            id SERIAL PRIMARY KEY,
+            form_type VARCHAR(255) NOT NULL, taxing_unit VARCHAR(255) NOT NULL,
+            county VARCHAR(255), tax_year VARCHAR(50),
+            last_year_levy DOUBLE PRECISION, last_year_mo_rate DOUBLE PRECISION,
+            last_year_debt_rate DOUBLE PRECISION, current_total_value DOUBLE PRECISION,
+            new_property_value DOUBLE PRECISION, lost_property_levy DOUBLE PRECISION,
+            proposed_mo_rate DOUBLE PRECISION, proposed_debt_rate DOUBLE PRECISION,
+            total_debt DOUBLE PRECISION, tax_increments DOUBLE PRECISION,
+            is_disaster_area BOOLEAN,
+            no_new_revenue_rate DOUBLE PRECISION, voter_approval_rate DOUBLE PRECISION,
+            de_minimis_rate DOUBLE PRECISION, proposed_rate DOUBLE PRECISION,
+            created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS public_notices (
+            id SERIAL PRIMARY KEY,
+            notice_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
+            taxing_unit VARCHAR(255) NOT NULL, proposed_rate DOUBLE PRECISION,
+            no_new_revenue_rate DOUBLE PRECISION, voter_approval_rate DOUBLE PRECISION,
+            meeting_date VARCHAR(255), meeting_time VARCHAR(255),
+            meeting_location TEXT, notice_text TEXT,
+            created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ballots_petitions (
+            id SERIAL PRIMARY KEY,
+            ballot_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
+            taxing_unit VARCHAR(255) NOT NULL, proposed_rate DOUBLE PRECISION,
+            election_date VARCHAR(255), language VARCHAR(255), ballot_text TEXT,
+            created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS school_district_forms (
+            id SERIAL PRIMARY KEY,
+            form_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
+            school_district VARCHAR(255) NOT NULL, county VARCHAR(255), tax_year VARCHAR(50),
+            current_value DOUBLE PRECISION, mo_portion DOUBLE PRECISION,
+            debt_portion DOUBLE PRECISION, total_rate DOUBLE PRECISION,
+            has_chapter_313 BOOLEAN,
+            created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS water_district_forms (
+            id SERIAL PRIMARY KEY,
+            district_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
+            district_name VARCHAR(255) NOT NULL, county VARCHAR(255), tax_year VARCHAR(50),
+            proposed_rate DOUBLE PRECISION, hearing_date VARCHAR(255),
+            hearing_time VARCHAR(255), hearing_location TEXT,
+            created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS form_submissions_log (
+            id SERIAL PRIMARY KEY,
+            form_category VARCHAR(255) NOT NULL, form_id INTEGER,
+            action VARCHAR(255) NOT NULL, user_info TEXT,
+            ip_address VARCHAR(255), submitted_at TIMESTAMP DEFAULT NOW()
+        )
+        '''
+    ],
+    'sqlserver': [
+        '''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='tax_rate_calculations' AND xtype='U')
+        CREATE TABLE tax_rate_calculations (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            form_type NVARCHAR(255) NOT NULL, taxing_unit NVARCHAR(255) NOT NULL,
+            county NVARCHAR(255), tax_year NVARCHAR(50),
+            last_year_levy FLOAT, last_year_mo_rate FLOAT, last_year_debt_rate FLOAT,
+            current_total_value FLOAT, new_property_value FLOAT, lost_property_levy FLOAT,
+            proposed_mo_rate FLOAT, proposed_debt_rate FLOAT, total_debt FLOAT,
+            tax_increments FLOAT, is_disaster_area BIT,
+            no_new_revenue_rate FLOAT, voter_approval_rate FLOAT,
+            de_minimis_rate FLOAT, proposed_rate FLOAT,
+            created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
+        )
+        ''',
+        '''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='public_notices' AND xtype='U')
+        CREATE TABLE public_notices (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            notice_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
+            taxing_unit NVARCHAR(255) NOT NULL, proposed_rate FLOAT,
+            no_new_revenue_rate FLOAT, voter_approval_rate FLOAT,
+            meeting_date NVARCHAR(255), meeting_time NVARCHAR(255),
+            meeting_location NVARCHAR(MAX), notice_text NVARCHAR(MAX),
+            created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
+        )
+        ''',
+        '''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='ballots_petitions' AND xtype='U')
+        CREATE TABLE ballots_petitions (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            ballot_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
+            taxing_unit NVARCHAR(255) NOT NULL, proposed_rate FLOAT,
+            election_date NVARCHAR(255), language NVARCHAR(255), ballot_text NVARCHAR(MAX),
+            created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
+        )
+        ''',
+        '''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='school_district_forms' AND xtype='U')
+        CREATE TABLE school_district_forms (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            form_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
+            school_district NVARCHAR(255) NOT NULL, county NVARCHAR(255), tax_year NVARCHAR(50),
+            current_value FLOAT, mo_portion FLOAT, debt_portion FLOAT,
+            total_rate FLOAT, has_chapter_313 BIT,
+            created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
+        )
+        ''',
+        '''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='water_district_forms' AND xtype='U')
+        CREATE TABLE water_district_forms (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            district_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
+            district_name NVARCHAR(255) NOT NULL, county NVARCHAR(255), tax_year NVARCHAR(50),
+            proposed_rate FLOAT, hearing_date NVARCHAR(255), hearing_time NVARCHAR(255),
+            hearing_location NVARCHAR(MAX),
+            created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
+        )
+        ''',
+        '''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='form_submissions_log' AND xtype='U')
+        CREATE TABLE form_submissions_log (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            form_category NVARCHAR(255) NOT NULL, form_id INT,
+            action NVARCHAR(255) NOT NULL, user_info NVARCHAR(MAX),
+            ip_address NVARCHAR(255), submitted_at DATETIME DEFAULT GETDATE()
+        )
+        '''
+    ]
+}
+
+
+def create_index(name, table, columns):
+    """Idempotent CREATE INDEX for every dialect"""
+    column_sql = ', '.join(columns)
+    return {
+        'sqlite': f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_sql})',
+        'postgres': f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_sql})',
+        'sqlserver': (
+            f"IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = '{name}' "
+            f"AND object_id = OBJECT_ID('{table}')) "
+            f'CREATE INDEX {name} ON {table} ({column_sql})'
+        ),
+    }
+
+
+def by_dialect(*statements):
+    """Combine per-statement {dialect: sql} dicts into {dialect: [sql, ...]}"""
+    return {
+        dialect: [s[dialect] for s in statements if s.get(dialect)]
+        for dialect in ('sqlite', 'postgres', 'sqlserver')
+    }
+
+
+# Version 2: indexes for newest-first listing/keyset pagination, the
+# county/tax_year/taxing_unit filters and audit-log lookups by form
+SECONDARY_INDEXES = by_dialect(
+    create_index('idx_tax_rate_calculations_created', 'tax_rate_calculations', ['created_at', 'id']),
+    create_index('idx_public_notices_created', 'public_notices', ['created_at', 'id']),
+    create_index('idx_ballots_petitions_created', 'ballots_petitions', ['created_at', 'id']),
+    create_index('idx_school_district_forms_created', 'school_district_forms', ['created_at', 'id']),
+    create_index('idx_water_district_forms_created', 'water_district_forms', ['created_at', 'id']),
+    create_index('idx_tax_rate_calculations_county_year', 'tax_rate_calculations', ['county', 'tax_year']),
+    create_index('idx_school_district_forms_county_year', 'school_district_forms', ['county', 'tax_year']),
+    create_index('idx_water_district_forms_county_year', 'water_district_forms', ['county', 'tax_year']),
+    create_index('idx_tax_rate_calculations_unit', 'tax_rate_calculations', ['taxing_unit']),
+    create_index('idx_public_notices_unit', 'public_notices', ['taxing_unit']),
+    create_index('idx_ballots_petitions_unit', 'ballots_petitions', ['taxing_unit']),
+    create_index('idx_school_district_forms_unit', 'school_district_forms', ['school_district']),
+    create_index('idx_water_district_forms_unit', 'water_district_forms', ['district_name']),
+    create_index('idx_form_submissions_log_form', 'form_submissions_log', ['form_category', 'form_id']),
+)
+
+# Tables whose row counts are kept in table_stats
+COUNTED_TABLES = (
+    'tax_rate_calculations', 'public_notices', 'ballots_petitions',
+    'school_district_forms', 'water_district_forms', 'form_submissions_log',
+)
+
+
+def seed_row_counts():
+    return [
+        f"INSERT INTO table_stats (table_name, row_count) SELECT '{table}', COUNT(*) FROM {table}"
+        for table in COUNTED_TABLES
+    ]
+
+
+# Version 3: row counts maintained by the write paths, read by /api/stats
+TABLE_STATS = {
+    'sqlite': ['''
+        CREATE TABLE IF NOT EXISTS table_stats (
+            table_name TEXT PRIMARY KEY, row_count INTEGER NOT NULL DEFAULT 0
+        )
+    '''] + seed_row_counts(),
+    'postgres': ['''
+        CREATE TABLE IF NOT EXISTS table_stats (
+            table_name VARCHAR(255) PRIMARY KEY, row_count BIGINT NOT NULL DEFAULT 0
+        )
+    '''] + seed_row_counts(),
+    'sqlserver': ['''
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='table_stats' AND xtype='U')
+        CREATE TABLE table_stats (
+            table_name NVARCHAR(255) PRIMARY KEY, row_count BIGINT NOT NULL DEFAULT 0
+        )
+    '''] + seed_row_counts(),
+}
+
+# Version 4: per-table data version, bumped by every write; used to build
+# the ETags of cached GET responses
+TABLE_DATA_VERSION = {
+    'sqlite': ['ALTER TABLE table_stats ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0'],
+    'postgres': ['ALTER TABLE table_stats ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0'],
+    'sqlserver': [
+        "IF COL_LENGTH('table_stats', 'data_version') IS NULL "
+        "ALTER TABLE table_stats ADD data_version BIGINT NOT NULL DEFAULT 0"
+    ],
+}
+
+# Version 5: full-text search over notice/ballot wording and meeting and
+# hearing locations (queried by search.py). SQLite gets FTS5 external-content
+# tables kept in sync by triggers; Postgres a GIN index on a weighted
+# tsvector expression (first column weighted highest). SQL Server full-text
+# indexes cannot be created inside a transaction, so they are set up by
+# `flask search-index` instead; search falls back to LIKE until then.
+SEARCH_COLUMNS = {
+    'public_notices': ('notice_text', 'meeting_location'),
+    'ballots_petitions': ('ballot_text',),
+    'water_district_forms': ('hearing_location',),
+}
+
+
+def search_vector_sql(table):
+    """The Postgres tsvector expression indexed for `table`"""
+    weights = 'ABCD'
+    return ' || '.join(
+        f"setweight(to_tsvector('english', coalesce({column}, '')), '{weights[i]}')"
+        for i, column in enumerate(SEARCH_COLUMNS[table])
+    )
+
+
+def sqlite_fts_statements(table):
+    columns = SEARCH_COLUMNS[table]
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    delete_old = f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});"
+    insert_new = f"INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, "
+        f"content='{table}', content_rowid='id', tokenize='porter unicode61')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_list} ON {table} '
+        f'BEGIN {delete_old} {insert_new} END',
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+FULL_TEXT_SEARCH = {
+    'sqlite': [sql for table in SEARCH_COLUMNS for sql in sqlite_fts_statements(table)],
+    'postgres': [
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_search ON {table} USING GIN (({search_vector_sql(table)}))'
+        for table in SEARCH_COLUMNS
+    ],
+    'sqlserver': [],
+}
+
+# Version 6: running sums of tax_rate_calculations per county, tax year and
+# form type, maintained by the write paths (see rollups.py) and read by
+# /api/analytics. NULL county/tax_year are stored as '' to fit the key.
+ROLLUP_TABLE = 'tax_rate_rollups'
+ROLLUP_KEYS = ('county', 'tax_year', 'form_type')
+
+
+def _round6(expr, dialect):
+    # Postgres only rounds NUMERIC to a number of places
+    return f'ROUND(CAST({expr} AS NUMERIC), 6)' if dialect == 'postgres' else f'ROUND({expr}, 6)'
+
+
+def rollup_measures(dialect):
+    """(column, aggregate over tax_rate_calculations) for every running sum"""
+    def exceeds(rate):
+        return (f"SUM(CASE WHEN {_round6('proposed_rate', dialect)} > {_round6(rate, dialect)} "
+                f"THEN 1 ELSE 0 END)")
+    return [
+        ('unit_count', 'COUNT(*)'),
+        ('total_value', 'SUM(COALESCE(current_total_value, 0))'),
+        ('total_levy', 'SUM(COALESCE(current_total_value * proposed_rate / 100, 0))'),
+        ('last_year_levy', 'SUM(COALESCE(last_year_levy, 0))'),
+        ('proposed_rate_sum', 'SUM(COALESCE(proposed_rate, 0))'),
+        ('proposed_rate_count', 'COUNT(proposed_rate)'),
+        ('no_new_revenue_rate_sum', 'SUM(COALESCE(no_new_revenue_rate, 0))'),
+        ('no_new_revenue_rate_count', 'COUNT(no_new_revenue_rate)'),
+        ('voter_approval_rate_sum', 'SUM(COALESCE(voter_approval_rate, 0))'),
+        ('voter_approval_rate_count', 'COUNT(voter_approval_rate)'),
+        ('exceeds_no_new_revenue_count', exceeds('no_new_revenue_rate')),
+        ('exceeds_voter_approval_count', exceeds('voter_approval_rate')),
+    ]
+
+
+def rollup_rebuild(dialect):
+    """Statements that recompute tax_rate_rollups from tax_rate_calculations"""
+    measures = rollup_measures(dialect)
+    keys = "COALESCE(county, ''), COALESCE(tax_year, ''), form_type"
+    return [
+        f'DELETE FROM {ROLLUP_TABLE}',
+        f"INSERT INTO {ROLLUP_TABLE} ({', '.join(ROLLUP_KEYS)}, {', '.join(c for c, _ in measures)}) "
+        f"SELECT {keys}, {', '.join(sql for _, sql in measures)} "
+        f'FROM tax_rate_calculations GROUP BY {keys}',
+    ]
+
+
+def rollup_table_ddl(dialect):
+    text, year, form, count, total = {
+        'sqlite': ('TEXT', 'TEXT', 'TEXT', 'INTEGER', 'REAL'),
+        'postgres': ('VARCHAR(255)', 'VARCHAR(50)', 'VARCHAR(255)', 'BIGINT', 'DOUBLE PRECISION'),
+        # Keeps the primary key within SQL Server's 900-byte limit
+        'sqlserver': ('NVARCHAR(255)', 'NVARCHAR(50)', 'NVARCHAR(100)', 'BIGINT', 'FLOAT'),
+    }[dialect]
+    measures = ', '.join(f"{column} {count if column.endswith('_count') else total} NOT NULL DEFAULT 0"
+                         for column, _ in rollup_measures(dialect))
+    body = (f'{ROLLUP_TABLE} (county {text} NOT NULL, tax_year {year} NOT NULL, '
+            f'form_type {form} NOT NULL, {measures}, PRIMARY KEY (county, tax_year, form_type))')
+    if dialect == 'sqlserver':
+        return (f"IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='{ROLLUP_TABLE}' AND xtype='U') "
+                f'CREATE TABLE {body}')
+    return f'CREATE TABLE IF NOT EXISTS {body}'
+
+
+ROLLUPS = {
+    dialect: [rollup_table_ddl(dialect)] + rollup_rebuild(dialect)
+    for dialect in ('sqlite', 'postgres', 'sqlserver')
+}
+
+# Version 7: per-row version of the form tables, incremented by every PATCH
+# and used as the record's ETag for optimistic concurrency
+FORM_TABLES = COUNTED_TABLES[:5]
+
+ROW_VERSION = {
+    'sqlite': [f'ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1'
+               for table in FORM_TABLES],
+    'postgres': [f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 1'
+                 for table in FORM_TABLES],
+    'sqlserver': [f"IF COL_LENGTH('{table}', 'row_version') IS NULL "
+                  f"ALTER TABLE {table} ADD row_version INT NOT NULL DEFAULT 1"
+                  for table in FORM_TABLES],
+}
+
+# Version 8: Idempotency-Key records of the save endpoints (see
+# idempotency.py); expires_at is a Unix time
+IDEMPOTENCY_KEYS = by_dialect(
+    {
+        'sqlite': '''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key_hash TEXT PRIMARY KEY, request_hash TEXT NOT NULL,
+                status_code INTEGER, response TEXT, expires_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''',
+        'postgres': '''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key_hash CHAR(32) PRIMARY KEY, request_hash CHAR(32) NOT NULL,
+                status_code INTEGER, response TEXT, expires_at BIGINT NOT NULL
+            )
+        ''',
+        'sqlserver': '''
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='idempotency_keys' AND xtype='U')
+            CREATE TABLE idempotency_keys (
+                key_hash CHAR(32) PRIMARY KEY, request_hash CHAR(32) NOT NULL,
+                status_code INT, response NVARCHAR(MAX), expires_at BIGINT NOT NULL
+            )
+        ''',
+    },
+    create_index('idx_idempotency_keys_expires', 'idempotency_keys', ['expires_at']),
+)
+
+# Version 9: monthly partitions of the audit log (see audit_partitions.py).
+# Postgres rebuilds form_submissions_log as a table partitioned by
+# submitted_at, with a DEFAULT partition; the month partitions are created
+# by audit_partitions.ensure_partitions() at startup. SQLite and SQL Server
+# rename the table to form_submissions_log_current and put a view (with an
+# INSTEAD OF INSERT trigger) in its place. table_stats gains a count of the
+# rows moved to archive files.
+ARCHIVED_STAT_ROW = f"INSERT INTO table_stats (table_name, row_count) VALUES ('{ARCHIVED_STAT}', 0)"
+
+PARTITIONED_AUDIT_LOG = {
+    'sqlite': [
+        f'ALTER TABLE {LOG_TABLE} RENAME TO {CURRENT_TABLE}',
+        create_index(f'idx_{CURRENT_TABLE}_submitted', CURRENT_TABLE, ['submitted_at'])['sqlite'],
+    ] + view_statements('sqlite', []) + [ARCHIVED_STAT_ROW],
+    'postgres': [
+        f'ALTER TABLE {LOG_TABLE} RENAME TO {LOG_TABLE}_unpartitioned',
+        f'ALTER SEQUENCE {LOG_TABLE}_id_seq OWNED BY NONE',
+        f'''
+        CREATE TABLE {LOG_TABLE} (
+            id INTEGER NOT NULL DEFAULT nextval('{LOG_TABLE}_id_seq'),
+            form_category VARCHAR(255) NOT NULL, form_id INTEGER,
+            action VARCHAR(255) NOT NULL, user_info TEXT,
+            ip_address VARCHAR(255),
+            submitted_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'UTC'),
+            PRIMARY KEY (id, submitted_at)
+        ) PARTITION BY RANGE (submitted_at)
+        ''',
+        f'ALTER SEQUENCE {LOG_TABLE}_id_seq OWNED BY {LOG_TABLE}.id',
+        f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {LOG_TABLE} DEFAULT',
+        f'INSERT INTO {LOG_TABLE} SELECT id, form_category, form_id, action, user_info, ip_address, '
+        f"COALESCE(submitted_at, NOW() AT TIME ZONE 'UTC') FROM {LOG_TABLE}_unpartitioned",
+        f'DROP TABLE {LOG_TABLE}_unpartitioned',
+        create_index(f'idx_{LOG_TABLE}_form', LOG_TABLE, ['form_category', 'form_id'])['postgres'],
+        ARCHIVED_STAT_ROW,
+    ],
+    'sqlserver': [
+        f"IF OBJECT_ID('{CURRENT_TABLE}', 'U') IS NULL EXEC sp_rename '{LOG_TABLE}', '{CURRENT_TABLE}'",
+        create_index(f'idx_{CURRENT_TABLE}_submitted', CURRENT_TABLE, ['submitted_at'])['sqlserver'],
+    ] + view_statements('sqlserver', []) + [ARCHIVED_STAT_ROW],
+}
+
+# (version, description, {dialect: [statements]}) in order of application
+MIGRATIONS = [
+    (1, 'initial schema', INITIAL_SCHEMA),
+    (2, 'secondary indexes', SECONDARY_INDEXES),
+    (3, 'maintained row counts', TABLE_STATS),
+    (4, 'table data versions', TABLE_DATA_VERSION),
+    (5, 'full-text search', FULL_TEXT_SEARCH),
+    (6, 'tax rate rollups', ROLLUPS),
+    (7, 'row versions', ROW_VERSION),
+    (8, 'idempotency keys', IDEMPOTENCY_KEYS),
+    (9, 'partitioned audit log', PARTITIONED_AUDIT_LOG),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Highest applied version, or 0 when schema_version does not exist yet"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        return cursor.fetchone()[0] or 0
+    except Exception:
+        conn.rollback()
+        return 0
+
+
+def _lock(cursor, db_mode):
+    """Serialize migrations across processes for the rest of the transaction"""
+    if db_mode == 'postgres':
+        cursor.execute('SELECT pg_advisory_xact_lock(846537001)')
+    elif db_mode == 'sqlserver':
+        cursor.execute(
+            "EXEC sp_getapplock @Resource = 'schema_migrations', "
+            "@LockMode = 'Exclusive', @LockOwner = 'Transaction'"
+        )
+    else:
+        cursor.execute('BEGIN IMMEDIATE')
+
+
+def migrate(conn, db_mode, target=None):
+    """Apply pending migrations; returns the list of versions applied"""
+    target = LATEST_VERSION if target is None else target
+    if current_version(conn) >= target:
+        return []
+
+    placeholder = '%s' if db_mode == 'postgres' else '?'
+    cursor = conn.cursor()
+    applied = []
+    try:
+        _lock(cursor, db_mode)
+        cursor.execute(SCHEMA_VERSION_DDL[db_mode])
+        # Another worker may have migrated while we waited for the lock
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        version = cursor.fetchone()[0] or 0
+        for number, description, statements in MIGRATIONS:
+            if number <= version or number > target:
+                continue
+            for sql in statements[db_mode]:
+                cursor.execute(sql)
+            cursor.execute(
+                f'INSERT INTO schema_version (version, description) VALUES ({placeholder}, {placeholder})',
+                (number, description)
+            )
+            applied.append(number)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+def status(conn):
+    """[(version, description, applied)] for every known migration"""
+    version = current_version(conn)
+    return [(number, description, number <= version) for number, description, _ in MIGRATIONS]
@@ -0,0 +1,250 @@
+"""
+Server-side wording of the truth-in-taxation notices (Forms 50-873, 50-876,
+50-877, 50-883, 50-874 and 50-757)
+
+Each form's text is a Jinja2 template (Jinja2 ships with Flask). Every
+template is parsed and compiled to Python code once at import time, so
+rendering a notice is one function call over a small dict of rate data.
+That keeps generating tens of thousands of notices for a county and year
+cheap (see generate_notices() and benchmarks/bench_notices.py).
+
+Notice types use the ids of the portal's PublicNotices component.
+"""
+
+import re
+from datetime import date, datetime
+
+from jinja2 import DictLoader, Environment, StrictUndefined
+
+# notice type -> (form number, title)
+NOTICE_FORMS = {
+    'exceeds-both': ('50-873', 'NOTICE OF PUBLIC HEARING ON TAX INCREASE'),
+    'exceeds-nnr': ('50-876', 'NOTICE OF PUBLIC HEARING ON TAX INCREASE'),
+    'exceeds-va': ('50-877', 'NOTICE OF TAX RATE ELECTION'),
+    'exceeds-none': ('50-883', 'NOTICE OF MEETING TO VOTE ON TAX RATE'),
+    'de-minimis': ('50-874', 'NOTICE OF PUBLIC HEARING ON TAX INCREASE (DE MINIMIS RATE)'),
+    'small-city': ('50-757', 'NOTICE ABOUT TAX RATE OF SMALL TAXING UNIT'),
+}
+FORM_NOTICE_TYPES = {form: notice_type for notice_type, (form, _) in NOTICE_FORMS.items()}
+
+# Tax Code 26.052: units whose proposed levy is at most this may use the short notice
+SMALL_UNIT_LEVY = 500000
+
+TEMPLATES = {
+    'base': '''\
+{% block intro %}A tax rate of {{ proposed_rate|rate }} per $100 valuation has been proposed by the governing body of {{ unit }}.{% endblock %}
+
+{% if rates_table %}
+PROPOSED TAX RATE: {{ proposed_rate|rate }} per $100
+NO-NEW-REVENUE TAX RATE: {{ no_new_revenue_rate|rate }} per $100
+VOTER-APPROVAL TAX RATE: {{ voter_approval_rate|rate }} per $100
+{% if show_de_minimis %}DE MINIMIS RATE: {{ de_minimis_rate|rate }} per $100{% endif %}
+{% endif %}
+
+The no-new-revenue tax rate is the tax rate for the {{ year }} tax year that will raise the same amount of property tax revenue for {{ unit }} from the same properties in both the {{ year - 1 }} tax year and the {{ year }} tax year.
+
+The voter-approval tax rate is the highest tax rate that {{ unit }} may adopt without holding an election to seek voter approval of the rate.
+
+{% block comparison %}{% endblock %}
+
+{% block hearing %}A PUBLIC HEARING ON THE PROPOSED TAX RATE WILL BE HELD ON {{ hearing|upper }}.{% endblock %}
+
+{% block election %}{% endblock %}
+
+YOUR TAXES OWED UNDER ANY OF THE TAX RATES MENTIONED ABOVE CAN BE CALCULATED AS FOLLOWS:
+
+{{ formula }}
+''',
+    'increase': '''\
+The proposed tax rate is greater than the no-new-revenue tax rate. This means that {{ unit }} is proposing to increase property taxes for the {{ year }} tax year.''',
+    'election': '''\
+If {{ unit }} adopts the proposed tax rate, {{ unit }} is required to hold an election so that the voters may accept or reject the proposed tax rate. If a majority of the voters reject the proposed tax rate, the tax rate of {{ unit }} will be the voter-approval tax rate.''',
+    'no-election': '''\
+The proposed tax rate is not greater than the voter-approval tax rate. As a result, {{ unit }} is not required to hold an election at which voters may accept or reject the proposed tax rate. However, you may express your support for or opposition to the proposed tax rate by contacting the members of the governing body of {{ unit }} at their offices or by attending the public meeting mentioned above.''',
+    '50-873': '''\
+{% extends 'base' %}
+{% block comparison %}{% include 'increase' %}
+
+The proposed tax rate is also greater than the voter-approval tax rate.{% endblock %}
+{% block election %}{% include 'election' %}{% endblock %}''',
+    '50-876': '''\
+{% extends 'base' %}
+{% block comparison %}{% include 'increase' %}{% endblock %}
+{% block election %}{% include 'no-election' %}{% endblock %}''',
+    '50-877': '''\
+{% extends 'base' %}
+{% block comparison %}The proposed tax rate is not greater than the no-new-revenue tax rate, but it is greater than the voter-approval tax rate.{% endblock %}
+{% block election %}{% include 'election' %}{% endblock %}''',
+    '50-883': '''\
+{% extends 'base' %}
+{% block comparison %}The proposed tax rate does not exceed the no-new-revenue tax rate or the voter-approval tax rate.{% endblock %}
+{% block hearing %}The governing body of {{ unit }} will meet to vote on the proposed tax rate on {{ hearing }}.{% endblock %}
+{% block election %}{% include 'no-election' %}{% endblock %}''',
+    '50-874': '''\
+{% extends 'base' %}
+{% block comparison %}The de minimis rate is the rate equal to the sum of the no-new-revenue maintenance and operations rate, the rate that will raise $500,000, and the current debt rate for {{ unit }}.
+
+The proposed tax rate is greater than the voter-approval tax rate but not greater than the de minimis rate.{% endblock %}
+{% block election %}If {{ unit }} adopts the proposed tax rate, the qualified voters of {{ unit }} may petition {{ unit }} to require an election to be held to determine whether to reduce the proposed tax rate. If a majority of the voters reject the proposed tax rate, the tax rate of {{ unit }} will be the voter-approval tax rate.{% endblock %}''',
+    '50-757': '''\
+{% extends 'base' %}
+{% block intro %}{{ unit }}, a taxing unit with a proposed total tax levy of $500,000 or less{% if levy is not none %} ({{ levy|money }}){% endif %}, proposes to adopt a tax rate of {{ proposed_rate|rate }} per $100 valuation for the {{ year }} tax year.{% endblock %}
+{% block comparison %}{% if above_nnr %}{% include 'increase' %}{% else %}The proposed tax rate does not exceed the no-new-revenue tax rate.{% endif %}{% endblock %}
+{% block election %}{% if above_va %}{% include 'election' %}{% else %}{% include 'no-election' %}{% endif %}{% endblock %}''',
+}
+
+# Last line of every notice; marks notice_text that was generated from these templates
+TAX_FORMULA = 'Property tax amount = (tax rate) x (taxable value of your property) / 100'
+
+BLANK_LINES = re.compile(r'\n[ \t]*(?:\n[ \t]*)+')
+
+
+def format_rate(value):
+    return '$____' if value is None else f'${float(value):.6f}'
+
+
+def format_money(value):
+    return '$____' if value is None else f'${float(value):,.2f}'
+
+
+def long_date(value):
+    """'2025-08-20' -> 'August 20, 2025' (other text is returned unchanged)"""
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value[:10])
+        except ValueError:
+            return value
+    return f'{value:%B} {value.day}, {value.year}'
+
+
+environment = Environment(
+    loader=DictLoader(TEMPLATES),
+    undefined=StrictUndefined,
+    autoescape=False,  # plain text, not HTML
+    auto_reload=False,
+    keep_trailing_newline=False,
+)
+environment.filters.update(rate=format_rate, money=format_money)
+environment.globals['formula'] = TAX_FORMULA
+
+# Parsed and compiled once per process
+COMPILED = {form: environment.get_template(form) for form in FORM_NOTICE_TYPES}
+
+
+def notice_year(record):
+    """Tax year of a notice: tax_year, else the year of meeting_date or created_at"""
+    if record.get('tax_year'):
+        return int(record['tax_year'])
+    for key in ('meeting_date', 'created_at'):
+        value = record.get(key)
+        text = value.isoformat() if isinstance(value, (date, datetime)) else str(value or '')
+        if len(text) >= 4 and text[:4].isdigit():
+            return int(text[:4])
+    return date.today().year
+
+
+def _rate(record, key):
+    value = record.get(key)
+    return None if value is None or value == '' else round(float(value), 6)
+
+
+def proposed_levy(record):
+    value = record.get('current_total_value')
+    rate = _rate(record, 'proposed_rate')
+    if value is None or rate is None:
+        return None
+    return float(value) * rate / 100
+
+
+def classify(record):
+    """Notice type required by a unit's proposed rate against its calculated rates"""
+    proposed = _rate(record, 'proposed_rate')
+    nnr = _rate(record, 'no_new_revenue_rate')
+    va = _rate(record, 'voter_approval_rate')
+    de_minimis = _rate(record, 'de_minimis_rate')
+    if proposed is None or nnr is None or va is None:
+        raise ValueError("proposed, no-new-revenue and voter-approval rates are required")
+    levy = proposed_levy(record)
+    if levy is not None and levy <= SMALL_UNIT_LEVY and proposed > nnr:
+        return 'small-city'
+    if proposed > va and de_minimis is not None and proposed <= de_minimis:
+        return 'de-minimis'
+    if proposed > nnr and proposed > va:
+        return 'exceeds-both'
+    if proposed > nnr:
+        return 'exceeds-nnr'
+    if proposed > va:
+        return 'exceeds-va'
+    return 'exceeds-none'
+
+
+def notice_type_of(record):
+    """The record's notice type, falling back to its form number, then to its rates"""
+    if record.get('notice_type') in NOTICE_FORMS:
+        return record['notice_type']
+    if record.get('form_number') in FORM_NOTICE_TYPES:
+        return FORM_NOTICE_TYPES[record['form_number']]
+    return classify(record)
+
+
+def is_full_notice(text):
+    """True for notice_text produced by render_text() (not a short portal note)"""
+    return bool(text) and text.rstrip().endswith(TAX_FORMULA)
+
+
+def hearing_text(record):
+    when = ' at '.join(part for part in (long_date(record.get('meeting_date') or ''),
+                                         record.get('meeting_time')) if part)
+    place = record.get('meeting_location')
+    if when and place:
+        return f'{when} at {place}'
+    return when or (f'a date to be announced at {place}' if place else 'a date and place to be announced')
+
+
+def render_text(record, notice_type=None, rates_table=True):
+    """Notice wording for a notice or tax rate calculation row (snake_case keys)"""
+    notice_type = notice_type or notice_type_of(record)
+    form_number = NOTICE_FORMS[notice_type][0]
+    proposed, nnr, va = (_rate(record, key) for key in
+                         ('proposed_rate', 'no_new_revenue_rate', 'voter_approval_rate'))
+    context = {
+        'unit': record.get('taxing_unit') or '',
+        'year': notice_year(record),
+        'proposed_rate': proposed,
+        'no_new_revenue_rate': nnr,
+        'voter_approval_rate': va,
+        'above_nnr': None not in (proposed, nnr) and proposed > nnr,
+        'above_va': None not in (proposed, va) and proposed > va,
+        'de_minimis_rate': _rate(record, 'de_minimis_rate'),
+        'levy': proposed_levy(record),
+        'hearing': hearing_text(record),
+        'rates_table': rates_table,
+        'show_de_minimis': notice_type == 'de-minimis' and record.get('de_minimis_rate') is not None,
+    }
+    text = COMPILED[form_number].render(context)
+    return BLANK_LINES.sub('\n\n', text).strip()
+
+
+def notice_from_calculation(calc, meeting_date=None, meeting_time=None, meeting_location=None):
+    """A public-notice record (the /api/public-notice body) for a tax rate calculation row"""
+    record = dict(calc, meeting_date=meeting_date, meeting_time=meeting_time,
+                  meeting_location=meeting_location)
+    notice_type = classify(record)
+    return {
+        'noticeType': notice_type,
+        'formNumber': NOTICE_FORMS[notice_type][0],
+        'taxingUnit': calc.get('taxing_unit'),
+        'proposedRate': _rate(calc, 'proposed_rate'),
+        'noNewRevenueRate': _rate(calc, 'no_new_revenue_rate'),
+        'voterApprovalRate': _rate(calc, 'voter_approval_rate'),
+        'meetingDate': meeting_date,
+        'meetingTime': meeting_time,
+        'meetingLocation': meeting_location,
+        'noticeText': render_text(record, notice_type),
+    }
+
+
+def generate_notices(calculations, **hearing):
+    """Yield a public-notice record for each tax rate calculation row"""
+    for calc in calculations:
+        yield notice_from_calculation(calc, **hearing)
@@ -0,0 +1,186 @@
+"""
+Truth-in-Taxation rate engine
+
+Server-side port of the TaxRateCalculator formulas in
+truth-in-taxation-complete.html (calculateNoNewRevenue, calculateVoterApproval,
+calculateDeMinimisRate, calculateProposedRate). All rates are per $100 of
+taxable value.
+
+compute_rates() evaluates whole arrays of taxing units at once with NumPy;
+compute_unit_rates() is the one-unit reference used when NumPy is missing.
+"""
+
+import math
+import re
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Voter-approval multiplier on the no-new-revenue M&O rate
+VOTER_APPROVAL_MULTIPLIER = 1.035
+# Disaster-area taxing units may use 5% instead of 3.5%
+DISASTER_MULTIPLIER = 1.05
+DE_MINIMIS_MULTIPLIER = 1.08
+
+# Inputs, by the JSON keys the portal posts
+INPUT_FIELDS = (
+    'lastYearLevy', 'lastYearDebtRate', 'currentTotalValue', 'newPropertyValue',
+    'lostPropertyLevy', 'proposedMORate', 'proposedDebtRate', 'isDisasterArea',
+)
+# Outputs, by the JSON keys the portal posts
+RATE_FIELDS = ('noNewRevenueRate', 'voterApprovalRate', 'deMinimisRate', 'proposedRate')
+
+_NO_NEW_REVENUE_INPUTS = ('lastYearLevy', 'lostPropertyLevy', 'currentTotalValue', 'newPropertyValue')
+# Inputs each rate depends on
+RATE_INPUTS = {
+    'noNewRevenueRate': _NO_NEW_REVENUE_INPUTS,
+    'voterApprovalRate': _NO_NEW_REVENUE_INPUTS + ('proposedDebtRate', 'lastYearDebtRate', 'isDisasterArea'),
+    'deMinimisRate': _NO_NEW_REVENUE_INPUTS + ('proposedDebtRate', 'lastYearDebtRate'),
+    'proposedRate': ('proposedMORate', 'proposedDebtRate'),
+}
+
+
+# The longest numeric prefix JavaScript's parseFloat() accepts
+_FLOAT_PREFIX = re.compile(r'[+-]?(?:Infinity|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)')
+
+
+def _parse_float(value):
+    """JavaScript `parseFloat(value)` for JSON values, NaN when it gives NaN
+
+    Strings are read up to the first character that cannot continue a number
+    ("1,234" is 1, "12abc" is 12). parseFloat(true) is NaN, so booleans are
+    too; so are null, objects and arrays.
+    """
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return math.nan
+    match = _FLOAT_PREFIX.match(value.lstrip())
+    return float(match.group().replace('Infinity', 'inf')) if match else math.nan
+
+
+def _number(value):
+    """JavaScript `parseFloat(value) || 0`"""
+    number = _parse_float(value)
+    return 0.0 if math.isnan(number) else number
+
+
+def compute_unit_rates(unit):
+    """Rates for one taxing unit (dict keyed by INPUT_FIELDS)"""
+    last_levy = _number(unit.get('lastYearLevy'))
+    lost_levy = _number(unit.get('lostPropertyLevy'))
+    current_value = _number(unit.get('currentTotalValue'))
+    new_value = _number(unit.get('newPropertyValue'))
+
+    taxable = current_value - new_value
+    no_new_revenue = (last_levy - lost_levy) / taxable * 100 if taxable > 0 else 0.0
+
+    # The portal falls back to last year's debt rate when none is proposed
+    debt_rate = _number(unit.get('proposedDebtRate')) or _number(unit.get('lastYearDebtRate'))
+    multiplier = DISASTER_MULTIPLIER if unit.get('isDisasterArea') else VOTER_APPROVAL_MULTIPLIER
+
+    return {
+        'noNewRevenueRate': no_new_revenue,
+        'voterApprovalRate': no_new_revenue * multiplier + debt_rate,
+        'deMinimisRate': no_new_revenue * DE_MINIMIS_MULTIPLIER + debt_rate,
+        'proposedRate': _number(unit.get('proposedMORate')) + _number(unit.get('proposedDebtRate')),
+    }
+
+
+def input_changed(key, old, new):
+    """True when an input edit changes what the formulas see"""
+    if key == 'isDisasterArea':
+        return bool(old) != bool(new)
+    return _number(old) != _number(new)
+
+
+def rates_affected_by(changed):
+    """The RATE_FIELDS that depend on any of the `changed` inputs"""
+    return [rate for rate in RATE_FIELDS if any(key in changed for key in RATE_INPUTS[rate])]
+
+
+def compute_rates_loop(units):
+    """Pure-Python rates for a list of units (reference implementation)"""
+    return [compute_unit_rates(unit) for unit in units]
+
+
+def _column(columns, key, n):
+    values = columns.get(key)
+    if values is None:
+        return np.zeros(n)
+    # parseFloat(value) || 0: NaN becomes 0, but Infinity stays infinite
+    return np.nan_to_num(np.asarray(values, dtype=float), nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+
+def _to_array(key, values):
+    """Input column as a NumPy array; values parseFloat() rejects become NaN"""
+    if key == 'isDisasterArea':
+        return np.array([bool(v) for v in values], dtype=bool)
+    if all(v is None or type(v) in (int, float) for v in values):
+        return np.array(values, dtype=float)
+    return np.array([_parse_float(v) for v in values], dtype=float)
+
+
+def to_columns(units):
+    """Turn a list of unit dicts into {field: array}"""
+    return {key: _to_array(key, [unit.get(key) for unit in units]) for key in INPUT_FIELDS}
+
+
+def compute_rates(columns):
+    """Vectorized rates for many units
+
+    `columns` maps INPUT_FIELDS to equal-length arrays (missing fields are
+    treated as 0 / False). Returns {rate field: float64 array}.
+    """
+    n = max((len(v) for v in columns.values() if v is not None), default=0)
+    last_levy = _column(columns, 'lastYearLevy', n)
+    lost_levy = _column(columns, 'lostPropertyLevy', n)
+    current_value = _column(columns, 'currentTotalValue', n)
+    new_value = _column(columns, 'newPropertyValue', n)
+    proposed_mo = _column(columns, 'proposedMORate', n)
+    proposed_debt = _column(columns, 'proposedDebtRate', n)
+    last_debt = _column(columns, 'lastYearDebtRate', n)
+    disaster = columns.get('isDisasterArea')
+    disaster = np.zeros(n, dtype=bool) if disaster is None else np.asarray(disaster, dtype=bool)
+
+    taxable = current_value - new_value
+    positive = taxable > 0
+    no_new_revenue = np.zeros(n)
+    np.divide(last_levy - lost_levy, taxable, out=no_new_revenue, where=positive)
+    no_new_revenue *= 100
+
+    debt_rate = np.where(proposed_debt != 0, proposed_debt, last_debt)
+    multiplier = np.where(disaster, DISASTER_MULTIPLIER, VOTER_APPROVAL_MULTIPLIER)
+
+    return {
+        'noNewRevenueRate': no_new_revenue,
+        'voterApprovalRate': no_new_revenue * multiplier + debt_rate,
+        'deMinimisRate': no_new_revenue * DE_MINIMIS_MULTIPLIER + debt_rate,
+        'proposedRate': proposed_mo + proposed_debt,
+    }
+
+
+def compute_batch(units):
+    """Rates for a list of unit dicts, as a list of dicts in input order"""
+    if not HAS_NUMPY:
+        return compute_rates_loop(units)
+    rates = compute_rates(to_columns(units))
+    lists = [rates[key].tolist() for key in RATE_FIELDS]
+    return [dict(zip(RATE_FIELDS, values)) for values in zip(*lists)]
+
+
+def compute_columnar(columns):
+    """Rates for columnar input ({field: [values]}), as {rate field: [values]}"""
+    if len({len(v) for v in columns.values()}) > 1:
+        raise ValueError("All columns must have the same length")
+    if not HAS_NUMPY:
+        n = len(next(iter(columns.values()), []))
+        rows = compute_rates_loop([{k: v[i] for k, v in columns.items()} for i in range(n)])
+        return {key: [row[key] for row in rows] for key in RATE_FIELDS}
+    rates = compute_rates({key: _to_array(key, columns[key]) for key in INPUT_FIELDS if key in columns})
+    return {key: rates[key].tolist() for key in RATE_FIELDS}
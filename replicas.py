@@ -0,0 +1,142 @@
+"""
+Read-replica routing for the Truth-in-Taxation API server
+
+A ReplicaRouter holds one ConnectionPool per replica and hands read-only
+routes a connection from the next healthy replica, round robin. A replica
+is skipped for `retry_interval` seconds after it fails to connect (or its
+health check fails), and while its replication lag exceeds `max_lag`; the
+lag is measured on a connection about to be used, at most once per
+`check_interval` seconds per replica. When every replica is skipped,
+acquire() returns None and the caller reads from the primary.
+
+Writes always use the primary. So that a client sees its own writes, the
+server marks it sticky to the primary for a few seconds after each write
+(see server.reads_from_primary).
+"""
+
+import itertools
+import threading
+import time
+
+from db_pool import PoolTimeout
+
+# Seconds the replica is behind its primary; None when it cannot tell
+LAG_SQL = {
+    'postgres': (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() "
+        "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    ),
+    'sqlserver': (
+        "SELECT MAX(secondary_lag_seconds) FROM sys.dm_hadr_database_replica_states "
+        "WHERE is_local = 1"
+    ),
+}
+
+
+def parse_replica_urls(raw, separator=','):
+    """Replica DSNs from an environment variable (blank entries dropped)"""
+    return [url.strip() for url in (raw or '').split(separator) if url.strip()]
+
+
+class Replica:
+    """One replica's pool and health"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.down_until = 0.0
+        self.lag_checked_at = float('-inf')
+        self.lag = None
+        self.last_error = None
+        self.reads = 0
+        self.failures = 0
+
+    @property
+    def name(self):
+        return self.pool.name
+
+
+class ReplicaRouter:
+    """Round-robin reads over healthy replicas with failover to the primary"""
+
+    def __init__(self, pools, lag_sql=None, max_lag=30.0, retry_interval=10.0, check_interval=5.0):
+        self.replicas = [Replica(pool) for pool in pools]
+        self.lag_sql = lag_sql
+        self.max_lag = max_lag
+        self.retry_interval = retry_interval
+        self.check_interval = check_interval
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+
+    def candidates(self, preferred=None, now=None):
+        """Healthy replicas, `preferred` first, then round robin from the next one"""
+        now = time.monotonic() if now is None else now
+        start = next(self._next) % len(self.replicas)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        if preferred in ordered:
+            ordered.remove(preferred)
+            ordered.insert(0, preferred)
+        return [replica for replica in ordered if replica.down_until <= now]
+
+    def mark_down(self, replica, error, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            replica.down_until = now + self.retry_interval
+            replica.last_error = str(error)
+            replica.failures += 1
+
+    def _lagging(self, replica, conn, now):
+        """True when the replica is too far behind; raises if the check query fails"""
+        if self.lag_sql is None or now - replica.lag_checked_at < self.check_interval:
+            return False
+        cursor = conn.cursor()
+        cursor.execute(self.lag_sql)
+        row = cursor.fetchone()
+        replica.lag = None if row is None or row[0] is None else float(row[0])
+        replica.lag_checked_at = now
+        return replica.lag is not None and replica.lag > self.max_lag
+
+    def acquire(self, preferred=None):
+        """(replica, connection) from the first healthy replica, or (None, None)"""
+        now = time.monotonic()
+        for replica in self.candidates(preferred, now):
+            try:
+                conn = replica.pool.acquire()
+            except PoolTimeout:
+                continue  # busy, not broken
+            except Exception as e:
+                self.mark_down(replica, e, now)
+                continue
+            try:
+                lagging = self._lagging(replica, conn, now)
+            except Exception as e:
+                conn.close()
+                self.mark_down(replica, e, now)
+                continue
+            if lagging:
+                conn.close()
+                self.mark_down(replica, f"replication lag {replica.lag:.1f}s exceeds {self.max_lag}s", now)
+                continue
+            with self._lock:
+                replica.reads += 1
+            return replica, conn
+        with self._lock:
+            self.fallbacks += 1
+        return None, None
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'fallbacks': self.fallbacks,
+                'replicas': [{
+                    'name': replica.name,
+                    'healthy': replica.down_until <= now,
+                    'reads': replica.reads,
+                    'failures': replica.failures,
+                    'lag_seconds': replica.lag,
+                    'last_error': replica.last_error,
+                    'pool': replica.pool.stats(),
+                } for replica in self.replicas],
+            }
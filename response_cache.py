@@ -0,0 +1,107 @@
+"""
+In-process response cache with version-stamped strong ETags
+
+Each cached GET response depends on a set of tables. Every write bumps the
+table's data_version in table_stats (in the same transaction), so an ETag
+derived from the route, query string and the current versions of those tables
+changes exactly when the underlying data does. Because the ETag is computed
+from the versions rather than from the body, any gunicorn worker can answer
+If-None-Match with 304 after reading only the version row(s).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from compression import strip_etag_encoding
+
+
+class CachedResponse:
+    __slots__ = ('etag', 'body', 'status', 'mimetype')
+
+    def __init__(self, etag, body, status, mimetype):
+        self.etag = etag
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+
+
+class ResponseCache:
+    """LRU cache bounded by entry count and total body bytes"""
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.not_modified = self.evictions = 0
+
+    def get(self, key, etag):
+        """Cached response for `key` if it was stored under `etag`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.etag != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.evictions += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+            }
+
+
+def make_etag(key, versions):
+    """Strong ETag for a cache key and {table: data_version}"""
+    stamp = ';'.join(f'{table}={versions.get(table, 0)}' for table in sorted(versions))
+    digest = hashlib.sha1(f'{key}|{stamp}'.encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(header, etag):
+    """True if an If-None-Match header value lists `etag` (or is *)"""
+    if not header:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        # A compressed representation's ETag carries an encoding suffix
+        if candidate == '*' or strip_etag_encoding(candidate) == etag:
+            return True
+    return False
@@ -0,0 +1,169 @@
+"""
+County, tax year and form type rollups of tax rate calculations
+
+tax_rate_rollups (migration 6) keeps one row of running sums per group. The
+write paths add the contribution of every inserted tax_rate_calculations row
+and subtract that of every deleted row inside the same transaction (apply();
+an update does both), so /api/analytics reads one row per group instead of
+scanning the table, and coarser groupings (a county across all years,
+statewide totals) only sum those rows. Averages are derived from the sums and counts at read time.
+
+contribution() must agree with migrations.rollup_measures(), which rebuilds
+the table from scratch in migration 6 and `flask reconcile-stats`.
+"""
+
+from migrations import ROLLUP_KEYS, ROLLUP_TABLE, rollup_measures
+
+SOURCE_TABLE = 'tax_rate_calculations'
+# tax_rate_calculations columns the sums depend on
+SOURCE_COLUMNS = ROLLUP_KEYS + ('current_total_value', 'last_year_levy', 'proposed_rate',
+                                'no_new_revenue_rate', 'voter_approval_rate')
+MEASURES = tuple(column for column, _ in rollup_measures('sqlite'))
+
+
+class AnalyticsQueryError(ValueError):
+    """Unknown group_by column"""
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def group_key(row):
+    """(county, tax_year, form_type) as stored in tax_rate_rollups"""
+    return tuple('' if row.get(key) is None else str(row[key]) for key in ROLLUP_KEYS)
+
+
+def contribution(row):
+    """Running-sum values of one tax_rate_calculations row (a column -> value dict)"""
+    value, last_levy, proposed, nnr, va = (_number(row.get(key)) for key in (
+        'current_total_value', 'last_year_levy', 'proposed_rate', 'no_new_revenue_rate',
+        'voter_approval_rate'))
+
+    def exceeds(rate):
+        return int(None not in (proposed, rate) and round(proposed, 6) > round(rate, 6))
+
+    return {
+        'unit_count': 1,
+        'total_value': value or 0.0,
+        'total_levy': value * proposed / 100 if None not in (value, proposed) else 0.0,
+        'last_year_levy': last_levy or 0.0,
+        'proposed_rate_sum': proposed or 0.0,
+        'proposed_rate_count': int(proposed is not None),
+        'no_new_revenue_rate_sum': nnr or 0.0,
+        'no_new_revenue_rate_count': int(nnr is not None),
+        'voter_approval_rate_sum': va or 0.0,
+        'voter_approval_rate_count': int(va is not None),
+        'exceeds_no_new_revenue_count': exceeds(nnr),
+        'exceeds_voter_approval_count': exceeds(va),
+    }
+
+
+def accumulate(rows, sign=1, groups=None):
+    """{group key: [delta per MEASURES column]} for rows entering (1) or leaving (-1)"""
+    groups = {} if groups is None else groups
+    for row in rows:
+        values = contribution(row)
+        totals = groups.setdefault(group_key(row), [0] * len(MEASURES))
+        for i, column in enumerate(MEASURES):
+            totals[i] += sign * values[column]
+    return groups
+
+
+def upsert_sql(db_mode):
+    """Add one group's deltas to its row, creating the row if needed"""
+    columns = ROLLUP_KEYS + MEASURES
+    if db_mode == 'sqlserver':
+        return (
+            f"MERGE {ROLLUP_TABLE} WITH (HOLDLOCK) AS t "
+            f"USING (VALUES ({', '.join('?' for _ in columns)})) AS s ({', '.join(columns)}) "
+            f"ON {' AND '.join(f't.{k} = s.{k}' for k in ROLLUP_KEYS)} "
+            f"WHEN MATCHED THEN UPDATE SET {', '.join(f't.{c} = t.{c} + s.{c}' for c in MEASURES)} "
+            f"WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) "
+            f"VALUES ({', '.join(f's.{c}' for c in columns)});"
+        )
+    marker = '%s' if db_mode == 'postgres' else '?'
+    return (
+        f"INSERT INTO {ROLLUP_TABLE} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(marker for _ in columns)}) "
+        f"ON CONFLICT ({', '.join(ROLLUP_KEYS)}) DO UPDATE SET "
+        + ', '.join(f'{c} = {ROLLUP_TABLE}.{c} + excluded.{c}' for c in MEASURES)
+    )
+
+
+def apply(cursor, db_mode, added=(), removed=()):
+    """Fold inserted (`added`) and deleted (`removed`) rows into the rollups
+
+    Runs in the caller's write transaction; an update passes the old row as
+    removed and the new one as added. One statement per touched group;
+    groups left without units are removed.
+    """
+    groups = accumulate(removed, -1, accumulate(added))
+    if not groups:
+        return
+    cursor.executemany(upsert_sql(db_mode), [key + tuple(values) for key, values in groups.items()])
+    if removed:
+        cursor.execute(f'DELETE FROM {ROLLUP_TABLE} WHERE unit_count <= 0')
+
+
+def parse_group_by(raw):
+    """Grouping columns from a comma-separated group_by (default: all three)"""
+    if raw is None:
+        return list(ROLLUP_KEYS)
+    group_by = [c.strip() for c in raw.split(',') if c.strip()]
+    unknown = [c for c in group_by if c not in ROLLUP_KEYS]
+    if unknown:
+        raise AnalyticsQueryError(f"Cannot group by {', '.join(unknown)}; "
+                                  f"group_by may be {', '.join(ROLLUP_KEYS)}")
+    return list(dict.fromkeys(group_by))
+
+
+def query(db_mode, group_by, filters):
+    """(sql, params) summing the rollup rows of each requested group
+
+    `filters` maps ROLLUP_KEYS columns to exact values.
+    """
+    marker = '%s' if db_mode == 'postgres' else '?'
+    where = [f'{column} = {marker}' for column in filters]
+    sums = ', '.join(f'SUM({c}) AS {c}' for c in MEASURES)
+    sql = f"SELECT {', '.join(group_by + [sums])} FROM {ROLLUP_TABLE}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if group_by:
+        sql += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+    return sql, list(filters.values())
+
+
+def _average(total, count):
+    return round(total / count, 6) if count else None
+
+
+def summarize(row, group_by):
+    """Report one group of query() (a column -> value dict)"""
+    # Postgres sums integer columns to NUMERIC; an empty table sums to NULL
+    sums = {column: int(row[column] or 0) if column.endswith('_count') else float(row[column] or 0)
+            for column in MEASURES}
+    avg_proposed = _average(sums['proposed_rate_sum'], sums['proposed_rate_count'])
+    avg_nnr = _average(sums['no_new_revenue_rate_sum'], sums['no_new_revenue_rate_count'])
+    out = {key: row[key] or None for key in group_by}
+    out.update({
+        'units': sums['unit_count'],
+        'total_value': round(sums['total_value'], 2),
+        'total_levy': round(sums['total_levy'], 2),
+        'last_year_levy': round(sums['last_year_levy'], 2),
+        'levy_change': round(sums['total_levy'] - sums['last_year_levy'], 2),
+        'avg_proposed_rate': avg_proposed,
+        'avg_no_new_revenue_rate': avg_nnr,
+        'avg_voter_approval_rate': _average(sums['voter_approval_rate_sum'],
+                                            sums['voter_approval_rate_count']),
+        'avg_proposed_over_no_new_revenue': round(avg_proposed - avg_nnr, 6)
+        if None not in (avg_proposed, avg_nnr) else None,
+        'units_exceeding_no_new_revenue': sums['exceeds_no_new_revenue_count'],
+        'units_exceeding_voter_approval': sums['exceeds_voter_approval_count'],
+    })
+    return out
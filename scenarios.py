@@ -0,0 +1,212 @@
+"""
+What-if sweeps of a saved tax rate calculation
+
+A sweep replaces some rate_engine inputs of one taxing unit (proposed M&O
+rate, proposed debt rate, taxable value, ...) with axes of candidate values
+and evaluates the full Cartesian grid at once: the whole grid is laid out as
+flat NumPy columns and passed through rate_engine.compute_rates() in a single
+call. Each point gets its rates, levy, the thresholds it crosses and the
+notice type it would require (the rules of notice_templates.classify()).
+
+Results are columnar and flattened in C order (the last axis varies
+fastest), so point i of a grid with shape (a, b, c) is at index
+(i // (b * c), i // c % b, i % c).
+"""
+
+import itertools
+import math
+
+import notice_templates
+import rate_engine
+
+if rate_engine.HAS_NUMPY:
+    import numpy as np
+
+# Inputs that can be swept (isDisasterArea stays as saved)
+AXIS_FIELDS = tuple(f for f in rate_engine.INPUT_FIELDS if f != 'isDisasterArea')
+MAX_AXIS_POINTS = 10000
+
+# Bits of the `thresholds` column
+THRESHOLDS = {'noNewRevenue': 1, 'voterApproval': 2, 'deMinimis': 4}
+NOTICE_TYPES = tuple(notice_templates.NOTICE_FORMS)
+OUTPUT_FIELDS = rate_engine.RATE_FIELDS + ('levy', 'levyChange', 'thresholds', 'noticeType')
+
+
+class ScenarioError(ValueError):
+    """The sweep request is malformed or too large"""
+
+
+def _number(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ScenarioError(f"{name} must be a finite number")
+    return float(value)
+
+
+def _float(value):
+    """Saved input as a float; None and junk count as 0, as in the portal"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(number) else number
+
+
+def axis_values(name, spec):
+    """Candidate values for one axis: a list, {start, stop, num} or {start, stop, step}"""
+    if name not in AXIS_FIELDS:
+        raise ScenarioError(f"Cannot sweep {name}; axes may be {', '.join(AXIS_FIELDS)}")
+    if isinstance(spec, list):
+        values = [_number(v, name) for v in spec]
+    elif isinstance(spec, dict) and 'start' in spec and 'stop' in spec:
+        start, stop = _number(spec['start'], f'{name}.start'), _number(spec['stop'], f'{name}.stop')
+        if 'num' in spec:
+            num = spec['num']
+            if isinstance(num, bool) or not isinstance(num, int) or num < 1:
+                raise ScenarioError(f"{name}.num must be a positive integer")
+            if num > MAX_AXIS_POINTS:
+                raise ScenarioError(f"{name} has more than {MAX_AXIS_POINTS} values")
+            values = [start + (stop - start) * i / (num - 1) for i in range(num)] if num > 1 else [start]
+        elif 'step' in spec:
+            step = _number(spec['step'], f'{name}.step')
+            if step <= 0 or (stop - start) / step >= MAX_AXIS_POINTS:
+                raise ScenarioError(f"{name}.step must be positive and give at most {MAX_AXIS_POINTS} values")
+            values = [start + step * i for i in range(int(math.floor((stop - start) / step + 1e-9)) + 1)]
+        else:
+            raise ScenarioError(f"{name} needs num or step")
+    else:
+        raise ScenarioError(f"{name} must be a list of values or {{start, stop, num|step}}")
+    if not values or len(values) > MAX_AXIS_POINTS:
+        raise ScenarioError(f"{name} must have between 1 and {MAX_AXIS_POINTS} values")
+    return values
+
+
+def parse_axes(raw, max_points):
+    """[(field, values)] in grid order; raises ScenarioError
+
+    `raw` is a list of {"field": name, "values": [...]} or {"field": name,
+    "start", "stop", "num"|"step"}; an object mapping fields to those specs
+    is accepted too, in the order its keys arrive.
+    """
+    if isinstance(raw, dict):
+        raw = [dict(spec, field=name) if isinstance(spec, dict) else {'field': name, 'values': spec}
+               for name, spec in raw.items()]
+    if not isinstance(raw, list) or not raw or not all(isinstance(a, dict) for a in raw):
+        raise ScenarioError("axes must be a list of {field, values} or {field, start, stop, num|step}")
+    axes = [(a.get('field'), axis_values(a.get('field'), a['values'] if 'values' in a else a))
+            for a in raw]
+    names = [name for name, _ in axes]
+    if len(set(names)) != len(names):
+        raise ScenarioError("Each field may be swept only once")
+    points = math.prod(len(values) for _, values in axes)
+    if points > max_points:
+        raise ScenarioError(f"The grid has {points} points; the limit is {max_points}")
+    return axes
+
+
+def _grid_columns(base, axes):
+    """Flat input columns for every point of the grid (C order)"""
+    shape = [len(values) for _, values in axes]
+    grids = np.meshgrid(*[np.asarray(values, dtype=float) for _, values in axes], indexing='ij')
+    n = math.prod(shape)
+    columns = {}
+    for key in rate_engine.INPUT_FIELDS:
+        if key == 'isDisasterArea':
+            columns[key] = np.full(n, bool(base.get(key)))
+        else:
+            columns[key] = np.full(n, _float(base.get(key)))
+    for (name, _), grid in zip(axes, grids):
+        columns[name] = grid.ravel()
+    return columns
+
+
+def _evaluate_numpy(base, axes):
+    columns = _grid_columns(base, axes)
+    rates = rate_engine.compute_rates(columns)
+    proposed, nnr, va, de_minimis = (np.round(rates[key], 6) for key in (
+        'proposedRate', 'noNewRevenueRate', 'voterApprovalRate', 'deMinimisRate'))
+    levy = columns['currentTotalValue'] * rates['proposedRate'] / 100
+
+    above_nnr, above_va, above_dm = proposed > nnr, proposed > va, proposed > de_minimis
+    thresholds = (above_nnr * THRESHOLDS['noNewRevenue'] + above_va * THRESHOLDS['voterApproval']
+                  + above_dm * THRESHOLDS['deMinimis']).astype(np.int8)
+    # Same precedence as notice_templates.classify()
+    notice = np.select(
+        [(levy <= notice_templates.SMALL_UNIT_LEVY) & above_nnr, above_va & ~above_dm,
+         above_nnr & above_va, above_nnr, above_va],
+        [NOTICE_TYPES.index(t) for t in ('small-city', 'de-minimis', 'exceeds-both',
+                                         'exceeds-nnr', 'exceeds-va')],
+        default=NOTICE_TYPES.index('exceeds-none')).astype(np.int8)
+
+    return {
+        **rates,
+        'levy': levy,
+        'levyChange': levy - _float(base.get('lastYearLevy')),
+        'thresholds': thresholds,
+        'noticeType': notice,
+    }
+
+
+def _evaluate_loop(base, axes):
+    """Point-by-point fallback when NumPy is missing"""
+    out = {key: [] for key in OUTPUT_FIELDS}
+    last_levy = _float(base.get('lastYearLevy'))
+    for point in itertools.product(*[values for _, values in axes]):
+        unit = dict(base, **{name: value for (name, _), value in zip(axes, point)})
+        rates = rate_engine.compute_unit_rates(unit)
+        levy = _float(unit.get('currentTotalValue')) * rates['proposedRate'] / 100
+        rounded = {key: round(value, 6) for key, value in rates.items()}
+        notice = notice_templates.classify({
+            'proposed_rate': rounded['proposedRate'], 'no_new_revenue_rate': rounded['noNewRevenueRate'],
+            'voter_approval_rate': rounded['voterApprovalRate'], 'de_minimis_rate': rounded['deMinimisRate'],
+            'current_total_value': unit.get('currentTotalValue'),
+        })
+        crossed = [rounded['proposedRate'] > rounded[key] for key in
+                   ('noNewRevenueRate', 'voterApprovalRate', 'deMinimisRate')]
+        for key, value in rates.items():
+            out[key].append(value)
+        out['levy'].append(levy)
+        out['levyChange'].append(levy - last_levy)
+        out['thresholds'].append(sum(bit for bit, hit in zip(THRESHOLDS.values(), crossed) if hit))
+        out['noticeType'].append(NOTICE_TYPES.index(notice))
+    return out
+
+
+def sweep(base, axes, outputs=OUTPUT_FIELDS):
+    """Evaluate a grid around `base` (a unit dict keyed by INPUT_FIELDS)
+
+    Returns {'shape', 'count', 'columns', 'summary'} with plain lists; rates
+    are rounded to 6 decimals and money to cents to keep the payload small.
+    """
+    unknown = [key for key in outputs if key not in OUTPUT_FIELDS]
+    if unknown:
+        raise ScenarioError(f"Unknown output(s): {', '.join(unknown)}")
+    result = _evaluate_numpy(base, axes) if rate_engine.HAS_NUMPY else _evaluate_loop(base, axes)
+
+    columns = {}
+    for key in outputs:
+        values = result[key]
+        if key in rate_engine.RATE_FIELDS:
+            values = np.round(values, 6).tolist() if rate_engine.HAS_NUMPY else [round(v, 6) for v in values]
+        elif key in ('levy', 'levyChange'):
+            values = np.round(values, 2).tolist() if rate_engine.HAS_NUMPY else [round(v, 2) for v in values]
+        elif rate_engine.HAS_NUMPY:
+            values = values.tolist()
+        columns[key] = values
+
+    notice, thresholds = result['noticeType'], result['thresholds']
+    if rate_engine.HAS_NUMPY:
+        notice_counts = np.bincount(notice, minlength=len(NOTICE_TYPES)).tolist()
+        crossed = {name: int(np.count_nonzero(thresholds & bit)) for name, bit in THRESHOLDS.items()}
+    else:
+        notice_counts = [notice.count(i) for i in range(len(NOTICE_TYPES))]
+        crossed = {name: sum(1 for t in thresholds if t & bit) for name, bit in THRESHOLDS.items()}
+
+    return {
+        'shape': [len(values) for _, values in axes],
+        'count': math.prod(len(values) for _, values in axes),
+        'columns': columns,
+        'summary': {
+            'noticeTypes': {t: c for t, c in zip(NOTICE_TYPES, notice_counts) if c},
+            'crossed': crossed,
+        },
+    }
@@ -0,0 +1,196 @@
+"""
+Ranked full-text search over public notices, ballots and hearing locations
+
+The indexes are created by migration 5 (see migrations.SEARCH_COLUMNS):
+- SQLite: FTS5 tables ranked with bm25()
+- Postgres: GIN expression indexes ranked with ts_rank_cd()
+- SQL Server: CONTAINSTABLE() when `flask search-index` has created
+  full-text indexes, otherwise an unranked LIKE scan
+
+Queries are plain text; "double quotes" group a phrase and every word or
+phrase must match. Results from all categories are merged by score.
+"""
+
+import re
+
+from migrations import SEARCH_COLUMNS, search_vector_sql
+
+# URL category -> (table, column shown as the result title)
+SEARCH_CATEGORIES = {
+    'notices': ('public_notices', 'taxing_unit'),
+    'ballots': ('ballots_petitions', 'taxing_unit'),
+    'water': ('water_district_forms', 'district_name'),
+}
+
+MAX_TERMS = 16
+SNIPPET_WIDTH = 160
+
+PHRASE = re.compile(r'"([^"]*)"|([^\s"]+)')
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchQueryError(ValueError):
+    """The search text contains nothing searchable"""
+
+
+def parse_query(text):
+    """List of terms, each a tuple of words (more than one word = phrase)"""
+    terms = []
+    for phrase, word in PHRASE.findall(text or ''):
+        words = tuple(w.lower() for w in WORD.findall(phrase or word))
+        if words and words not in terms:
+            terms.append(words)
+    if not terms:
+        raise SearchQueryError("q must contain at least one word")
+    if len(terms) > MAX_TERMS:
+        raise SearchQueryError(f"q may contain at most {MAX_TERMS} words or phrases")
+    return terms
+
+
+def _quoted(terms, joiner):
+    # Words are \w+ only, so they can be wrapped in double quotes safely
+    return joiner.join('"' + ' '.join(words) + '"' for words in terms)
+
+
+def like_pattern(words):
+    """LIKE pattern containing a term, with \\ escaping the wildcard characters"""
+    text = ' '.join(words)
+    for char in ('\\', '%', '_', '['):
+        text = text.replace(char, '\\' + char)
+    return '%' + text + '%'
+
+
+def _ranked_select(db_mode, category, terms, fulltext_tables):
+    """(sql, params) yielding category, id, score for one category"""
+    table = SEARCH_CATEGORIES[category][0]
+    columns = SEARCH_COLUMNS[table]
+    if db_mode == 'sqlite':
+        return (f"SELECT '{category}' AS category, rowid AS id, -bm25({table}_fts) AS score "
+                f"FROM {table}_fts WHERE {table}_fts MATCH ?", [_quoted(terms, ' AND ')])
+    if db_mode == 'postgres':
+        vector = search_vector_sql(table)
+        return (f"SELECT '{category}' AS category, id, ts_rank_cd({vector}, q) AS score "
+                f"FROM {table}, websearch_to_tsquery('english', %s) q WHERE {vector} @@ q",
+                [_quoted(terms, ' ')])
+    if table in fulltext_tables:
+        return (f"SELECT '{category}' AS category, t.id, CAST(ft.RANK AS FLOAT) AS score "
+                f"FROM {table} t JOIN CONTAINSTABLE({table}, ({', '.join(columns)}), ?) ft "
+                f"ON ft.[KEY] = t.id", [_quoted(terms, ' AND ')])
+    # No full-text index: every term must appear in one of the columns
+    conditions, params = [], []
+    for words in terms:
+        conditions.append('(' + ' OR '.join(f"{c} LIKE ? ESCAPE '\\'" for c in columns) + ')')
+        params.extend([like_pattern(words)] * len(columns))
+    return (f"SELECT '{category}' AS category, id, CAST(0 AS FLOAT) AS score "
+            f"FROM {table} WHERE {' AND '.join(conditions)}", params)
+
+
+def ranked_ids(cursor, db_mode, terms, categories, limit, offset, fulltext_tables=()):
+    """[(category, id, score)] best first, for one page of results"""
+    selects, params = [], []
+    for category in categories:
+        sql, select_params = _ranked_select(db_mode, category, terms, fulltext_tables)
+        selects.append(sql)
+        params.extend(select_params)
+    sql = ' UNION ALL '.join(selects) + ' ORDER BY score DESC, category, id DESC'
+    if db_mode == 'sqlserver':
+        sql += ' OFFSET ? ROWS FETCH NEXT ? ROWS ONLY'
+        params.extend([offset, limit])
+    else:
+        sql += ' LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+    if db_mode == 'postgres':
+        sql = sql.replace('?', '%s')
+    cursor.execute(sql, params)
+    return [(row[0], row[1], float(row[2] or 0)) for row in cursor.fetchall()]
+
+
+def load_hits(cursor, db_mode, terms, ranked):
+    """Result dicts (title, snippet, matched fields) for ranked ids, in order"""
+    marker = '%s' if db_mode == 'postgres' else '?'
+    rows = {}
+    for category in {c for c, _, _ in ranked}:
+        table, title_column = SEARCH_CATEGORIES[category]
+        ids = [id for c, id, _ in ranked if c == category]
+        columns = SEARCH_COLUMNS[table]
+        cursor.execute(
+            f"SELECT id, {title_column}, created_at, {', '.join(columns)} FROM {table} "
+            f"WHERE id IN ({', '.join(marker for _ in ids)})", ids)
+        for row in cursor.fetchall():
+            rows[(category, row[0])] = (row[1], row[2], dict(zip(columns, row[3:])))
+
+    hits = []
+    for category, id, score in ranked:
+        if (category, id) not in rows:
+            continue  # deleted between the two queries
+        title, created_at, texts = rows[(category, id)]
+        matched = [column for column, text in texts.items() if _find(text, terms) is not None]
+        hits.append({
+            'category': category,
+            'id': id,
+            'title': title,
+            'score': round(score, 6),
+            'matched_fields': matched,
+            'snippet': snippet(texts[matched[0]] if matched else next(iter(texts.values())), terms),
+            'created_at': created_at,
+        })
+    return hits
+
+
+def _find(text, terms):
+    """Offset of the first query word in text (prefix match, so stems count)"""
+    if not text:
+        return None
+    lowered = text.lower()
+    positions = []
+    for words in terms:
+        # Porter stemming can match "libraries" for "library"; compare stems roughly
+        stem = words[0][:max(4, len(words[0]) - 2)]
+        found = lowered.find(stem)
+        if found >= 0:
+            positions.append(found)
+    return min(positions) if positions else None
+
+
+def snippet(text, terms, width=SNIPPET_WIDTH):
+    """About `width` characters of text around the first match"""
+    if not text:
+        return ''
+    if len(text) <= width:
+        return text
+    position = _find(text, terms) or 0
+    start = max(0, min(position - width // 3, len(text) - width))
+    piece = text[start:start + width].strip()
+    return ('…' if start else '') + piece + ('…' if start + width < len(text) else '')
+
+
+def sqlserver_fulltext_tables(cursor):
+    """Search tables that have an active SQL Server full-text index"""
+    tables = set()
+    for table in SEARCH_COLUMNS:
+        cursor.execute("SELECT OBJECTPROPERTY(OBJECT_ID(?), 'TableHasActiveFulltextIndex')", (table,))
+        row = cursor.fetchone()
+        if row and row[0] == 1:
+            tables.add(table)
+    return tables
+
+
+def create_sqlserver_fulltext(cursor, catalog='tit_search'):
+    """Create the full-text catalog and indexes (needs autocommit); returns tables indexed"""
+    cursor.execute("SELECT CAST(SERVERPROPERTY('IsFullTextInstalled') AS INT)")
+    if cursor.fetchone()[0] != 1:
+        return []
+    cursor.execute(f"IF NOT EXISTS (SELECT * FROM sys.fulltext_catalogs WHERE name = '{catalog}') "
+                   f"CREATE FULLTEXT CATALOG {catalog}")
+    created = []
+    for table, columns in SEARCH_COLUMNS.items():
+        cursor.execute("SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(?) AND is_primary_key = 1",
+                       (table,))
+        key_index = cursor.fetchone()[0]
+        cursor.execute(
+            f"IF NOT EXISTS (SELECT * FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('{table}')) "
+            f"CREATE FULLTEXT INDEX ON {table} ({', '.join(columns)}) KEY INDEX {key_index} "
+            f"ON {catalog} WITH CHANGE_TRACKING AUTO"
+        )
+        created.append(table)
+    return created
@@ -1,8 +1,45 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import (Flask, Response, request, jsonify, send_from_directory, g,
+                   has_app_context, has_request_context, stream_with_context)
+from flask.json.provider import DefaultJSONProvider
+from urllib.parse import urlencode
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.utils import safe_join
+import atexit
+import base64
+import contextlib
+import functools
+import itertools
 import json
-from datetime import datetime
+import mimetypes
+import multiprocessing
+import time
+from datetime import datetime, timedelta
 import os
 import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+import audit_partitions
+import bulk
+import compression
+import export
+import idempotency
+import metrics
+import migrations
+import notice_templates
+import pdf_render
+import rate_engine
+import replicas
+import rollups
+import scenarios
+import search
+import snapshots
+import sqlite_tuning
+from audit_log import AuditWriter, audit_event, now_utc
+from db_pool import ConnectionPool
+from response_cache import CachedResponse, ResponseCache, etag_matches, make_etag
 
 # Try to import optional database drivers
 try:
@@ -21,6 +58,14 @@ except ImportError:
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app = Flask(__name__, static_folder=BASE_DIR)
 
+# Reverse proxies in front of the app whose X-Forwarded-For/-Proto headers are
+# trusted (Render has one). request.remote_addr, which scopes content dedup
+# and is recorded in the audit log, is then the client rather than the proxy.
+# Leave at 0 when clients connect directly, or they could spoof the header.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
 # Database mode detection:
 # 1. DATABASE_URL env var -> PostgreSQL (Render)
 # 2. SQL_CONN_STR env var -> SQL Server
@@ -28,7 +73,7 @@ app = Flask(__name__, static_folder=BASE_DIR)
 # 4. fallback -> SQLite
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
 SQL_CONN_STR = os.environ.get('SQL_CONN_STR', '')
-DB_PATH = os.path.join(BASE_DIR, 'truth_in_taxation.db')
+DB_PATH = os.environ.get('SQLITE_PATH') or os.path.join(BASE_DIR, 'truth_in_taxation.db')
 
 if DATABASE_URL and HAS_PSYCOPG2:
     DB_MODE = 'postgres'
@@ -49,25 +94,245 @@ else:
 # PostgreSQL uses %s, SQLite and SQL Server use ?
 PARAM = '%s' if DB_MODE == 'postgres' else '?'
 
-# Add CORS headers to all responses
+# Per-route request metrics, served at /api/metrics. METRICS=off disables them.
+METRICS_ENABLED = os.environ.get('METRICS', 'on').lower() not in ('off', 'false', '0')
+request_metrics = metrics.Metrics()
+
+def record_phase(phase, started):
+    """Charge the time since `started` to a phase of the current request"""
+    timings = g.get('metrics') if has_app_context() else None
+    if timings is not None:
+        timings.add(phase, time.perf_counter() - started)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that records encoding time as the request's json phase"""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            record_phase('json', started)
+
+app.json = TimedJSONProvider(app)
+
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED:
+        g.metrics = metrics.RequestTimings()
+
+@app.after_request
+def record_response_status(response):
+    timings = g.get('metrics')
+    if timings is not None:
+        timings.status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    timings = g.pop('metrics', None)
+    if timings is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_metrics.record(request.method, route, timings)
+
+# CORS headers added to all responses (asgi_server.py sends the same ones)
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Headers', 'Content-Type, If-None-Match, If-Match, Idempotency-Key'),
+    ('Access-Control-Expose-Headers', 'ETag, Idempotent-Replayed'),
+    ('Access-Control-Allow-Methods', 'GET,POST,PATCH,DELETE,OPTIONS'),
+]
+
 @app.after_request
 def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,DELETE,OPTIONS')
+    for name, value in CORS_HEADERS:
+        response.headers.add(name, value)
     return response
 
-def get_conn():
-    """Get a new database connection"""
+# Negotiated gzip/brotli for buffered responses of at least COMPRESS_MIN_SIZE
+# bytes. COMPRESSION=off disables it (e.g. when a proxy already compresses).
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION', 'on').lower() not in ('off', 'false', '0')
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+@app.after_request
+def compress_response(response):
+    if COMPRESSION_ENABLED:
+        compression.compress_response(response, request.headers.get('Accept-Encoding'),
+                                      COMPRESS_MIN_SIZE)
+    return response
+
+# SQLite tuning (see sqlite_tuning.py). SQLITE_PROFILE=legacy restores the
+# old rollback-journal behaviour. SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE and
+# SQLITE_BUSY_TIMEOUT override single pragmas. SQLITE_WRITE_RETRIES is how
+# often a write that still finds the database locked is retried, and
+# SQLITE_WRITER_LOCK=true additionally serializes writes within each worker.
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production').lower()
+SQLITE_PRAGMAS = sqlite_tuning.profile_pragmas(SQLITE_PROFILE, {
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS'),
+    'cache_size': os.environ.get('SQLITE_CACHE_SIZE'),
+    'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT'),
+})
+SQLITE_IMMEDIATE_WRITES = SQLITE_PROFILE != 'legacy'
+SQLITE_WRITE_RETRIES = int(os.environ.get('SQLITE_WRITE_RETRIES', 0 if SQLITE_PROFILE == 'legacy' else 5))
+SQLITE_WRITER_LOCK = os.environ.get('SQLITE_WRITER_LOCK', '').lower() == 'true'
+
+def connect():
+    """Open a new (unpooled) database connection"""
     if DB_MODE == 'postgres':
         return psycopg2.connect(DATABASE_URL)
     elif DB_MODE == 'sqlserver':
         return pyodbc.connect(SQL_CONN_STR)
     else:
-        conn = sqlite3.connect(DB_PATH)
+        # Pooled connections move between request threads, but the pool
+        # guarantees only one thread uses a connection at a time.
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        sqlite_tuning.apply_pragmas(conn, SQLITE_PRAGMAS)
         return conn
 
+# Connection pool settings (per gunicorn worker process)
+# DB_POOL_MIN / DB_POOL_MAX: connections kept open / allowed at once
+# DB_POOL_MAX_LIFETIME: seconds before a connection is recycled
+# DB_POOL_TIMEOUT: seconds to wait for a free connection
+# DB_POOL_PING_INTERVAL: idle seconds after which a connection is health-checked
+pool = ConnectionPool(
+    connect,
+    min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+    max_size=int(os.environ.get('DB_POOL_MAX', 10)),
+    max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    ping_interval=float(os.environ.get('DB_POOL_PING_INTERVAL', 10)),
+)
+
+def get_conn():
+    """Check out a pooled database connection (close() returns it to the pool)"""
+    return checkout(pool.acquire)
+
+def checkout(acquire):
+    """Connection from acquire(), timed and released at teardown when in a request"""
+    timings = g.get('metrics') if has_app_context() else None
+    if timings is None:
+        conn = acquire()
+    else:
+        started = time.perf_counter()
+        conn = acquire()
+        timings.add('acquire', time.perf_counter() - started)
+        conn = metrics.TimedConnection(conn, timings)
+    if has_app_context():
+        g.setdefault('db_conns', []).append(conn)
+    return conn
+
+# Read replicas (see replicas.py), PostgreSQL and SQL Server only
+# DATABASE_REPLICA_URLS: comma-separated replica DSNs for PostgreSQL
+# SQL_REPLICA_CONN_STRS: |-separated replica connection strings for SQL Server
+# DB_REPLICA_STICKY_SECONDS: after a write, the client reads from the primary this long
+# DB_REPLICA_MAX_LAG: seconds of replication lag after which a replica is skipped
+# DB_REPLICA_RETRY_INTERVAL: seconds a failed or lagging replica is skipped
+# DB_REPLICA_CHECK_INTERVAL: seconds between lag checks of a replica
+# DB_REPLICA_ACQUIRE_TIMEOUT: seconds to wait for a busy replica's pool
+#   before trying the next replica (or the primary)
+# Replica pools otherwise take their sizes and timeouts from the DB_POOL_* settings.
+if DB_MODE == 'postgres':
+    REPLICA_URLS = replicas.parse_replica_urls(os.environ.get('DATABASE_REPLICA_URLS'))
+elif DB_MODE == 'sqlserver':
+    REPLICA_URLS = replicas.parse_replica_urls(os.environ.get('SQL_REPLICA_CONN_STRS'), '|')
+else:
+    REPLICA_URLS = []
+REPLICA_STICKY_SECONDS = float(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+REPLICA_ACQUIRE_TIMEOUT = float(os.environ.get('DB_REPLICA_ACQUIRE_TIMEOUT', 0.25))
+PRIMARY_COOKIE = 'tit_read_primary_until'
+
+def replica_connect(url):
+    if DB_MODE == 'postgres':
+        return lambda: psycopg2.connect(url)
+    return lambda: pyodbc.connect(url)
+
+replica_router = replicas.ReplicaRouter(
+    [ConnectionPool(replica_connect(url), min_size=pool.min_size, max_size=pool.max_size,
+                    max_lifetime=pool.max_lifetime, timeout=REPLICA_ACQUIRE_TIMEOUT,
+                    ping_interval=pool.ping_interval, name=f'replica-{i}')
+     for i, url in enumerate(REPLICA_URLS, 1)],
+    lag_sql=replicas.LAG_SQL.get(DB_MODE),
+    max_lag=float(os.environ.get('DB_REPLICA_MAX_LAG', 30)),
+    retry_interval=float(os.environ.get('DB_REPLICA_RETRY_INTERVAL', 10)),
+    check_interval=float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5)),
+) if REPLICA_URLS else None
+
+def reads_from_primary(cookies=None):
+    """True while the client is inside the stickiness window of its last write"""
+    cookies = request.cookies if cookies is None else cookies
+    try:
+        return float(cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def get_read_conn():
+    """Connection for a read-only route: a replica when one is healthy and the
+    client has not written recently, else the primary
+
+    Every read of one request goes to the same replica, so a cached body is
+    never older than the table versions its ETag was made from.
+    """
+    if replica_router is None or not has_request_context() or reads_from_primary():
+        return get_conn()
+
+    def acquire():
+        replica, conn = replica_router.acquire(g.get('read_replica'))
+        if replica is None:
+            return pool.acquire()
+        g.read_replica = replica
+        return conn
+    return checkout(acquire)
+
+@app.after_request
+def stick_to_primary(response):
+    """Send a client's reads to the primary for a while after it writes"""
+    if (replica_router is not None and request.method in ('POST', 'PATCH', 'PUT', 'DELETE')
+            and response.status_code < 400):
+        response.set_cookie(PRIMARY_COOKIE, str(int(time.time() + REPLICA_STICKY_SECONDS) + 1),
+                            max_age=int(REPLICA_STICKY_SECONDS) + 1, httponly=True, samesite='Lax')
+    return response
+
+@app.teardown_appcontext
+def release_connections(exc):
+    """Return connections a handler did not close (e.g. after an exception)"""
+    for conn in g.pop('db_conns', []):
+        conn.close()
+
+sqlite_writes = {'transactions': 0, 'retries': 0}
+sqlite_writer_lock = threading.Lock() if SQLITE_WRITER_LOCK else contextlib.nullcontext()
+
+def count_write_retry(attempt, delay):
+    sqlite_writes['retries'] += 1
+
+def write_transaction(work):
+    """Run work(cursor) in a transaction, commit, and return its result
+
+    On SQLite the transaction starts with BEGIN IMMEDIATE and is retried
+    with backoff while the database is locked by another worker, so `work`
+    may run more than once and must only touch the database.
+    """
+    def attempt():
+        conn = get_conn()
+        try:
+            cursor = conn.cursor()
+            if DB_MODE == 'sqlite' and SQLITE_IMMEDIATE_WRITES:
+                cursor.execute('BEGIN IMMEDIATE')
+            result = work(cursor)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    if DB_MODE != 'sqlite':
+        return attempt()
+    with sqlite_writer_lock:
+        sqlite_writes['transactions'] += 1
+        return sqlite_tuning.retry_busy(attempt, SQLITE_WRITE_RETRIES, on_retry=count_write_retry)
+
 def row_to_dict(cursor, row):
     """Convert a row to a dictionary"""
     if DB_MODE == 'postgres':
@@ -81,11 +346,14 @@ def row_to_dict(cursor, row):
 
 def rows_to_dicts(cursor, rows):
     """Convert rows to a list of dictionaries"""
+    started = time.perf_counter()
     if DB_MODE in ('postgres', 'sqlserver'):
         columns = [desc[0] for desc in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+        result = [dict(zip(columns, row)) for row in rows]
     else:
-        return [dict(row) for row in rows]
+        result = [dict(row) for row in rows]
+    record_phase('rows', started)
+    return result
 
 def p(sql):
     """Replace ? placeholders with the correct parameter marker for the current DB"""
@@ -94,218 +362,23 @@ def p(sql):
     return sql
 
 def init_db():
-    """Initialize the database with all necessary tables"""
-    conn = get_conn()
-    cursor = conn.cursor()
+    """Bring the database schema up to date (see migrations.py)
 
-    if DB_MODE == 'sqlserver':
-        cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='tax_rate_calculations' AND xtype='U')
-            CREATE TABLE tax_rate_calculations (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                form_type NVARCHAR(255) NOT NULL, taxing_unit NVARCHAR(255) NOT NULL,
-                county NVARCHAR(255), tax_year NVARCHAR(50),
-                last_year_levy FLOAT, last_year_mo_rate FLOAT, last_year_debt_rate FLOAT,
-                current_total_value FLOAT, new_property_value FLOAT, lost_property_levy FLOAT,
-                proposed_mo_rate FLOAT, proposed_debt_rate FLOAT, total_debt FLOAT,
-                tax_increments FLOAT, is_disaster_area BIT,
-                no_new_revenue_rate FLOAT, voter_approval_rate FLOAT,
-                de_minimis_rate FLOAT, proposed_rate FLOAT,
-                created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
-            )
-        ''')
-        cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='public_notices' AND xtype='U')
-            CREATE TABLE public_notices (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                notice_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
-                taxing_unit NVARCHAR(255) NOT NULL, proposed_rate FLOAT,
-                no_new_revenue_rate FLOAT, voter_approval_rate FLOAT,
-                meeting_date NVARCHAR(255), meeting_time NVARCHAR(255),
-                meeting_location NVARCHAR(MAX), notice_text NVARCHAR(MAX),
-                created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
-            )
-        ''')
-        cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='ballots_petitions' AND xtype='U')
-            CREATE TABLE ballots_petitions (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                ballot_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
-                taxing_unit NVARCHAR(255) NOT NULL, proposed_rate FLOAT,
-                election_date NVARCHAR(255), language NVARCHAR(255), ballot_text NVARCHAR(MAX),
-                created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
-            )
-        ''')
-        cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='school_district_forms' AND xtype='U')
-            CREATE TABLE school_district_forms (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                form_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
-                school_district NVARCHAR(255) NOT NULL, county NVARCHAR(255), tax_year NVARCHAR(50),
-                current_value FLOAT, mo_portion FLOAT, debt_portion FLOAT,
-                total_rate FLOAT, has_chapter_313 BIT,
-                created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
-            )
-        ''')
-        cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='water_district_forms' AND xtype='U')
-            CREATE TABLE water_district_forms (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                district_type NVARCHAR(255) NOT NULL, form_number NVARCHAR(255),
-                district_name NVARCHAR(255) NOT NULL, county NVARCHAR(255), tax_year NVARCHAR(50),
-                proposed_rate FLOAT, hearing_date NVARCHAR(255), hearing_time NVARCHAR(255),
-                hearing_location NVARCHAR(MAX),
-                created_at DATETIME DEFAULT GETDATE(), updated_at DATETIME DEFAULT GETDATE()
-            )
-        ''')
-        cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='form_submissions_log' AND xtype='U')
-            CREATE TABLE form_submissions_log (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                form_category NVARCHAR(255) NOT NULL, form_id INT,
-                action NVARCHAR(255) NOT NULL, user_info NVARCHAR(MAX),
-                ip_address NVARCHAR(255), submitted_at DATETIME DEFAULT GETDATE()
-            )
-        ''')
-    elif DB_MODE == 'postgres':
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tax_rate_calculations (
-                id SERIAL PRIMARY KEY,
-                form_type VARCHAR(255) NOT NULL, taxing_unit VARCHAR(255) NOT NULL,
-                county VARCHAR(255), tax_year VARCHAR(50),
-                last_year_levy DOUBLE PRECISION, last_year_mo_rate DOUBLE PRECISION,
-                last_year_debt_rate DOUBLE PRECISION, current_total_value DOUBLE PRECISION,
-                new_property_value DOUBLE PRECISION, lost_property_levy DOUBLE PRECISION,
-                proposed_mo_rate DOUBLE PRECISION, proposed_debt_rate DOUBLE PRECISION,
-                total_debt DOUBLE PRECISION, tax_increments DOUBLE PRECISION,
-                is_disaster_area BOOLEAN,
-                no_new_revenue_rate DOUBLE PRECISION, voter_approval_rate DOUBLE PRECISION,
-                de_minimis_rate DOUBLE PRECISION, proposed_rate DOUBLE PRECISION,
-                created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS public_notices (
-                id SERIAL PRIMARY KEY,
-                notice_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
-                taxing_unit VARCHAR(255) NOT NULL, proposed_rate DOUBLE PRECISION,
-                no_new_revenue_rate DOUBLE PRECISION, voter_approval_rate DOUBLE PRECISION,
-                meeting_date VARCHAR(255), meeting_time VARCHAR(255),
-                meeting_location TEXT, notice_text TEXT,
-                created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ballots_petitions (
-                id SERIAL PRIMARY KEY,
-                ballot_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
-                taxing_unit VARCHAR(255) NOT NULL, proposed_rate DOUBLE PRECISION,
-                election_date VARCHAR(255), language VARCHAR(255), ballot_text TEXT,
-                created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS school_district_forms (
-                id SERIAL PRIMARY KEY,
-                form_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
-                school_district VARCHAR(255) NOT NULL, county VARCHAR(255), tax_year VARCHAR(50),
-                current_value DOUBLE PRECISION, mo_portion DOUBLE PRECISION,
-                debt_portion DOUBLE PRECISION, total_rate DOUBLE PRECISION,
-                has_chapter_313 BOOLEAN,
-                created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS water_district_forms (
-                id SERIAL PRIMARY KEY,
-                district_type VARCHAR(255) NOT NULL, form_number VARCHAR(255),
-                district_name VARCHAR(255) NOT NULL, county VARCHAR(255), tax_year VARCHAR(50),
-                proposed_rate DOUBLE PRECISION, hearing_date VARCHAR(255),
-                hearing_time VARCHAR(255), hearing_location TEXT,
-                created_at TIMESTAMP DEFAULT NOW(), updated_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS form_submissions_log (
-                id SERIAL PRIMARY KEY,
-                form_category VARCHAR(255) NOT NULL, form_id INTEGER,
-                action VARCHAR(255) NOT NULL, user_info TEXT,
-                ip_address VARCHAR(255), submitted_at TIMESTAMP DEFAULT NOW()
-            )
-        ''')
-    else:
-        # SQLite DDL
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tax_rate_calculations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                form_type TEXT NOT NULL, taxing_unit TEXT NOT NULL,
-                county TEXT, tax_year TEXT,
-                last_year_levy REAL, last_year_mo_rate REAL, last_year_debt_rate REAL,
-                current_total_value REAL, new_property_value REAL, lost_property_levy REAL,
-                proposed_mo_rate REAL, proposed_debt_rate REAL, total_debt REAL,
-                tax_increments REAL, is_disaster_area BOOLEAN,
-                no_new_revenue_rate REAL, voter_approval_rate REAL,
-                de_minimis_rate REAL, proposed_rate REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS public_notices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                notice_type TEXT NOT NULL, form_number TEXT,
-                taxing_unit TEXT NOT NULL, proposed_rate REAL,
-                no_new_revenue_rate REAL, voter_approval_rate REAL,
-                meeting_date TEXT, meeting_time TEXT,
-                meeting_location TEXT, notice_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ballots_petitions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ballot_type TEXT NOT NULL, form_number TEXT,
-                taxing_unit TEXT NOT NULL, proposed_rate REAL,
-                election_date TEXT, language TEXT, ballot_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS school_district_forms (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                form_type TEXT NOT NULL, form_number TEXT,
-                school_district TEXT NOT NULL, county TEXT, tax_year TEXT,
-                current_value REAL, mo_portion REAL, debt_portion REAL,
-                total_rate REAL, has_chapter_313 BOOLEAN,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS water_district_forms (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                district_type TEXT NOT NULL, form_number TEXT,
-                district_name TEXT NOT NULL, county TEXT, tax_year TEXT,
-                proposed_rate REAL, hearing_date TEXT, hearing_time TEXT,
-                hearing_location TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS form_submissions_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                form_category TEXT NOT NULL, form_id INTEGER,
-                action TEXT NOT NULL, user_info TEXT,
-                ip_address TEXT, submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-    conn.commit()
+    Once the schema is current this is a single SELECT on schema_version, so
+    it is cheap to run in every gunicorn worker at import time.
+    """
+    conn = get_conn()
+    applied = migrations.migrate(conn, DB_MODE)
     conn.close()
-    print(f"Database initialized successfully ({DB_MODE})")
+    if applied:
+        print(f"Database migrated to version {applied[-1]} ({DB_MODE})")
+    else:
+        print(f"Database schema is current ({DB_MODE})")
+    try:
+        maintain_audit_partitions()
+    except Exception as e:
+        print(f"Warning: audit log partition maintenance failed: {e}")
+    return applied
 
 def insert_and_get_id(cursor, sql, params):
     """Insert a row and return the new ID"""
@@ -321,279 +394,875 @@ def insert_and_get_id(cursor, sql, params):
         cursor.execute(sql, params)
         return cursor.lastrowid
 
+# URL category -> table name
+CATEGORY_TABLES = {
+    'tax-rate': 'tax_rate_calculations',
+    'notices': 'public_notices',
+    'ballots': 'ballots_petitions',
+    'school': 'school_district_forms',
+    'water': 'water_district_forms'
+}
+
+# Columns of each form table, in schema order (used to validate ?fields=)
+TABLE_COLUMNS = {
+    'tax_rate_calculations': [
+        'id', 'form_type', 'taxing_unit', 'county', 'tax_year', 'last_year_levy',
+        'last_year_mo_rate', 'last_year_debt_rate', 'current_total_value',
+        'new_property_value', 'lost_property_levy', 'proposed_mo_rate',
+        'proposed_debt_rate', 'total_debt', 'tax_increments', 'is_disaster_area',
+        'no_new_revenue_rate', 'voter_approval_rate', 'de_minimis_rate',
+        'proposed_rate', 'created_at', 'updated_at', 'row_version'
+    ],
+    'public_notices': [
+        'id', 'notice_type', 'form_number', 'taxing_unit', 'proposed_rate',
+        'no_new_revenue_rate', 'voter_approval_rate', 'meeting_date',
+        'meeting_time', 'meeting_location', 'notice_text', 'created_at', 'updated_at',
+        'row_version'
+    ],
+    'ballots_petitions': [
+        'id', 'ballot_type', 'form_number', 'taxing_unit', 'proposed_rate',
+        'election_date', 'language', 'ballot_text', 'created_at', 'updated_at',
+        'row_version'
+    ],
+    'school_district_forms': [
+        'id', 'form_type', 'form_number', 'school_district', 'county', 'tax_year',
+        'current_value', 'mo_portion', 'debt_portion', 'total_rate',
+        'has_chapter_313', 'created_at', 'updated_at', 'row_version'
+    ],
+    'water_district_forms': [
+        'id', 'district_type', 'form_number', 'district_name', 'county', 'tax_year',
+        'proposed_rate', 'hearing_date', 'hearing_time', 'hearing_location',
+        'created_at', 'updated_at', 'row_version'
+    ]
+}
+
+# Query-string filter -> column, per table. School and water districts store
+# the taxing unit name in their own column.
+TABLE_FILTERS = {
+    'tax_rate_calculations': {'county': 'county', 'tax_year': 'tax_year', 'taxing_unit': 'taxing_unit'},
+    'public_notices': {'taxing_unit': 'taxing_unit'},
+    'ballots_petitions': {'taxing_unit': 'taxing_unit'},
+    'school_district_forms': {'county': 'county', 'tax_year': 'tax_year', 'taxing_unit': 'school_district'},
+    'water_district_forms': {'county': 'county', 'tax_year': 'tax_year', 'taxing_unit': 'district_name'}
+}
+FILTER_PARAMS = ('county', 'tax_year', 'taxing_unit')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class InvalidQuery(Exception):
+    """A request parameter could not be applied (reported as HTTP 400)"""
+
+class UnsupportedFilter(InvalidQuery):
+    """A filter names a column the table does not have"""
+
+def parse_limit(args):
+    """Read ?limit= (defaults to DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE)"""
+    raw = args.get('limit')
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise InvalidQuery("limit must be an integer")
+    if limit < 1:
+        raise InvalidQuery("limit must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_fields(table_name, raw):
+    """Columns to select for ?fields=a,b (id and created_at are always included)"""
+    columns = TABLE_COLUMNS[table_name]
+    if not raw:
+        return columns
+    requested = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in columns]
+    if unknown:
+        raise InvalidQuery(f"Unknown field(s) for {table_name}: {', '.join(unknown)}")
+    return [c for c in columns if c in ('id', 'created_at') or c in requested]
+
+def encode_cursor(value):
+    """Opaque, URL-safe page cursor"""
+    raw = json.dumps(value, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidQuery("Invalid cursor")
+
+def cursor_timestamp(value):
+    """created_at as a string the database can compare against"""
+    if isinstance(value, datetime):
+        text = value.isoformat(sep=' ')
+        # SQL Server DATETIME only accepts millisecond precision
+        return text[:23] if DB_MODE == 'sqlserver' else text
+    return value
+
+def page_query(table_name, args, after=None):
+    """(sql, params, limit) for one page of a form table, newest first, keyset-paginated on (created_at, id)
+
+    The SQL uses ? placeholders and fetches limit + 1 rows; page_result()
+    trims the extra one.
+    """
+    limit = parse_limit(args)
+    columns = parse_fields(table_name, args.get('fields'))
+
+    where, params = [], []
+    for name in FILTER_PARAMS:
+        value = args.get(name)
+        if value is None:
+            continue
+        column = TABLE_FILTERS[table_name].get(name)
+        if column is None:
+            raise UnsupportedFilter(f"{table_name} cannot be filtered by {name}")
+        where.append(f'{column} = ?')
+        params.append(value)
+    if after is not None:
+        if not (isinstance(after, list) and len(after) == 2):
+            raise InvalidQuery("Invalid cursor")
+        where.append('(created_at < ? OR (created_at = ? AND id < ?))')
+        params.extend([after[0], after[0], after[1]])
+
+    select = ', '.join(columns)
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+    if DB_MODE == 'sqlserver':
+        sql = f'SELECT TOP ({limit + 1}) {select} FROM {table_name}{where_sql} ORDER BY created_at DESC, id DESC'
+    else:
+        sql = f'SELECT {select} FROM {table_name}{where_sql} ORDER BY created_at DESC, id DESC LIMIT {limit + 1}'
+    return sql, tuple(params), limit
+
+def page_result(rows, limit):
+    """(rows, next_position) from the limit + 1 rows page_query() fetched"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, [cursor_timestamp(last['created_at']), last['id']]
+
+def fetch_page(cursor, table_name, args, after=None):
+    """Fetch one page of a form table (see page_query)
+
+    Returns (rows, next_position); next_position is None on the last page.
+    """
+    sql, params, limit = page_query(table_name, args, after)
+    cursor.execute(p(sql), params)
+    return page_result(rows_to_dicts(cursor, cursor.fetchmany(limit + 1)), limit)
+
+# GET response cache (per worker). RESPONSE_CACHE=off disables it.
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE', 'on').lower() not in ('off', 'false', '0')
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 512)),
+    max_bytes=int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+)
+
+def read_table_versions(tables):
+    """Current data_version of each table, from table_stats"""
+    conn = get_read_conn()
+    cursor = conn.cursor()
+    cursor.execute('SELECT table_name, data_version FROM table_stats')
+    versions = {row[0]: row[1] for row in cursor.fetchall() if row[0] in tables}
+    conn.close()
+    return versions
+
+def cached_response(tables_for):
+    """Cache a GET route's 200 responses and answer If-None-Match with 304
+
+    `tables_for(**view_args)` names the tables the response is built from
+    (None skips caching). Versions are read before the view runs, so a body
+    is never older than the ETag it is stored under.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            tables = tables_for(**kwargs) if RESPONSE_CACHE_ENABLED else None
+            if not tables:
+                return view(*args, **kwargs)
+
+            versions = read_table_versions(tables)
+            key = request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+            etag = make_etag(key, versions)
+
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                response_cache.record_not_modified()
+                response = app.response_class(status=304)
+            else:
+                entry = response_cache.get(key, etag)
+                if entry is None:
+                    response = app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    entry = CachedResponse(etag, response.get_data(), 200, response.mimetype)
+                    response_cache.put(key, entry)
+                response = app.response_class(entry.body, status=entry.status, mimetype=entry.mimetype)
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def category_tables(category=None):
+    table_name = CATEGORY_TABLES.get(category)
+    return [table_name] if table_name else None
+
+# Output of build_frontend.py: precompiled pages plus content-hashed assets
+DIST_DIR = os.path.join(BASE_DIR, 'dist')
+BUILT_PAGES = ('truth-in-taxation-complete.html', 'truth-in-taxation-edge.html')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def send_static(directory, filename):
+    """send_from_directory, preferring a fresh .br/.gz sidecar the client accepts"""
+    path = safe_join(directory, filename)
+    if path and os.path.isfile(path) and filename.endswith(compression.STATIC_EXTENSIONS):
+        sidecar, encoding = compression.find_sidecar(path, request.headers.get('Accept-Encoding'))
+        if sidecar:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(directory, os.path.relpath(sidecar, directory),
+                                           mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(directory, filename)
+        compression.add_vary(response)
+        return response
+    return send_from_directory(directory, filename)
+
+def serve_page(filename):
+    """Serve the built page when dist/ exists, else the in-browser Babel source"""
+    if os.path.isfile(os.path.join(DIST_DIR, filename)):
+        response = send_static(DIST_DIR, filename)
+    else:
+        response = send_static(BASE_DIR, filename)
+    # Pages must be revalidated so new asset hashes are picked up after a deploy
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/')
 def serve_home():
     """Serve the main HTML page"""
-    return send_from_directory(BASE_DIR, 'truth-in-taxation-complete.html')
+    return serve_page('truth-in-taxation-complete.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve static files"""
+    if filename in BUILT_PAGES:
+        return serve_page(filename)
+    if filename.startswith('dist/'):
+        response = send_static(DIST_DIR, filename[len('dist/'):])
+        if filename.startswith('dist/assets/'):
+            # Hashed filenames never change content
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
     return send_from_directory(BASE_DIR, filename)
 
+@app.route('/api/pool', methods=['GET'])
+def get_pool_stats():
+    """Get connection pool statistics for this worker"""
+    data = pool.stats()
+    if replica_router is not None:
+        data['replication'] = replica_router.stats()
+    return jsonify({"status": "success", "data": data}), 200
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """Get response cache statistics for this worker"""
+    return jsonify({"status": "success", "data": response_cache.stats()}), 200
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, database and pool metrics for this worker (Prometheus text format)"""
+    return Response(request_metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route('/api/init', methods=['GET'])
 def initialize():
     """Initialize the database"""
     try:
         init_db()
-        return jsonify({"status": "success", "message": "Database initialized"}), 200
+        return jsonify({
+            "status": "success",
+            "message": "Database initialized",
+            "schema_version": migrations.LATEST_VERSION
+        }), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/tax-rate-calculation', methods=['POST'])
-def save_tax_rate_calculation():
-    """Save tax rate calculation"""
+# Form categories (as recorded in form_submissions_log) -> table and the
+# JSON key -> column mapping used by the save routes
+FORM_SPECS = {
+    'tax_rate_calculation': {
+        'route': 'tax-rate-calculation',
+        'table': 'tax_rate_calculations',
+        'label': 'Tax rate calculation',
+        'fields': [
+            ('formType', 'form_type'), ('taxingUnit', 'taxing_unit'), ('county', 'county'),
+            ('taxYear', 'tax_year'), ('lastYearLevy', 'last_year_levy'),
+            ('lastYearMORate', 'last_year_mo_rate'), ('lastYearDebtRate', 'last_year_debt_rate'),
+            ('currentTotalValue', 'current_total_value'), ('newPropertyValue', 'new_property_value'),
+            ('lostPropertyLevy', 'lost_property_levy'), ('proposedMORate', 'proposed_mo_rate'),
+            ('proposedDebtRate', 'proposed_debt_rate'), ('totalDebt', 'total_debt'),
+            ('taxIncrements', 'tax_increments'), ('isDisasterArea', 'is_disaster_area'),
+            ('noNewRevenueRate', 'no_new_revenue_rate'), ('voterApprovalRate', 'voter_approval_rate'),
+            ('deMinimisRate', 'de_minimis_rate'), ('proposedRate', 'proposed_rate')
+        ],
+        'required': ['formType', 'taxingUnit'],
+        'numeric': [
+            'lastYearLevy', 'lastYearMORate', 'lastYearDebtRate', 'currentTotalValue',
+            'newPropertyValue', 'lostPropertyLevy', 'proposedMORate', 'proposedDebtRate',
+            'totalDebt', 'taxIncrements', 'noNewRevenueRate', 'voterApprovalRate',
+            'deMinimisRate', 'proposedRate'
+        ],
+        'boolean': ['isDisasterArea']
+    },
+    'public_notice': {
+        'route': 'public-notice',
+        'table': 'public_notices',
+        'label': 'Public notice',
+        'fields': [
+            ('noticeType', 'notice_type'), ('formNumber', 'form_number'),
+            ('taxingUnit', 'taxing_unit'), ('proposedRate', 'proposed_rate'),
+            ('noNewRevenueRate', 'no_new_revenue_rate'), ('voterApprovalRate', 'voter_approval_rate'),
+            ('meetingDate', 'meeting_date'), ('meetingTime', 'meeting_time'),
+            ('meetingLocation', 'meeting_location'), ('noticeText', 'notice_text')
+        ],
+        'required': ['noticeType', 'taxingUnit'],
+        'numeric': ['proposedRate', 'noNewRevenueRate', 'voterApprovalRate'],
+        'boolean': []
+    },
+    'ballot_petition': {
+        'route': 'ballot-petition',
+        'table': 'ballots_petitions',
+        'label': 'Ballot/Petition',
+        'fields': [
+            ('ballotType', 'ballot_type'), ('formNumber', 'form_number'),
+            ('taxingUnit', 'taxing_unit'), ('proposedRate', 'proposed_rate'),
+            ('electionDate', 'election_date'), ('language', 'language'),
+            ('ballotText', 'ballot_text')
+        ],
+        'required': ['ballotType', 'taxingUnit'],
+        'numeric': ['proposedRate'],
+        'boolean': []
+    },
+    'school_district': {
+        'route': 'school-district',
+        'table': 'school_district_forms',
+        'label': 'School district form',
+        'fields': [
+            ('formType', 'form_type'), ('formNumber', 'form_number'),
+            ('schoolDistrict', 'school_district'), ('county', 'county'), ('taxYear', 'tax_year'),
+            ('currentValue', 'current_value'), ('moPortion', 'mo_portion'),
+            ('debtPortion', 'debt_portion'), ('totalRate', 'total_rate'),
+            ('hasChapter313', 'has_chapter_313')
+        ],
+        'required': ['formType', 'schoolDistrict'],
+        'numeric': ['currentValue', 'moPortion', 'debtPortion', 'totalRate'],
+        'boolean': ['hasChapter313']
+    },
+    'water_district': {
+        'route': 'water-district',
+        'table': 'water_district_forms',
+        'label': 'Water district form',
+        'fields': [
+            ('districtType', 'district_type'), ('formNumber', 'form_number'),
+            ('districtName', 'district_name'), ('county', 'county'), ('taxYear', 'tax_year'),
+            ('proposedRate', 'proposed_rate'), ('hearingDate', 'hearing_date'),
+            ('hearingTime', 'hearing_time'), ('hearingLocation', 'hearing_location')
+        ],
+        'required': ['districtType', 'districtName'],
+        'numeric': ['proposedRate'],
+        'boolean': []
+    }
+}
+ROUTE_CATEGORIES = {spec['route']: category for category, spec in FORM_SPECS.items()}
+TABLE_SPECS = {spec['table']: spec for spec in FORM_SPECS.values()}
+
+def bump_table_stats(cursor, table_name, delta=0):
+    """Record a write to `table_name` inside the caller's transaction
+
+    Adjusts the /api/stats row count by `delta` and bumps the table's
+    data_version, which invalidates cached GET responses that depend on it.
+    """
+    cursor.execute(p('UPDATE table_stats SET row_count = row_count + ?, '
+                     'data_version = data_version + 1 WHERE table_name = ?'),
+                   (delta, table_name))
+
+# Audit trail writer. AUDIT_LOG_MODE=strict inserts form_submissions_log rows
+# in the request's transaction (the original behaviour); async (default)
+# spools them to AUDIT_SPOOL_DIR and writes them in batches on a background
+# thread every AUDIT_FLUSH_INTERVAL seconds or AUDIT_BATCH_SIZE events.
+audit_writer = AuditWriter(
+    get_conn, DB_MODE,
+    spool_dir=os.environ.get('AUDIT_SPOOL_DIR') or os.path.join(BASE_DIR, 'audit_spool'),
+    mode=os.environ.get('AUDIT_LOG_MODE', 'async').lower(),
+    batch_size=int(os.environ.get('AUDIT_BATCH_SIZE', 500)),
+    flush_interval=float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0)),
+    fsync=os.environ.get('AUDIT_SPOOL_FSYNC', '').lower() == 'true',
+    on_flush=lambda cursor, count: bump_table_stats(cursor, 'form_submissions_log', count),
+)
+atexit.register(audit_writer.close)
+
+request_metrics.add_collector('tit_db_pool', pool.stats, counters=(
+    'acquired', 'waits', 'wait_seconds', 'timeouts', 'created', 'recycled',
+    'failed_checks', 'discarded'))
+request_metrics.add_collector('tit_response_cache', response_cache.stats, counters=(
+    'hits', 'misses', 'not_modified', 'evictions'))
+request_metrics.add_collector('tit_sqlite_writes', lambda: dict(sqlite_writes),
+                              counters=('transactions', 'retries'))
+request_metrics.add_collector('tit_audit_log', audit_writer.stats, counters=(
+    'queued', 'written', 'batches', 'failures', 'recovered'))
+
+def form_columns(spec):
+    return [column for _, column in spec['fields']]
+
+def form_insert_sql(spec):
+    columns = form_columns(spec)
+    return (f"INSERT INTO {spec['table']} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})")
+
+def form_params(spec, data):
+    """Column values for a posted form, in FORM_SPECS field order"""
+    return tuple(data.get(key) for key, _ in spec['fields'])
+
+# Idempotency-Key support on the save endpoints (see idempotency.py). Keys
+# are remembered for IDEMPOTENCY_KEY_TTL seconds. With IDEMPOTENCY_DEDUP=content
+# (default) a request without a key whose body matches one from the same
+# client in the last IDEMPOTENCY_DEDUP_WINDOW seconds is treated as a retry;
+# set IDEMPOTENCY_DEDUP=off to always insert.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+IDEMPOTENCY_DEDUP = os.environ.get('IDEMPOTENCY_DEDUP', 'content').lower()
+IDEMPOTENCY_DEDUP_WINDOW = int(os.environ.get('IDEMPOTENCY_DEDUP_WINDOW', 60))
+idempotency_purger = idempotency.Purger(int(os.environ.get('IDEMPOTENCY_PURGE_INTERVAL', 300)))
+
+def current_request_key():
+    """The request's idempotency.RequestKey, or None"""
+    return idempotency.request_key(
+        request.path, request.headers.get('Idempotency-Key'), request.get_data(),
+        request.remote_addr, IDEMPOTENCY_KEY_TTL, IDEMPOTENCY_DEDUP, IDEMPOTENCY_DEDUP_WINDOW)
+
+def recorded_response(key):
+    """The response recorded under `key`, replayed, or None"""
+    if key is None:
+        return None
+    conn = get_conn()
     try:
-        data = request.json
-        conn = get_conn()
-        cursor = conn.cursor()
-
-        form_id = insert_and_get_id(cursor, '''
-            INSERT INTO tax_rate_calculations (
-                form_type, taxing_unit, county, tax_year, last_year_levy,
-                last_year_mo_rate, last_year_debt_rate, current_total_value,
-                new_property_value, lost_property_levy, proposed_mo_rate,
-                proposed_debt_rate, total_debt, tax_increments, is_disaster_area,
-                no_new_revenue_rate, voter_approval_rate, de_minimis_rate, proposed_rate
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('formType'), data.get('taxingUnit'), data.get('county'),
-            data.get('taxYear'), data.get('lastYearLevy'), data.get('lastYearMORate'),
-            data.get('lastYearDebtRate'), data.get('currentTotalValue'),
-            data.get('newPropertyValue'), data.get('lostPropertyLevy'),
-            data.get('proposedMORate'), data.get('proposedDebtRate'),
-            data.get('totalDebt'), data.get('taxIncrements'),
-            data.get('isDisasterArea'), data.get('noNewRevenueRate'),
-            data.get('voterApprovalRate'), data.get('deMinimisRate'),
-            data.get('proposedRate')
-        ))
-
-        cursor.execute(p('''
-            INSERT INTO form_submissions_log (form_category, form_id, action, ip_address)
-            VALUES (?, ?, ?, ?)
-        '''), ('tax_rate_calculation', form_id, 'create', request.remote_addr))
-
-        conn.commit()
+        found = idempotency.lookup(conn.cursor(), PARAM, key)
+    finally:
         conn.close()
-
-        return jsonify({
-            "status": "success",
-            "message": "Tax rate calculation saved successfully",
-            "id": form_id
-        }), 201
+    if found is None:
+        return None
+    status, body = found
+    return jsonify(body), status, {'Idempotent-Replayed': 'true'}
+
+def claim_request_key(cursor, key):
+    if key is not None:
+        idempotency_purger.maybe_purge(cursor, PARAM)
+        idempotency.claim(cursor, PARAM, key)
+
+def idempotency_error(e):
+    """Error response for an idempotency exception"""
+    if isinstance(e, idempotency.RequestInProgress):
+        return jsonify({"status": "error", "message": "A request with this key is still in progress"}), \
+            409, {'Retry-After': '1'}
+    return jsonify({"status": "error", "message": str(e)}), 422 if isinstance(e, idempotency.KeyReused) else 400
+
+def save_form(category):
+    """Insert one posted form plus its audit log row
+
+    A repeat of an earlier request (same Idempotency-Key, or the same body
+    within the dedup window) gets the original response and writes nothing.
+    """
+    spec = FORM_SPECS[category]
+    try:
+        key = current_request_key()
+        replay = recorded_response(key)
+        if replay:
+            return replay
+        data = request.json
+        remote_addr = request.remote_addr
+
+        def work(cursor):
+            claim_request_key(cursor, key)
+            params = form_params(spec, data)
+            form_id = insert_and_get_id(cursor, form_insert_sql(spec), params)
+            bump_table_stats(cursor, spec['table'], 1)
+            if spec['table'] == rollups.SOURCE_TABLE:
+                rollups.apply(cursor, DB_MODE, added=[dict(zip(form_columns(spec), params))])
+            events = [audit_event(category, form_id, 'create', remote_addr)]
+            audit_writer.in_transaction(cursor, events)
+            body = {
+                "status": "success",
+                "message": f"{spec['label']} saved successfully",
+                "id": form_id
+            }
+            if key is not None:
+                idempotency.complete(cursor, PARAM, key, 201, body)
+            return body, events
+
+        try:
+            body, events = write_transaction(work)
+        except Exception:
+            # A concurrent request with the same key committed first
+            replay = recorded_response(key)
+            if replay:
+                return replay
+            raise
+        audit_writer.after_commit(events)
+
+        return jsonify(body), 201
+    except (idempotency.IdempotencyError, idempotency.RequestInProgress) as e:
+        return idempotency_error(e)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/tax-rate-calculation', methods=['POST'])
+def save_tax_rate_calculation():
+    """Save tax rate calculation"""
+    return save_form('tax_rate_calculation')
+
 @app.route('/api/public-notice', methods=['POST'])
 def save_public_notice():
     """Save public notice"""
-    try:
-        data = request.json
-        conn = get_conn()
-        cursor = conn.cursor()
-
-        form_id = insert_and_get_id(cursor, '''
-            INSERT INTO public_notices (
-                notice_type, form_number, taxing_unit, proposed_rate,
-                no_new_revenue_rate, voter_approval_rate, meeting_date,
-                meeting_time, meeting_location, notice_text
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('noticeType'), data.get('formNumber'), data.get('taxingUnit'),
-            data.get('proposedRate'), data.get('noNewRevenueRate'),
-            data.get('voterApprovalRate'), data.get('meetingDate'),
-            data.get('meetingTime'), data.get('meetingLocation'),
-            data.get('noticeText')
-        ))
-
-        cursor.execute(p('''
-            INSERT INTO form_submissions_log (form_category, form_id, action, ip_address)
-            VALUES (?, ?, ?, ?)
-        '''), ('public_notice', form_id, 'create', request.remote_addr))
-
-        conn.commit()
-        conn.close()
-
-        return jsonify({
-            "status": "success",
-            "message": "Public notice saved successfully",
-            "id": form_id
-        }), 201
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+    return save_form('public_notice')
 
 @app.route('/api/ballot-petition', methods=['POST'])
 def save_ballot_petition():
     """Save ballot or petition"""
-    try:
-        data = request.json
-        conn = get_conn()
-        cursor = conn.cursor()
-
-        form_id = insert_and_get_id(cursor, '''
-            INSERT INTO ballots_petitions (
-                ballot_type, form_number, taxing_unit, proposed_rate,
-                election_date, language, ballot_text
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('ballotType'), data.get('formNumber'), data.get('taxingUnit'),
-            data.get('proposedRate'), data.get('electionDate'),
-            data.get('language'), data.get('ballotText')
-        ))
-
-        cursor.execute(p('''
-            INSERT INTO form_submissions_log (form_category, form_id, action, ip_address)
-            VALUES (?, ?, ?, ?)
-        '''), ('ballot_petition', form_id, 'create', request.remote_addr))
-
-        conn.commit()
-        conn.close()
-
-        return jsonify({
-            "status": "success",
-            "message": "Ballot/Petition saved successfully",
-            "id": form_id
-        }), 201
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+    return save_form('ballot_petition')
 
 @app.route('/api/school-district', methods=['POST'])
 def save_school_district():
     """Save school district form"""
+    return save_form('school_district')
+
+@app.route('/api/water-district', methods=['POST'])
+def save_water_district():
+    """Save water district form"""
+    return save_form('water_district')
+
+# Rows written per transaction by the batch endpoints
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 5000))
+
+def insert_form_rows(category, rows, remote_addr):
+    """Insert validated rows (form_params order) in one transaction with their audit rows; returns ids"""
+    spec = FORM_SPECS[category]
+    columns = form_columns(spec)
+
+    def work(cursor):
+        ids = bulk.insert_many(cursor, DB_MODE, spec['table'], columns, rows)
+        bump_table_stats(cursor, spec['table'], len(ids))
+        if spec['table'] == rollups.SOURCE_TABLE:
+            rollups.apply(cursor, DB_MODE, added=[dict(zip(columns, row)) for row in rows])
+        events = [audit_event(category, form_id, 'create', remote_addr) for form_id in ids]
+        audit_writer.in_transaction(cursor, events)
+        return ids, events
+
+    ids, events = write_transaction(work)
+    audit_writer.after_commit(events)
+    return ids
+
+@app.route('/api/<form_route>/batch', methods=['POST'])
+def save_form_batch(form_route):
+    """Save many forms of one category from a JSON array or NDJSON body
+
+    Every record is validated first; valid records are written in chunked
+    transactions together with their audit log rows, and the response lists
+    an id or an error for each input record by index. Repeats are answered
+    from the idempotency record, as for the single-form routes.
+    """
+    category = ROUTE_CATEGORIES.get(form_route)
+    if not category:
+        return jsonify({"status": "error", "message": "Invalid form category"}), 404
+
     try:
-        data = request.json
-        conn = get_conn()
-        cursor = conn.cursor()
+        records = bulk.parse_batch(request.get_data(), request.content_type or '')
+    except bulk.BatchFormatError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-        form_id = insert_and_get_id(cursor, '''
-            INSERT INTO school_district_forms (
-                form_type, form_number, school_district, county, tax_year,
-                current_value, mo_portion, debt_portion, total_rate, has_chapter_313
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('formType'), data.get('formNumber'), data.get('schoolDistrict'),
-            data.get('county'), data.get('taxYear'), data.get('currentValue'),
-            data.get('moPortion'), data.get('debtPortion'),
-            data.get('totalRate'), data.get('hasChapter313')
-        ))
-
-        cursor.execute(p('''
-            INSERT INTO form_submissions_log (form_category, form_id, action, ip_address)
-            VALUES (?, ?, ?, ?)
-        '''), ('school_district', form_id, 'create', request.remote_addr))
-
-        conn.commit()
-        conn.close()
+    # The key is claimed in its own transaction, since the chunks commit separately
+    try:
+        key = current_request_key()
+        replay = recorded_response(key)
+        if replay:
+            return replay
+        if key is not None:
+            try:
+                write_transaction(lambda cursor: claim_request_key(cursor, key))
+            except Exception:
+                replay = recorded_response(key)
+                if replay:
+                    return replay
+                raise
+    except (idempotency.IdempotencyError, idempotency.RequestInProgress) as e:
+        return idempotency_error(e)
+
+    try:
+        body, code = insert_batch(category, records)
+    except BaseException:
+        if key is not None:
+            write_transaction(lambda cursor: idempotency.release(cursor, PARAM, key))
+        raise
+    if key is not None:
+        write_transaction(lambda cursor: idempotency.complete(cursor, PARAM, key, code, body))
+    return jsonify(body), code
+
+def insert_batch(category, records):
+    """Validate and insert parsed batch records; returns (response body, status code)"""
+    spec = FORM_SPECS[category]
+
+    results = [None] * len(records)
+    valid = []
+    for index, record in enumerate(records):
+        if isinstance(record, bulk.BatchFormatError):
+            results[index] = {"index": index, "error": str(record)}
+            continue
+        params, error = bulk.validate_record(spec, record)
+        if error:
+            results[index] = {"index": index, "error": error}
+        else:
+            valid.append((index, params))
+
+    size = bulk.chunk_size(DB_MODE, form_columns(spec), BULK_CHUNK_SIZE)
+    remote_addr = request.remote_addr
+
+    for start in range(0, len(valid), size):
+        chunk = valid[start:start + size]
+        try:
+            ids = insert_form_rows(category, [params for _, params in chunk], remote_addr)
+        except Exception as e:
+            for index, _ in chunk:
+                results[index] = {"index": index, "error": f"write failed: {e}"}
+            continue
+        for (index, _), form_id in zip(chunk, ids):
+            results[index] = {"index": index, "id": form_id}
+
+    inserted = sum(1 for r in results if 'id' in r)
+    failed = len(results) - inserted
+    if failed == 0:
+        status, code = "success", 201
+    elif inserted:
+        status, code = "partial", 207
+    else:
+        status, code = "error", 400
+    return {
+        "status": status,
+        "inserted": inserted,
+        "failed": failed,
+        "results": results
+    }, code
+
+@app.route('/api/rates/compute', methods=['POST'])
+def compute_rates():
+    """Compute no-new-revenue, voter-approval, de minimis and proposed rates
+
+    Body: a JSON array of taxing units (or {"units": [...]}) using the same
+    keys as POST /api/tax-rate-calculation, or {"columns": {key: [values]}}
+    for columnar input and output.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get('columns'), dict):
+            columns = data['columns']
+            if not all(isinstance(v, list) for v in columns.values()):
+                return jsonify({"status": "error", "message": "columns must map field names to arrays"}), 400
+            try:
+                rates = rate_engine.compute_columnar(columns)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            return jsonify({
+                "status": "success",
+                "count": len(rates['proposedRate']),
+                "columns": rates
+            }), 200
+
+        units = data.get('units') if isinstance(data, dict) else data
+        if not isinstance(units, list) or not all(isinstance(u, dict) for u in units):
+            return jsonify({"status": "error", "message": "Body must be a JSON array of taxing units"}), 400
 
         return jsonify({
             "status": "success",
-            "message": "School district form saved successfully",
-            "id": form_id
-        }), 201
+            "count": len(units),
+            "data": rate_engine.compute_batch(units)
+        }), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/water-district', methods=['POST'])
-def save_water_district():
-    """Save water district form"""
+# Largest grid POST /api/rates/scenarios/<id> evaluates in one request
+SCENARIO_MAX_POINTS = int(os.environ.get('SCENARIO_MAX_POINTS', 1000000))
+
+@app.route('/api/rates/scenarios/<int:id>', methods=['POST'])
+def sweep_rate_scenarios(id):
+    """Evaluate a grid of what-if inputs around a saved tax rate calculation
+
+    Body: {"axes": [{"field": input field, "values": [...]} or {"field",
+    "start", "stop", "num"|"step"}, ...], "outputs": [column, ...]}. Inputs
+    not swept keep their saved values. Columns are flattened in C order over
+    the axes as listed.
+    """
     try:
-        data = request.json
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"status": "error", "message": "Body must be a JSON object with axes"}), 400
+        try:
+            axes = scenarios.parse_axes(data.get('axes'), SCENARIO_MAX_POINTS)
+            outputs = data.get('outputs', list(scenarios.OUTPUT_FIELDS))
+            if not isinstance(outputs, list):
+                raise scenarios.ScenarioError("outputs must be a list of column names")
+        except scenarios.ScenarioError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
         conn = get_conn()
         cursor = conn.cursor()
-
-        form_id = insert_and_get_id(cursor, '''
-            INSERT INTO water_district_forms (
-                district_type, form_number, district_name, county, tax_year,
-                proposed_rate, hearing_date, hearing_time, hearing_location
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('districtType'), data.get('formNumber'), data.get('districtName'),
-            data.get('county'), data.get('taxYear'), data.get('proposedRate'),
-            data.get('hearingDate'), data.get('hearingTime'),
-            data.get('hearingLocation')
-        ))
-
-        cursor.execute(p('''
-            INSERT INTO form_submissions_log (form_category, form_id, action, ip_address)
-            VALUES (?, ?, ?, ?)
-        '''), ('water_district', form_id, 'create', request.remote_addr))
-
-        conn.commit()
+        cursor.execute(p('SELECT * FROM tax_rate_calculations WHERE id = ?'), (id,))
+        row = cursor.fetchone()
+        record = row_to_dict(cursor, row) if row else None
         conn.close()
+        if record is None:
+            return jsonify({"status": "error", "message": "Record not found"}), 404
+
+        base = {key: record[column] for key, column in FORM_SPECS['tax_rate_calculation']['fields']}
+        try:
+            result = scenarios.sweep(base, axes, outputs)
+        except scenarios.ScenarioError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
 
         return jsonify({
             "status": "success",
-            "message": "Water district form saved successfully",
-            "id": form_id
-        }), 201
+            "id": id,
+            "axes": [{"field": name, "values": values} for name, values in axes],
+            "shape": result['shape'],
+            "count": result['count'],
+            "columns": result['columns'],
+            "noticeTypes": list(scenarios.NOTICE_TYPES),
+            "thresholdBits": scenarios.THRESHOLDS,
+            "summary": result['summary']
+        }), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/submissions', methods=['GET'])
+@cached_response(lambda: list(CATEGORY_TABLES.values()))
 def get_all_submissions():
-    """Get all form submissions"""
-    try:
-        conn = get_conn()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM tax_rate_calculations ORDER BY created_at DESC')
-        tax_calcs = rows_to_dicts(cursor, cursor.fetchall())
-
-        cursor.execute('SELECT * FROM public_notices ORDER BY created_at DESC')
-        notices = rows_to_dicts(cursor, cursor.fetchall())
+    """Get one page of every form table
 
-        cursor.execute('SELECT * FROM ballots_petitions ORDER BY created_at DESC')
-        ballots = rows_to_dicts(cursor, cursor.fetchall())
+    Accepts the same limit/fields/county/tax_year/taxing_unit parameters as
+    /api/submissions/<category>; tables without a filtered column return no rows.
+    next_cursor continues only the tables that still have rows.
+    """
+    try:
+        token = request.args.get('cursor')
+        positions = decode_cursor(token) if token else None
+        if positions is not None and not isinstance(positions, dict):
+            raise InvalidQuery("Invalid cursor")
 
-        cursor.execute('SELECT * FROM school_district_forms ORDER BY created_at DESC')
-        school = rows_to_dicts(cursor, cursor.fetchall())
+        conn = get_read_conn()
+        cursor = conn.cursor()
 
-        cursor.execute('SELECT * FROM water_district_forms ORDER BY created_at DESC')
-        water = rows_to_dicts(cursor, cursor.fetchall())
+        data, next_positions = {}, {}
+        for table_name in CATEGORY_TABLES.values():
+            if positions is not None and table_name not in positions:
+                data[table_name] = []
+                continue
+            fields = request.args.get('fields')
+            args = request.args.to_dict()
+            # ?fields= names columns across all tables; keep the ones this table has
+            if fields:
+                wanted = [f.strip() for f in fields.split(',')]
+                args['fields'] = ','.join(f for f in wanted if f in TABLE_COLUMNS[table_name]) or 'id'
+            try:
+                rows, after = fetch_page(cursor, table_name, args,
+                                         positions.get(table_name) if positions else None)
+            except UnsupportedFilter:
+                rows, after = [], None
+            data[table_name] = rows
+            if after is not None:
+                next_positions[table_name] = after
 
         conn.close()
 
         return jsonify({
             "status": "success",
-            "data": {
-                "tax_rate_calculations": tax_calcs,
-                "public_notices": notices,
-                "ballots_petitions": ballots,
-                "school_district_forms": school,
-                "water_district_forms": water
-            }
+            "data": data,
+            "next_cursor": encode_cursor(next_positions) if next_positions else None
         }), 200
+    except InvalidQuery as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/submissions/<category>', methods=['GET'])
+@cached_response(category_tables)
 def get_submissions_by_category(category):
-    """Get submissions by category"""
+    """Get submissions by category
+
+    Query parameters: limit, cursor (from the previous page's next_cursor),
+    fields (comma-separated columns), county, tax_year, taxing_unit.
+    """
     try:
-        conn = get_conn()
+        table_name = CATEGORY_TABLES.get(category)
+        if not table_name:
+            return jsonify({"status": "error", "message": "Invalid category"}), 400
+
+        token = request.args.get('cursor')
+        after = decode_cursor(token) if token else None
+
+        conn = get_read_conn()
         cursor = conn.cursor()
 
-        table_map = {
-            'tax-rate': 'tax_rate_calculations',
-            'notices': 'public_notices',
-            'ballots': 'ballots_petitions',
-            'school': 'school_district_forms',
-            'water': 'water_district_forms'
-        }
+        results, next_position = fetch_page(cursor, table_name, request.args, after)
 
-        table_name = table_map.get(category)
-        if not table_name:
-            return jsonify({"status": "error", "message": "Invalid category"}), 400
+        conn.close()
 
-        cursor.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC')
-        results = rows_to_dicts(cursor, cursor.fetchall())
+        return jsonify({
+            "status": "success",
+            "data": results,
+            "next_cursor": encode_cursor(next_position) if next_position else None
+        }), 200
+    except InvalidQuery as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# SQL Server tables with an active full-text index, looked up once per worker
+sqlserver_fulltext_tables = None
+
+@app.route('/api/search', methods=['GET'])
+@cached_response(lambda: [table for table, _ in search.SEARCH_CATEGORIES.values()])
+def search_submissions():
+    """Ranked full-text search over notice and ballot text and meeting/hearing locations
 
+    Query parameters: q (words, "quoted phrases"), category (comma-separated:
+    notices, ballots, water; default all), limit, cursor.
+    """
+    global sqlserver_fulltext_tables
+    try:
+        terms = search.parse_query(request.args.get('q'))
+        raw_categories = request.args.get('category')
+        categories = [c.strip() for c in raw_categories.split(',') if c.strip()] \
+            if raw_categories else list(search.SEARCH_CATEGORIES)
+        unknown = [c for c in categories if c not in search.SEARCH_CATEGORIES]
+        if unknown or not categories:
+            raise InvalidQuery(f"Unknown search category: {', '.join(unknown) or raw_categories}")
+        limit = parse_limit(request.args)
+        token = request.args.get('cursor')
+        offset = decode_cursor(token) if token else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise InvalidQuery("Invalid cursor")
+
+        conn = get_read_conn()
+        cursor = conn.cursor()
+        if DB_MODE == 'sqlserver' and sqlserver_fulltext_tables is None:
+            sqlserver_fulltext_tables = search.sqlserver_fulltext_tables(cursor)
+        ranked = search.ranked_ids(cursor, DB_MODE, terms, categories, limit + 1, offset,
+                                   sqlserver_fulltext_tables or ())
+        hits = search.load_hits(cursor, DB_MODE, terms, ranked[:limit])
         conn.close()
 
         return jsonify({
             "status": "success",
-            "data": results
+            "data": hits,
+            "next_cursor": encode_cursor(offset + limit) if len(ranked) > limit else None
         }), 200
+    except (InvalidQuery, search.SearchQueryError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -601,18 +1270,10 @@ def get_submissions_by_category(category):
 def get_submission_by_id(category, id):
     """Get a specific submission by ID"""
     try:
-        conn = get_conn()
+        conn = get_read_conn()
         cursor = conn.cursor()
 
-        table_map = {
-            'tax-rate': 'tax_rate_calculations',
-            'notices': 'public_notices',
-            'ballots': 'ballots_petitions',
-            'school': 'school_district_forms',
-            'water': 'water_district_forms'
-        }
-
-        table_name = table_map.get(category)
+        table_name = CATEGORY_TABLES.get(category)
         if not table_name:
             return jsonify({"status": "error", "message": "Invalid category"}), 400
 
@@ -622,89 +1283,803 @@ def get_submission_by_id(category, id):
         conn.close()
 
         if result:
+            record = row_to_dict(cursor, result)
             return jsonify({
                 "status": "success",
-                "data": row_to_dict(cursor, result)
-            }), 200
+                "data": record
+            }), 200, {'ETag': record_etag(record['row_version'])}
         else:
             return jsonify({"status": "error", "message": "Record not found"}), 404
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def record_etag(row_version):
+    """ETag of one record: its row_version"""
+    return f'"v{row_version}"'
+
+def parse_if_match(header):
+    """None without If-Match, '*' for any version, else the set of row versions it names"""
+    if header is None:
+        return None
+    versions = set()
+    for tag in header.split(','):
+        # A compressed response's ETag carries an encoding suffix
+        tag = compression.strip_etag_encoding(tag.strip())
+        if tag == '*':
+            return '*'
+        # If-Match uses strong comparison, so weak (W/) tags never match
+        if len(tag) > 3 and tag[:2] == '"v' and tag[-1] == '"' and tag[2:-1].isdigit():
+            versions.add(int(tag[2:-1]))
+    return versions
+
+class RecordNotFound(Exception):
+    """The record to update does not exist"""
+
+class PreconditionFailed(Exception):
+    """If-Match names a version the record no longer has"""
+
+    def __init__(self, row_version):
+        super().__init__(f"Record has changed; current version is {row_version}")
+        self.row_version = row_version
+
+def select_for_update_sql(table_name):
+    """SELECT of one row by id that also locks it for the rest of the transaction"""
+    if DB_MODE == 'postgres':
+        return f'SELECT * FROM {table_name} WHERE id = ? FOR UPDATE'
+    if DB_MODE == 'sqlserver':
+        return f'SELECT * FROM {table_name} WITH (UPDLOCK, ROWLOCK) WHERE id = ?'
+    return f'SELECT * FROM {table_name} WHERE id = ?'
+
+def apply_patch(cursor, spec, id, changes, expected):
+    """Update one row in the caller's transaction; returns (new row, recomputed rate keys)
+
+    `changes` maps columns to new values and `expected` is parse_if_match()
+    output. Rows are only read first when a tax rate input or a rollup column
+    changes: the rates that depend on changed inputs are recomputed and the
+    rollups move the row from its old group to its new one. Otherwise this
+    is a single conditional UPDATE.
+    """
+    table_name = spec['table']
+    columns = dict(spec['fields'])
+    input_columns = {columns[key] for key in rate_engine.INPUT_FIELDS} \
+        if table_name == rollups.SOURCE_TABLE else set()
+    changes = dict(changes)
+    old, recomputed = None, []
+
+    if any(c in input_columns or c in rollups.SOURCE_COLUMNS for c in changes) and input_columns:
+        cursor.execute(p(select_for_update_sql(table_name)), (id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise RecordNotFound()
+        old = row_to_dict(cursor, row)
+        if expected not in (None, '*') and old['row_version'] not in expected:
+            raise PreconditionFailed(old['row_version'])
+        expected = {old['row_version']}
+
+        changed = [key for key in rate_engine.INPUT_FIELDS if columns[key] in changes
+                   and rate_engine.input_changed(key, old[columns[key]], changes[columns[key]])]
+        recomputed = rate_engine.rates_affected_by(changed)
+        if recomputed:
+            unit = {key: changes.get(column, old[column]) for key, column in spec['fields']}
+            rates = rate_engine.compute_unit_rates(unit)
+            changes.update({columns[key]: rates[key] for key in recomputed})
+
+    assignments = [f'{column} = ?' for column in changes]
+    assignments += ['updated_at = CURRENT_TIMESTAMP', 'row_version = row_version + 1']
+    where, params = ['id = ?'], list(changes.values()) + [id]
+    if expected not in (None, '*'):
+        where.append(f"row_version IN ({', '.join('?' for _ in expected)})" if expected else '1 = 0')
+        params.extend(sorted(expected))
+    cursor.execute(p(f"UPDATE {table_name} SET {', '.join(assignments)} WHERE {' AND '.join(where)}"),
+                   tuple(params))
+    if cursor.rowcount == 0:
+        cursor.execute(p(f'SELECT row_version FROM {table_name} WHERE id = ?'), (id,))
+        current = cursor.fetchone()
+        if current is None:
+            raise RecordNotFound()
+        raise PreconditionFailed(current[0])
+
+    cursor.execute(p(f'SELECT * FROM {table_name} WHERE id = ?'), (id,))
+    new = row_to_dict(cursor, cursor.fetchone())
+    if old is not None:
+        rollups.apply(cursor, DB_MODE, added=[new], removed=[old])
+    bump_table_stats(cursor, table_name)
+    return new, recomputed
+
+@app.route('/api/submission/<category>/<int:id>', methods=['PATCH'])
+def update_submission(category, id):
+    """Change some fields of a submission
+
+    Body: only the changed fields, keyed as when the form was saved. Send
+    If-Match with the record's ETag ("v<row_version>", from GET or an
+    earlier PATCH) to update that version only: a concurrent edit makes the
+    request fail with 412 instead of being overwritten. Tax rate
+    calculations recompute the rates whose inputs changed; the rates cannot
+    be set directly.
+    """
+    table_name = CATEGORY_TABLES.get(category)
+    if not table_name:
+        return jsonify({"status": "error", "message": "Invalid category"}), 400
+    spec = TABLE_SPECS[table_name]
+    read_only = rate_engine.RATE_FIELDS if table_name == rollups.SOURCE_TABLE else ()
+    changes, error = bulk.validate_patch(spec, request.get_json(silent=True), read_only)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+    expected = parse_if_match(request.headers.get('If-Match'))
+    remote_addr = request.remote_addr
+
+    try:
+        def work(cursor):
+            record, recomputed = apply_patch(cursor, spec, id, changes, expected)
+            events = [audit_event(category, id, 'update', remote_addr)]
+            audit_writer.in_transaction(cursor, events)
+            return record, recomputed, events
+
+        record, recomputed, events = write_transaction(work)
+        audit_writer.after_commit(events)
+
+        return jsonify({
+            "status": "success",
+            "message": "Record updated successfully",
+            "recomputed": recomputed,
+            "data": record
+        }), 200, {'ETag': record_etag(record['row_version'])}
+    except RecordNotFound:
+        return jsonify({"status": "error", "message": "Record not found"}), 404
+    except PreconditionFailed as e:
+        return jsonify({"status": "error", "message": str(e), "row_version": e.row_version}), 412, \
+            {'ETag': record_etag(e.row_version)}
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/submission/<category>/<int:id>', methods=['DELETE'])
 def delete_submission(category, id):
     """Delete a submission"""
     try:
-        conn = get_conn()
+        table_name = CATEGORY_TABLES.get(category)
+        if not table_name:
+            return jsonify({"status": "error", "message": "Invalid category"}), 400
+        remote_addr = request.remote_addr
+
+        def work(cursor):
+            old = None
+            if table_name == rollups.SOURCE_TABLE:
+                cursor.execute(p(f'SELECT * FROM {table_name} WHERE id = ?'), (id,))
+                row = cursor.fetchone()
+                old = row_to_dict(cursor, row) if row else None
+            cursor.execute(p(f'DELETE FROM {table_name} WHERE id = ?'), (id,))
+            deleted = max(cursor.rowcount, 0)
+            if deleted:
+                bump_table_stats(cursor, table_name, -deleted)
+                # Only the transaction that actually deleted the row subtracts it
+                if old:
+                    rollups.apply(cursor, DB_MODE, removed=[old])
+            events = [audit_event(category, id, 'delete', remote_addr)]
+            audit_writer.in_transaction(cursor, events)
+            return events
+
+        events = write_transaction(work)
+        audit_writer.after_commit(events)
+
+        return jsonify({
+            "status": "success",
+            "message": "Record deleted successfully"
+        }), 200
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def resolve_export_table(name):
+    """Accept either a table name or a URL category (e.g. tax-rate)"""
+    return CATEGORY_TABLES.get(name, name)
+
+def stream_export(table_name, fmt, gzip):
+    """Export generator that owns its connection for the life of the stream"""
+    conn = get_read_conn()
+    try:
+        for chunk in export.export_table(conn, DB_MODE, table_name, fmt, gzip):
+            yield chunk
+    finally:
+        conn.close()
+
+@app.route('/api/export/<table>', methods=['GET'])
+def export_submissions(table):
+    """Stream a whole table as NDJSON or CSV (?format=ndjson|csv&gzip=1)"""
+    table_name = resolve_export_table(table)
+    fmt = request.args.get('format', 'ndjson')
+    gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    if table_name not in export.EXPORT_TABLES:
+        return jsonify({"status": "error", "message": "Invalid table"}), 400
+    if fmt not in export.FORMATS:
+        return jsonify({"status": "error", "message": "format must be ndjson or csv"}), 400
+
+    filename = export.export_filename(table_name, fmt, gzip)
+    return Response(
+        stream_with_context(stream_export(table_name, fmt, gzip)),
+        mimetype='application/gzip' if gzip else export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.cli.command('export')
+@click.argument('tables', nargs=-1)
+@click.option('--format', 'fmt', type=click.Choice(sorted(export.FORMATS)), default='ndjson')
+@click.option('--gzip', is_flag=True, help='Compress the output with gzip')
+@click.option('--output-dir', '-o', default='.', type=click.Path(file_okay=False),
+              help='Directory to write the export files to')
+def export_command(tables, fmt, gzip, output_dir):
+    """Export tables (default: all) to NDJSON/CSV files"""
+    os.makedirs(output_dir, exist_ok=True)
+    for table_name in [resolve_export_table(t) for t in tables] or export.EXPORT_TABLES:
+        if table_name not in export.EXPORT_TABLES:
+            raise click.BadParameter(f"Unknown table: {table_name}")
+        path = os.path.join(output_dir, export.export_filename(table_name, fmt, gzip))
+        with open(path, 'wb') as f:
+            for chunk in stream_export(table_name, fmt, gzip):
+                f.write(chunk)
+        click.echo(f"Exported {table_name} -> {path}")
+
+# Columnar snapshots (see snapshots.py); `flask snapshot` appends new parts
+# under SNAPSHOT_DIR
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or os.path.join(BASE_DIR, 'snapshots')
+LOG_COLUMNS = ['id', 'form_category', 'form_id', 'action', 'user_info', 'ip_address', 'submitted_at']
+
+def snapshot_kinds(table_name):
+    """(column, kind) of each column of an export table, typed from FORM_SPECS"""
+    if table_name == 'form_submissions_log':
+        return snapshots.column_kinds(LOG_COLUMNS)
+    spec = TABLE_SPECS[table_name]
+    fields = dict(spec['fields'])
+    return snapshots.column_kinds(TABLE_COLUMNS[table_name],
+                                  numeric=[fields[key] for key in spec['numeric']],
+                                  boolean=[fields[key] for key in spec['boolean']])
+
+def take_snapshot(table_name, fmt, after_id=0, updated_since=None):
+    conn = get_conn()
+    try:
+        return snapshots.snapshot_file(conn, DB_MODE, table_name, snapshot_kinds(table_name),
+                                       fmt, after_id, updated_since)
+    finally:
+        conn.close()
+
+def read_spool(spool):
+    with spool:
+        while True:
+            chunk = spool.read(export.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+@app.route('/api/snapshot/<table>', methods=['GET'])
+def get_snapshot(table):
+    """Typed Parquet/Arrow file of a table's rows past a watermark
+
+    Query parameters: format (parquet, arrow), after_id and updated_since.
+    The response's X-Snapshot-Last-Id and X-Snapshot-Updated-At headers are
+    the watermark to send next time.
+    """
+    table_name = resolve_export_table(table)
+    fmt = request.args.get('format', 'parquet')
+    if not snapshots.HAS_PYARROW:
+        return jsonify({"status": "error", "message": "Snapshots need pyarrow installed"}), 501
+    if table_name not in export.EXPORT_TABLES:
+        return jsonify({"status": "error", "message": "Invalid table"}), 400
+    if fmt not in snapshots.FORMATS:
+        return jsonify({"status": "error", "message": "format must be parquet or arrow"}), 400
+    try:
+        after_id = int(request.args.get('after_id', 0))
+    except ValueError:
+        return jsonify({"status": "error", "message": "after_id must be an integer"}), 400
+
+    try:
+        spool, watermark = take_snapshot(table_name, fmt, after_id, request.args.get('updated_since'))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    mimetype, extension = snapshots.FORMATS[fmt]
+    headers = {
+        'Content-Disposition': f'attachment; filename="{table_name}-{watermark.last_id}{extension}"',
+        'X-Snapshot-Rows': str(watermark.rows),
+        'X-Snapshot-Last-Id': str(watermark.last_id),
+    }
+    if watermark.updated_at is not None:
+        headers['X-Snapshot-Updated-At'] = cursor_timestamp(watermark.updated_at)
+    return Response(read_spool(spool), mimetype=mimetype, headers=headers)
+
+@app.cli.command('snapshot')
+@click.argument('tables', nargs=-1)
+@click.option('--format', 'fmt', type=click.Choice(sorted(snapshots.FORMATS)), default='parquet')
+@click.option('--output-dir', '-o', default=None, type=click.Path(file_okay=False),
+              help='Snapshot directory (default SNAPSHOT_DIR)')
+def snapshot_command(tables, fmt, output_dir):
+    """Append the rows added or updated since the last snapshot to Parquet/Arrow part files"""
+    if not snapshots.HAS_PYARROW:
+        raise click.ClickException("Snapshots need pyarrow: pip install pyarrow")
+    directory = output_dir or SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    manifest = snapshots.read_manifest(directory)
+    for table_name in [resolve_export_table(t) for t in tables] or export.EXPORT_TABLES:
+        if table_name not in export.EXPORT_TABLES:
+            raise click.BadParameter(f"Unknown table: {table_name}")
+        state = manifest['tables'].get(table_name, {})
+        spool, watermark = take_snapshot(table_name, fmt, state.get('last_id', 0), state.get('updated_at'))
+        with spool:
+            if not watermark.rows:
+                click.echo(f"{table_name}: no new rows")
+                continue
+            name = snapshots.append_part(directory, table_name, spool, watermark, fmt,
+                                         manifest, cursor_timestamp)
+        snapshots.write_manifest(directory, manifest)
+        click.echo(f"{table_name}: {watermark.rows} rows -> {name}")
+
+# Server-side PDFs (see pdf_render.py), cached in PDF_CACHE_DIR under the
+# record id and updated_at. Requests for at least PDF_POOL_MIN_BATCH records
+# render on a pool of PDF_WORKERS processes (default: one per CPU) that each
+# worker starts on first use.
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or os.path.join(BASE_DIR, 'pdf_cache')
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 0)) or os.cpu_count() or 1
+PDF_POOL_MIN_BATCH = int(os.environ.get('PDF_POOL_MIN_BATCH', 16))
+pdf_cache = pdf_render.PdfCache(PDF_CACHE_DIR)
+pdf_executor = None
+pdf_executor_lock = threading.Lock()
+
+request_metrics.add_collector('tit_pdf_cache', pdf_cache.stats, counters=('hits', 'misses', 'stored'))
+
+def get_pdf_executor():
+    """This worker's render process pool, started on first use"""
+    global pdf_executor
+    with pdf_executor_lock:
+        if pdf_executor is None:
+            # spawn rather than fork: this process holds pooled connections and threads
+            pdf_executor = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(pdf_executor.shutdown, cancel_futures=True)
+        return pdf_executor
+
+def reset_pdf_executor():
+    global pdf_executor
+    pdf_executor = None
+
+# A pool inherited from a preloading parent has no processes in the child
+os.register_at_fork(after_in_child=reset_pdf_executor)
+
+def records_query(table_name, args, required=()):
+    """(sql, params) selecting the rows named by ?ids= and the listing filters, by id
+
+    Rows with NULL in any `required` column are left out.
+    """
+    where = [f'{column} IS NOT NULL' for column in required]
+    params = []
+    raw_ids = args.get('ids')
+    if raw_ids:
+        try:
+            ids = [int(i) for i in raw_ids.split(',') if i.strip()]
+        except ValueError:
+            raise InvalidQuery("ids must be comma-separated integers")
+        if len(ids) > MAX_PAGE_SIZE:
+            raise InvalidQuery(f"At most {MAX_PAGE_SIZE} ids; use filters for larger batches")
+        where.append(f"id IN ({', '.join('?' for _ in ids)})")
+        params.extend(ids)
+    for name in FILTER_PARAMS:
+        value = args.get(name)
+        if value is None:
+            continue
+        column = TABLE_FILTERS[table_name].get(name)
+        if column is None:
+            raise UnsupportedFilter(f"{table_name} cannot be filtered by {name}")
+        where.append(f'{column} = ?')
+        params.append(value)
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+    return f'SELECT * FROM {table_name}{where_sql} ORDER BY id', params
+
+def iter_records(sql, params):
+    """Rows of a query as dicts, fetched in chunks on a connection owned by the generator"""
+    conn = get_conn()
+    try:
         cursor = conn.cursor()
+        cursor.execute(p(sql), tuple(params))
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            yield from rows_to_dicts(cursor, rows)
+    finally:
+        conn.close()
 
-        table_map = {
-            'tax-rate': 'tax_rate_calculations',
-            'notices': 'public_notices',
-            'ballots': 'ballots_petitions',
-            'school': 'school_district_forms',
-            'water': 'water_district_forms'
-        }
+def render_pdfs(kind, records):
+    """(record, pdf bytes) in order; larger batches go to the process pool"""
+    records = iter(records)
+    head = list(itertools.islice(records, PDF_POOL_MIN_BATCH))
+    executor = None
+    if PDF_WORKERS > 1 and len(head) >= PDF_POOL_MIN_BATCH:
+        executor = get_pdf_executor()
+    return pdf_render.render_many(kind, itertools.chain(head, records), executor, pdf_cache,
+                                  window=PDF_WORKERS * 4)
+
+def pdf_zip_entries(kind, sql, params):
+    for record, data in render_pdfs(kind, iter_records(sql, params)):
+        yield pdf_render.pdf_filename(kind, record), data
+
+@app.route('/api/pdf/<category>/<int:id>', methods=['GET'])
+def get_submission_pdf(category, id):
+    """Render a saved tax rate calculation or notice as a PDF"""
+    if category not in pdf_render.RENDERERS:
+        return jsonify({"status": "error", "message": "PDFs are available for tax-rate and notices"}), 400
+    try:
+        records = list(iter_records(f'SELECT * FROM {CATEGORY_TABLES[category]} WHERE id = ?', [id]))
+        if not records:
+            return jsonify({"status": "error", "message": "Record not found"}), 404
+        [(record, data)] = render_pdfs(category, records)
+        return Response(data, mimetype='application/pdf', headers={
+            'Content-Disposition': f'inline; filename="{pdf_render.pdf_filename(category, record)}"'})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-        table_name = table_map.get(category)
-        if not table_name:
-            return jsonify({"status": "error", "message": "Invalid category"}), 400
+@app.route('/api/pdf/<category>', methods=['GET'])
+def export_submission_pdfs(category):
+    """Stream PDFs of many records as a ZIP (?ids=1,2,3 and/or county, tax_year, taxing_unit)"""
+    if category not in pdf_render.RENDERERS:
+        return jsonify({"status": "error", "message": "PDFs are available for tax-rate and notices"}), 400
+    try:
+        sql, params = records_query(CATEGORY_TABLES[category], request.args)
+    except InvalidQuery as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return Response(
+        stream_with_context(pdf_render.zip_stream(pdf_zip_entries(category, sql, params))),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{category}-pdfs.zip"'}
+    )
+
+@app.cli.command('render-pdfs')
+@click.argument('category', type=click.Choice(sorted(pdf_render.RENDERERS)))
+@click.option('--county')
+@click.option('--tax-year')
+@click.option('--taxing-unit')
+@click.option('--ids', help='Comma-separated record ids')
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+              help='ZIP file to write (default: <category>-pdfs.zip)')
+def render_pdfs_command(category, county, tax_year, taxing_unit, ids, output):
+    """Render saved records to PDFs across the process pool and write a ZIP"""
+    args = {'county': county, 'tax_year': tax_year, 'taxing_unit': taxing_unit, 'ids': ids}
+    try:
+        sql, params = records_query(CATEGORY_TABLES[category], {k: v for k, v in args.items() if v})
+    except InvalidQuery as e:
+        raise click.BadParameter(str(e))
+    output = output or f'{category}-pdfs.zip'
+    count = [0]
+
+    def counted(entries):
+        for entry in entries:
+            count[0] += 1
+            yield entry
+
+    started = time.perf_counter()
+    with open(output, 'wb') as f:
+        for chunk in pdf_render.zip_stream(counted(pdf_zip_entries(category, sql, params))):
+            f.write(chunk)
+    elapsed = time.perf_counter() - started
+    click.echo(f"Rendered {count[0]} PDFs -> {output} in {elapsed:.1f}s "
+               f"({count[0] / elapsed if elapsed else 0:.0f}/s, {pdf_cache.hits} from cache)")
+
+# Tax rate calculation columns a notice is generated from
+NOTICE_RATE_COLUMNS = ('proposed_rate', 'no_new_revenue_rate', 'voter_approval_rate')
+NOTICE_HEARING_PARAMS = ('meeting_date', 'meeting_time', 'meeting_location')
+
+def generated_notices(args):
+    """Public-notice records for the tax rate calculations selected by args
+
+    The notice type follows from each unit's rates; the hearing details in
+    args apply to every notice.
+    """
+    sql, params = records_query('tax_rate_calculations', args, required=NOTICE_RATE_COLUMNS)
+    hearing = {name: args.get(name) for name in NOTICE_HEARING_PARAMS}
+    return notice_templates.generate_notices(iter_records(sql, params), **hearing)
+
+@app.route('/api/notices/generate', methods=['GET'])
+def generate_notices():
+    """Stream generated notices as NDJSON for county/tax_year/taxing_unit/ids (not saved)
+
+    Each line is a /api/public-notice body, so the output can be posted to
+    /api/public-notice/batch as-is.
+    """
+    try:
+        notices = generated_notices(request.args)
+    except InvalidQuery as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    lines = (json.dumps(notice) + '\n' for notice in notices)
+    return Response(stream_with_context(export.chunked(lines)), mimetype=export.FORMATS['ndjson'])
+
+@app.cli.command('generate-notices')
+@click.option('--county')
+@click.option('--tax-year')
+@click.option('--taxing-unit')
+@click.option('--ids', help='Comma-separated tax rate calculation ids')
+@click.option('--meeting-date', help='Hearing date for every notice (YYYY-MM-DD)')
+@click.option('--meeting-time')
+@click.option('--meeting-location')
+@click.option('--save', is_flag=True, help='Insert the notices into public_notices')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Also write them to this NDJSON file')
+def generate_notices_command(save, output, **options):
+    """Generate the notice for every tax rate calculation matching the filters"""
+    args = {name: value for name, value in options.items() if value}
+    try:
+        notices = generated_notices(args)
+    except InvalidQuery as e:
+        raise click.BadParameter(str(e))
+    out = open(output, 'w') if output else None
+    spec = FORM_SPECS['public_notice']
+    size = bulk.chunk_size(DB_MODE, form_columns(spec), BULK_CHUNK_SIZE)
+    generated, saved, pending = 0, 0, []
+    started = time.perf_counter()
+    try:
+        for notice in notices:
+            generated += 1
+            if out:
+                out.write(json.dumps(notice) + '\n')
+            if save:
+                pending.append(form_params(spec, notice))
+                if len(pending) >= size:
+                    saved += len(insert_form_rows('public_notice', pending, None))
+                    pending = []
+        if pending:
+            saved += len(insert_form_rows('public_notice', pending, None))
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - started
+    click.echo(f"Generated {generated} notices in {elapsed:.2f}s "
+               f"({generated / elapsed if elapsed else 0:.0f}/s)"
+               + (f", saved {saved} to public_notices" if save else ''))
+
+@app.cli.command('precompress')
+@click.argument('directory', required=False)
+def precompress_command(directory):
+    """Write .gz/.br sidecars for static files (default: dist/)"""
+    for path in compression.precompress_tree(directory or DIST_DIR):
+        click.echo(path)
+
+@app.cli.command('search-index')
+def search_index_command():
+    """Create SQL Server full-text indexes for /api/search (other databases index in migrations)"""
+    if DB_MODE != 'sqlserver':
+        click.echo(f"Nothing to do: {DB_MODE} search indexes are created by migrations")
+        return
+    conn = get_conn()
+    # Full-text DDL is not allowed inside a transaction
+    conn.raw.autocommit = True
+    try:
+        tables = search.create_sqlserver_fulltext(conn.cursor())
+    finally:
+        conn.raw.autocommit = False
+        conn.close()
+    if tables:
+        click.echo(f"Full-text indexes ready on {', '.join(tables)}")
+    else:
+        click.echo("Full-Text Search is not installed on this SQL Server; /api/search uses LIKE")
 
-        cursor.execute(p(f'DELETE FROM {table_name} WHERE id = ?'), (id,))
+@app.cli.command('migrate')
+@click.option('--status', 'show_status', is_flag=True, help='List migrations instead of applying them')
+def migrate_command(show_status):
+    """Apply pending schema migrations"""
+    if show_status:
+        conn = get_conn()
+        for number, description, applied in migrations.status(conn):
+            click.echo(f"{number:>4}  {'applied' if applied else 'pending':<8} {description}")
+        conn.close()
+    else:
+        init_db()
 
-        cursor.execute(p('''
-            INSERT INTO form_submissions_log (form_category, form_id, action, ip_address)
-            VALUES (?, ?, ?, ?)
-        '''), (category, id, 'delete', request.remote_addr))
+@app.route('/api/analytics', methods=['GET'])
+@cached_response(lambda: [rollups.SOURCE_TABLE])
+def get_analytics():
+    """Tax rate calculation aggregates per county, tax year and form type
+
+    Read from the tax_rate_rollups running sums, so the cost depends on the
+    number of groups rather than rows. Query parameters: group_by
+    (comma-separated county, tax_year, form_type; default all three, empty
+    for statewide totals) and the county, tax_year and form_type filters.
+    """
+    try:
+        group_by = rollups.parse_group_by(request.args.get('group_by'))
+        filters = {key: request.args[key] for key in migrations.ROLLUP_KEYS if request.args.get(key)}
+        sql, params = rollups.query(DB_MODE, group_by, filters)
 
-        conn.commit()
+        conn = get_read_conn()
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        groups = rows_to_dicts(cursor, cursor.fetchall())
         conn.close()
 
         return jsonify({
             "status": "success",
-            "message": "Record deleted successfully"
+            "group_by": group_by,
+            "data": [rollups.summarize(row, group_by) for row in groups]
         }), 200
+    except rollups.AnalyticsQueryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/stats', methods=['GET'])
+@cached_response(lambda: list(migrations.COUNTED_TABLES))
 def get_statistics():
-    """Get database statistics"""
+    """Get database statistics (row counts maintained in table_stats)"""
     try:
-        conn = get_conn()
+        conn = get_read_conn()
         cursor = conn.cursor()
 
-        stats = {}
+        cursor.execute('SELECT table_name, row_count FROM table_stats')
+        counts = dict((row[0], row[1]) for row in cursor.fetchall())
 
-        cursor.execute('SELECT COUNT(*) FROM tax_rate_calculations')
-        stats['tax_rate_calculations'] = cursor.fetchone()[0]
+        conn.close()
 
-        cursor.execute('SELECT COUNT(*) FROM public_notices')
-        stats['public_notices'] = cursor.fetchone()[0]
+        stats = {table: counts.get(table, 0) for table in CATEGORY_TABLES.values()}
+        stats['total_submissions'] = total_submissions(counts)
 
-        cursor.execute('SELECT COUNT(*) FROM ballots_petitions')
-        stats['ballots_petitions'] = cursor.fetchone()[0]
+        return jsonify({
+            "status": "success",
+            "data": stats
+        }), 200
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-        cursor.execute('SELECT COUNT(*) FROM school_district_forms')
-        stats['school_district_forms'] = cursor.fetchone()[0]
+def total_submissions(counts):
+    """Audit log rows ever written: those in the database plus those archived"""
+    return counts.get(audit_partitions.LOG_TABLE, 0) + counts.get(audit_partitions.ARCHIVED_STAT, 0)
 
-        cursor.execute('SELECT COUNT(*) FROM water_district_forms')
-        stats['water_district_forms'] = cursor.fetchone()[0]
+ACTIVITY_MAX_DAYS = 366
 
-        cursor.execute('SELECT COUNT(*) FROM form_submissions_log')
-        stats['total_submissions'] = cursor.fetchone()[0]
+@app.route('/api/activity', methods=['GET'])
+@cached_response(lambda: [audit_partitions.LOG_TABLE])
+def get_activity():
+    """Audit log events per day, form category and action over the last `days` days
 
+    Only the partitions that can hold rows from that window are read.
+    """
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({"status": "error", "message": "days must be an integer"}), 400
+    if not 1 <= days <= ACTIVITY_MAX_DAYS:
+        return jsonify({"status": "error",
+                        "message": f"days must be between 1 and {ACTIVITY_MAX_DAYS}"}), 400
+    # Audit timestamps are UTC (see audit_log.audit_event), so days are UTC days
+    since = (now_utc() - timedelta(days=days - 1)).date()
+    day_sql = 'date(submitted_at)' if DB_MODE == 'sqlite' else 'CAST(submitted_at AS DATE)'
+    try:
+        conn = get_read_conn()
+        cursor = conn.cursor()
+        source = audit_partitions.recent_source(cursor, DB_MODE, since)
+        cursor.execute(p(f'SELECT {day_sql}, form_category, action, COUNT(*) FROM {source} '
+                         f'WHERE submitted_at >= ? GROUP BY {day_sql}, form_category, action '
+                         f'ORDER BY 1 DESC, 2, 3'), (audit_partitions.timestamp_text(since),))
+        rows = cursor.fetchall()
         conn.close()
 
         return jsonify({
             "status": "success",
-            "data": stats
+            "since": since.isoformat(),
+            "data": [{'day': str(day)[:10], 'form_category': category, 'action': action, 'count': count}
+                     for day, category, action, count in rows]
         }), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-# Initialize database tables on module load (works with both gunicorn and direct run)
-init_db()
+def rebuild_rollups():
+    """Recompute tax_rate_rollups from tax_rate_calculations; returns the group count"""
+    def work(cursor):
+        for sql in migrations.rollup_rebuild(DB_MODE):
+            cursor.execute(sql)
+        bump_table_stats(cursor, rollups.SOURCE_TABLE)
+        cursor.execute(f'SELECT COUNT(*) FROM {migrations.ROLLUP_TABLE}')
+        return cursor.fetchone()[0]
+    return write_transaction(work)
+
+def reconcile_row_counts():
+    """Recount every table from scratch and overwrite table_stats"""
+    def work(cursor):
+        counts = {}
+        for table_name in migrations.COUNTED_TABLES:
+            cursor.execute(p(f'UPDATE table_stats SET row_count = (SELECT COUNT(*) FROM {table_name}), '
+                             f'data_version = data_version + 1 WHERE table_name = ?'), (table_name,))
+            if cursor.rowcount == 0:
+                cursor.execute(p(f"INSERT INTO table_stats (table_name, row_count) "
+                                 f"SELECT ?, COUNT(*) FROM {table_name}"), (table_name,))
+            cursor.execute(p('SELECT row_count FROM table_stats WHERE table_name = ?'), (table_name,))
+            counts[table_name] = cursor.fetchone()[0]
+        return counts
+    return write_transaction(work)
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """Recount all tables, repair the /api/stats counters and rebuild the analytics rollups"""
+    for table_name, count in reconcile_row_counts().items():
+        click.echo(f"{table_name}: {count}")
+    click.echo(f"{migrations.ROLLUP_TABLE}: {rebuild_rollups()} groups")
+
+# Audit log partitions (see audit_partitions.py). Month partitions older than
+# AUDIT_ARCHIVE_AFTER_MONTHS (0 = never) are written to gzipped NDJSON under
+# AUDIT_ARCHIVE_DIR and dropped by `flask --app server archive-audit-log`;
+# archive files older than AUDIT_ARCHIVE_RETENTION_MONTHS (0 = forever) are
+# deleted. Postgres keeps AUDIT_PARTITIONS_AHEAD future months created.
+AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR') or os.path.join(BASE_DIR, 'audit_archive')
+AUDIT_ARCHIVE_AFTER_MONTHS = int(os.environ.get('AUDIT_ARCHIVE_AFTER_MONTHS', 12))
+AUDIT_ARCHIVE_RETENTION_MONTHS = int(os.environ.get('AUDIT_ARCHIVE_RETENTION_MONTHS', 0))
+AUDIT_PARTITIONS_AHEAD = int(os.environ.get('AUDIT_PARTITIONS_AHEAD', 2))
+
+def maintain_audit_partitions(today=None):
+    """Create upcoming month partitions (Postgres) or roll finished months out
+    of the current table (SQLite/SQL Server); returns the tables touched
+    """
+    today = today or now_utc().date()
+    if DB_MODE == 'postgres':
+        return write_transaction(lambda cursor: audit_partitions.ensure_partitions(
+            cursor, DB_MODE, today, AUDIT_PARTITIONS_AHEAD))
+    return list(write_transaction(lambda cursor: audit_partitions.roll(cursor, DB_MODE, today)))
+
+def archive_audit_log(today=None):
+    """Archive and drop expired month partitions, then prune old archive files
+
+    Returns ({month: rows archived}, [months whose archives were deleted]).
+    A partition is dropped only if it still holds exactly the rows written
+    to its archive file.
+    """
+    today = today or now_utc().date()
+    maintain_audit_partitions(today)
+    os.makedirs(AUDIT_ARCHIVE_DIR, exist_ok=True)
+    manifest = audit_partitions.read_manifest(AUDIT_ARCHIVE_DIR)
+    archived = {}
+    if AUDIT_ARCHIVE_AFTER_MONTHS:
+        conn = get_conn()
+        try:
+            expired = audit_partitions.expired_partitions(conn.cursor(), DB_MODE, today,
+                                                          AUDIT_ARCHIVE_AFTER_MONTHS)
+        finally:
+            conn.close()
+        for month, name in expired:
+            file_name = audit_partitions.archive_file_name(month, manifest)
+            path = os.path.join(AUDIT_ARCHIVE_DIR, file_name)
+            conn = get_conn()
+            try:
+                rows = audit_partitions.write_archive(conn, DB_MODE, name, path)
+            finally:
+                conn.close()
+
+            def drop(cursor, name=name, rows=rows):
+                audit_partitions.lock(cursor, DB_MODE)
+                cursor.execute(f'SELECT COUNT(*) FROM {name}')
+                if cursor.fetchone()[0] != rows:
+                    raise RuntimeError(f"{name} changed while it was archived; run again")
+                for sql in audit_partitions.drop_statements(cursor, DB_MODE, name):
+                    cursor.execute(sql)
+                bump_table_stats(cursor, audit_partitions.LOG_TABLE, -rows)
+                bump_table_stats(cursor, audit_partitions.ARCHIVED_STAT, rows)
+
+            try:
+                write_transaction(drop)
+            except Exception:
+                os.remove(path)
+                raise
+            audit_partitions.record_archive(manifest, month, file_name, rows)
+            audit_partitions.write_manifest(AUDIT_ARCHIVE_DIR, manifest)
+            archived[f'{month:%Y-%m}'] = archived.get(f'{month:%Y-%m}', 0) + rows
+    pruned = audit_partitions.prune_archives(AUDIT_ARCHIVE_DIR, manifest, today,
+                                             AUDIT_ARCHIVE_RETENTION_MONTHS)
+    audit_partitions.write_manifest(AUDIT_ARCHIVE_DIR, manifest)
+    return archived, pruned
+
+@app.cli.command('archive-audit-log')
+def archive_audit_log_command():
+    """Roll audit log partitions, archive and drop expired months, prune old archives"""
+    archived, pruned = archive_audit_log()
+    for month, rows in archived.items():
+        click.echo(f"Archived {month}: {rows} rows -> {AUDIT_ARCHIVE_DIR}")
+    for month in pruned:
+        click.echo(f"Deleted archive {month}")
+    if not archived and not pruned:
+        click.echo("Nothing to archive")
+
+# Apply schema migrations on module load (works with both gunicorn and direct run).
+# Set AUTO_MIGRATE=false to run `flask --app server migrate` as a deploy step instead.
+if os.environ.get('AUTO_MIGRATE', 'true').lower() != 'false':
+    init_db()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
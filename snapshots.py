@@ -0,0 +1,255 @@
+"""
+Typed, compressed columnar snapshots of the form tables for analysts
+
+Tables are written as Parquet or Arrow IPC files with real column types:
+REAL columns as float64, ids as int64, flags as bool and timestamps as
+timestamp[us], so pandas.read_parquet() gets numbers instead of strings. Rows
+are read through export.iter_rows() and converted one record batch at a time,
+so memory stays bounded by BATCH_ROWS whatever the table size.
+
+Snapshots are incremental. A table's watermark is the highest id and the
+latest updated_at written so far; the next snapshot holds the rows with a
+greater id or an updated_at at or after the watermark's (timestamps have
+one-second resolution on SQLite, so a row updated in the watermark's second
+must not be missed). `flask snapshot` appends one part file per table to a
+directory and keeps the watermarks in its manifest.json;
+GET /api/snapshot/<table> takes them as query parameters and returns the new
+ones in response headers. An updated row appears again in a later part, and
+rows updated in the watermark's second are sent again, so readers keep the
+last copy of each id. Deletes are not carried over.
+
+On PostgreSQL ids are drawn before commit, so an insert that commits after a
+snapshot with an id below its watermark is only picked up through its
+updated_at. A snapshot taken while such a transaction has been open for
+longer than a second can miss it; take snapshots of busy tables with some
+delay, or re-snapshot from an earlier watermark.
+
+Needs pyarrow (optional; HAS_PYARROW is False without it).
+"""
+
+import json
+import math
+import os
+import tempfile
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+
+import export
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', '.arrow'),
+}
+COMPRESSION = 'zstd'
+BATCH_ROWS = 50000
+MANIFEST = 'manifest.json'
+
+INTEGER_COLUMNS = ('id', 'form_id', 'row_version')
+TIMESTAMP_COLUMNS = ('created_at', 'updated_at', 'submitted_at')
+
+
+def _float(value):
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None  # SQLite keeps unparseable text in REAL columns
+    return number if math.isfinite(number) else None
+
+
+def _int(value):
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bool(value):
+    return None if value is None else bool(value)
+
+
+def _timestamp(value):
+    """Driver datetime or SQLite text -> naive datetime"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def _text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', 'replace')
+    return export.json_default(value) if isinstance(value, (datetime, date, Decimal)) else str(value)
+
+
+# kind -> (converter, arrow type factory)
+KINDS = {
+    'int': (_int, lambda: pa.int64()),
+    'float': (_float, lambda: pa.float64()),
+    'bool': (_bool, lambda: pa.bool_()),
+    'timestamp': (_timestamp, lambda: pa.timestamp('us')),
+    'text': (_text, lambda: pa.string()),
+}
+
+
+def column_kinds(columns, numeric=(), boolean=()):
+    """[(column, kind)] for a table; columns not named anywhere are text"""
+    def kind(column):
+        if column in INTEGER_COLUMNS:
+            return 'int'
+        if column in TIMESTAMP_COLUMNS:
+            return 'timestamp'
+        if column in numeric:
+            return 'float'
+        if column in boolean:
+            return 'bool'
+        return 'text'
+    return [(column, kind(column)) for column in columns]
+
+
+def arrow_schema(kinds):
+    return pa.schema([(column, KINDS[kind][1]()) for column, kind in kinds])
+
+
+def snapshot_query(table_name, kinds, after_id=0, updated_since=None, marker='?'):
+    """(sql, params) for the rows past a watermark, by id"""
+    columns = [column for column, _ in kinds]
+    where, params = [f'id > {marker}'], [after_id]
+    if updated_since is not None and 'updated_at' in columns:
+        where.append(f'updated_at >= {marker}')
+        params.append(updated_since)
+    return (f"SELECT {', '.join(columns)} FROM {table_name} "
+            f"WHERE {' OR '.join(where)} ORDER BY id", params)
+
+
+class Watermark:
+    """Highest id and latest updated_at among the rows written (and the previous watermark)"""
+
+    def __init__(self, last_id=0, updated_at=None):
+        self.last_id = last_id
+        self.updated_at = _timestamp(updated_at)
+        self.rows = 0
+
+    def observe(self, batch):
+        self.rows += batch.num_rows
+        if 'id' in batch.schema.names:
+            last_id = pc.max(batch.column('id')).as_py()
+            if last_id is not None:
+                self.last_id = max(self.last_id, last_id)
+        if 'updated_at' in batch.schema.names:
+            latest = pc.max(batch.column('updated_at')).as_py()
+            if latest is not None and (self.updated_at is None or latest > self.updated_at):
+                self.updated_at = latest
+
+
+def to_array(values, kind):
+    """Arrow array of one column; converts value by value only when the driver's types don't fit"""
+    arrow_type = KINDS[kind][1]()
+    try:
+        if kind == 'timestamp' and any(isinstance(v, str) for v in values):
+            return pa.array(values, type=pa.string()).cast(arrow_type)
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, TypeError, ValueError):
+        return pa.array([KINDS[kind][0](v) for v in values], type=arrow_type)
+
+
+def record_batches(rows, kinds, watermark, batch_rows=BATCH_ROWS):
+    """Arrow record batches from export.iter_rows() output"""
+    schema = arrow_schema(kinds)
+    next(rows)  # column names; kinds already lists them in SELECT order
+    while True:
+        batch = [tuple(row) for _, row in zip(range(batch_rows), rows)]
+        if not batch:
+            return
+        arrays = [to_array(list(values), kind) for (_, kind), values in zip(kinds, zip(*batch))]
+        record_batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        watermark.observe(record_batch)
+        yield record_batch
+
+
+def write(batches, kinds, sink, fmt='parquet'):
+    """Write record batches to a file path or binary file object"""
+    schema = arrow_schema(kinds)
+    if fmt == 'parquet':
+        with pq.ParquetWriter(sink, schema, compression=COMPRESSION) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    elif fmt == 'arrow':
+        options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+        with pa.ipc.new_file(sink, schema, options=options) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    else:
+        raise ValueError(f"Unknown snapshot format: {fmt}")
+
+
+def snapshot_file(conn, db_mode, table_name, kinds, fmt='parquet', after_id=0, updated_since=None):
+    """(spooled temporary file, Watermark) holding the rows past the watermark"""
+    marker = '%s' if db_mode == 'postgres' else '?'
+    sql, params = snapshot_query(table_name, kinds, after_id, updated_since, marker)
+    watermark = Watermark(after_id, updated_since)
+    rows = export.iter_rows(conn, db_mode, sql, params)
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        write(record_batches(rows, kinds, watermark), kinds, spool, fmt)
+    except BaseException:
+        spool.close()
+        raise
+    finally:
+        rows.close()
+    spool.seek(0)
+    return spool, watermark
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'tables': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def append_part(directory, table_name, spool, watermark, fmt, manifest, timestamp_text):
+    """Store a snapshot file as the table's next part and advance its watermark"""
+    state = manifest['tables'].setdefault(table_name, {'last_id': 0, 'updated_at': None, 'parts': []})
+    name = f"{table_name}/{table_name}-{len(state['parts']) + 1:05d}{FORMATS[fmt][1]}"
+    path = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        while True:
+            chunk = spool.read(export.CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+    os.replace(tmp, path)
+    state['parts'].append({'file': name, 'rows': watermark.rows,
+                           'written_at': datetime.now(timezone.utc).isoformat(timespec='seconds')})
+    state['last_id'] = watermark.last_id
+    state['updated_at'] = timestamp_text(watermark.updated_at)
+    return name
@@ -0,0 +1,81 @@
+"""
+SQLite settings for running the API under several gunicorn workers
+
+The 'production' profile:
+- journal_mode=WAL: readers no longer block the writer (or vice versa), so
+  long listings and exports do not cause "database is locked" on POSTs
+- synchronous=NORMAL: in WAL mode this is still crash-safe for the database;
+  only the last transactions before a power loss may be rolled back
+- cache_size / mmap_size / temp_store: keep hot pages in memory
+- busy_timeout: wait for the write lock instead of failing at once
+
+Writes additionally start with BEGIN IMMEDIATE (see server.write_transaction)
+so a transaction takes the write lock before it reads anything; a deferred
+transaction that reads and then writes can fail with SQLITE_BUSY without the
+busy handler ever being called. What still fails after busy_timeout is
+retried by retry_busy() with jittered exponential backoff.
+
+The 'legacy' profile keeps the previous behaviour (rollback journal, no
+retries). WAL needs a local filesystem; do not use it on network shares.
+"""
+
+import random
+import sqlite3
+import time
+
+PROFILES = {
+    'legacy': (),
+    'production': (
+        ('busy_timeout', 5000),  # first, so switching to WAL waits for other writers too
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -65536),  # KiB, i.e. 64 MiB per connection
+        ('mmap_size', 268435456),
+        ('temp_store', 'MEMORY'),
+        ('journal_size_limit', 67108864),  # truncate the WAL back to 64 MiB after checkpoints
+    ),
+}
+
+
+def profile_pragmas(profile, overrides=None):
+    """[(pragma, value)] for a profile, with overrides replacing or adding entries"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile: {profile} (expected one of {', '.join(PROFILES)})")
+    pragmas = dict(PROFILES[profile])
+    for name, value in (overrides or {}).items():
+        if value is not None:
+            pragmas[name] = value
+    return list(pragmas.items())
+
+
+def apply_pragmas(conn, pragmas):
+    cursor = conn.cursor()
+    for name, value in pragmas:
+        cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.fetchall()
+    cursor.close()
+
+
+def is_busy(exc):
+    """True for the errors SQLite raises when another connection holds the lock"""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_busy(func, retries=5, base_delay=0.05, max_delay=1.0, on_retry=None):
+    """Call func(), retrying up to `retries` times while the database is busy"""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= retries or not is_busy(e):
+                raise
+            # Full jitter keeps competing workers from retrying in lockstep
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, delay)
+            time.sleep(delay)
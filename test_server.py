@@ -0,0 +1,1094 @@
+#!/usr/bin/env python3
+"""
+API tests for the Truth-in-Taxation server (run with pytest)
+
+The server is pointed at a throwaway SQLite database before it is imported.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+TEST_DIR = tempfile.mkdtemp(prefix='tit-test-')
+os.environ['SQLITE_PATH'] = os.path.join(TEST_DIR, 'test.db')
+os.environ['AUDIT_SPOOL_DIR'] = os.path.join(TEST_DIR, 'audit_spool')
+os.environ['PDF_CACHE_DIR'] = os.path.join(TEST_DIR, 'pdf_cache')
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import asgi_server
+import asyncio
+import build_frontend
+import bulk
+import compression
+import migrations
+import notice_templates
+import pdf_render
+import rate_engine
+import server
+import search
+import snapshots
+import sqlite_tuning
+import synthetic_data
+from audit_log import AuditWriter, audit_event
+from db_pool import ConnectionPool, PoolTimeout
+from response_cache import CachedResponse, ResponseCache
+
+TAX_RATE_FORM = {
+    'formType': 'standard',
+    'taxingUnit': 'Test City',
+    'county': 'Travis',
+    'taxYear': '2025',
+    'lastYearLevy': 1000000.00,
+    'lastYearMORate': 0.45,
+    'lastYearDebtRate': 0.15,
+    'currentTotalValue': 250000000.00,
+    'newPropertyValue': 5000000.00,
+    'lostPropertyLevy': 10000.00,
+    'proposedMORate': 0.46,
+    'proposedDebtRate': 0.15,
+    'totalDebt': 15000000.00,
+    'taxIncrements': 0.00,
+    'isDisasterArea': False,
+    'noNewRevenueRate': 0.404082,
+    'voterApprovalRate': 0.568265,
+    'deMinimisRate': 0.586408,
+    'proposedRate': 0.61,
+}
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def test_save_and_fetch_tax_rate_calculation(client):
+    response = client.post('/api/tax-rate-calculation', json=TAX_RATE_FORM)
+    assert response.status_code == 201
+    form_id = response.get_json()['id']
+
+    response = client.get(f'/api/submission/tax-rate/{form_id}')
+    assert response.status_code == 200
+    assert response.get_json()['data']['taxing_unit'] == 'Test City'
+
+
+def test_requests_reuse_pooled_connections(client):
+    client.get('/api/stats')
+    created = server.pool.stats()['created']
+    for _ in range(5):
+        client.get('/api/stats')
+    stats = client.get('/api/pool').get_json()['data']
+    assert stats['created'] == created
+    assert stats['in_use'] == 0
+
+
+def test_failed_request_returns_connection(client):
+    client.post('/api/tax-rate-calculation', json={'formType': 'standard'})
+    assert server.pool.stats()['in_use'] == 0
+
+
+def test_pool_blocks_at_max_size_and_times_out():
+    pool = ConnectionPool(lambda: server.sqlite3.connect(':memory:'),
+                          min_size=0, max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    released = threading.Timer(0.01, conn.close)
+    released.start()
+    pool.timeout = 1
+    assert pool.acquire() is not None
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_pool_recycles_old_and_unhealthy_connections():
+    healthy = {'ok': True}
+
+    def ping(raw):
+        if not healthy['ok']:
+            raise RuntimeError('server went away')
+
+    pool = ConnectionPool(lambda: server.sqlite3.connect(':memory:'),
+                          min_size=0, max_size=2, ping_interval=0, ping=ping)
+    pool.acquire().close()
+    healthy['ok'] = False
+    pool.acquire().close()
+    assert pool.stats()['failed_checks'] == 1
+
+    pool.max_lifetime = 1e-9
+    pool.acquire().close()
+    assert pool.stats()['recycled'] == 1
+
+
+def test_category_pages_cover_every_row_once(client):
+    county = 'Pagination County'
+    for i in range(7):
+        form = dict(TAX_RATE_FORM, county=county, taxingUnit=f'Unit {i}')
+        client.post('/api/tax-rate-calculation', json=form)
+
+    seen, cursor = [], None
+    while True:
+        url = f'/api/submissions/tax-rate?county={county}&limit=3'
+        if cursor:
+            url += f'&cursor={cursor}'
+        body = client.get(url).get_json()
+        assert len(body['data']) <= 3
+        seen.extend(row['id'] for row in body['data'])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert len(seen) == 7
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_fields_projection_and_filter_validation(client):
+    client.post('/api/public-notice', json={
+        'noticeType': 'exceeds-both', 'taxingUnit': 'Projection City',
+        'noticeText': 'x' * 1000,
+    })
+    body = client.get('/api/submissions/notices?fields=taxing_unit&taxing_unit=Projection City').get_json()
+    assert set(body['data'][0]) == {'id', 'taxing_unit', 'created_at'}
+
+    assert client.get('/api/submissions/notices?fields=nope').status_code == 400
+    assert client.get('/api/submissions/notices?county=Travis').status_code == 400
+    assert client.get('/api/submissions/notices?cursor=garbage').status_code == 400
+
+
+def test_all_submissions_pages_each_table(client):
+    for i in range(3):
+        client.post('/api/school-district', json={
+            'formType': 'no-313', 'schoolDistrict': f'ISD {i}', 'county': 'Paging County'})
+    body = client.get('/api/submissions?limit=2&county=Paging County').get_json()
+    assert len(body['data']['school_district_forms']) == 2
+    assert body['data']['public_notices'] == []
+
+    body = client.get(f"/api/submissions?limit=2&county=Paging County&cursor={body['next_cursor']}").get_json()
+    assert len(body['data']['school_district_forms']) == 1
+    assert body['next_cursor'] is None
+
+
+def test_export_streams_ndjson_and_gzipped_csv(client):
+    client.post('/api/tax-rate-calculation', json=dict(TAX_RATE_FORM, taxingUnit='Export City'))
+
+    response = client.get('/api/export/tax-rate?format=ndjson')
+    assert response.status_code == 200
+    assert response.is_streamed
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert any(row['taxing_unit'] == 'Export City' for row in lines)
+
+    response = client.get('/api/export/tax_rate_calculations?format=csv&gzip=1')
+    rows = list(csv.reader(io.StringIO(gzip.decompress(response.get_data()).decode())))
+    assert rows[0][:2] == ['id', 'form_type']
+    assert len(rows) == len(lines) + 1
+    assert server.pool.stats()['in_use'] == 0
+
+    assert client.get('/api/export/users').status_code == 400
+
+
+def test_export_cli_writes_files(tmp_path):
+    runner = server.app.test_cli_runner()
+    result = runner.invoke(args=['export', 'form_submissions_log', '--format', 'csv', '-o', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    [path] = tmp_path.iterdir()
+    assert path.read_text().startswith('id,form_category')
+
+
+def test_batch_insert_reports_ids_and_errors(client):
+    records = [dict(TAX_RATE_FORM, taxingUnit=f'Batch Unit {i}') for i in range(4)]
+    records.insert(2, {'formType': 'standard'})
+    records.append(dict(TAX_RATE_FORM, lastYearLevy='lots'))
+
+    response = client.post('/api/tax-rate-calculation/batch', json=records)
+    assert response.status_code == 207
+    body = response.get_json()
+    assert body['inserted'] == 4 and body['failed'] == 2
+    assert 'taxingUnit' in body['results'][2]['error']
+    assert 'lastYearLevy' in body['results'][5]['error']
+
+    ids = [r['id'] for r in body['results'] if 'id' in r]
+    for offset, form_id in zip([0, 1, 3, 4], ids):
+        row = client.get(f'/api/submission/tax-rate/{form_id}').get_json()['data']
+        assert row['taxing_unit'] == records[offset]['taxingUnit']
+
+
+def test_batch_accepts_ndjson(client):
+    lines = [json.dumps({'noticeType': 'exceeds-both', 'taxingUnit': f'NDJSON {i}'}) for i in range(3)]
+    response = client.post('/api/public-notice/batch', data='\n'.join(lines + ['{oops']),
+                           content_type='application/x-ndjson')
+    body = response.get_json()
+    assert body['inserted'] == 3
+    assert 'line 4' in body['results'][3]['error']
+
+    assert client.post('/api/unknown/batch', json=[]).status_code == 404
+    assert client.post('/api/public-notice/batch', json={'not': 'a list'}).status_code == 400
+
+
+def test_rate_engine_matches_portal_formulas():
+    rates = rate_engine.compute_unit_rates(TAX_RATE_FORM)
+    assert rates['noNewRevenueRate'] == pytest.approx(990000 / 245000000 * 100)
+    assert rates['voterApprovalRate'] == pytest.approx(rates['noNewRevenueRate'] * 1.035 + 0.15)
+    assert rates['deMinimisRate'] == pytest.approx(rates['noNewRevenueRate'] * 1.08 + 0.15)
+    assert rates['proposedRate'] == pytest.approx(0.61)
+
+    disaster = rate_engine.compute_unit_rates(dict(TAX_RATE_FORM, isDisasterArea=True, proposedDebtRate=None))
+    assert disaster['voterApprovalRate'] == pytest.approx(rates['noNewRevenueRate'] * 1.05 + 0.15)
+    assert rate_engine.compute_unit_rates({'currentTotalValue': 10, 'newPropertyValue': 10})['noNewRevenueRate'] == 0
+
+    # Inputs are read the way the portal's parseFloat(value) || 0 reads them
+    parsed = [rate_engine._number(v) for v in ('1,234', '12abc', ' -.5e1x', 'abc', True, None, 7, '')]
+    assert parsed == [1, 12, -5, 0, 0, 0, 7, 0]
+
+
+def test_vectorized_rates_match_loop():
+    units = [
+        TAX_RATE_FORM,
+        dict(TAX_RATE_FORM, isDisasterArea=True, proposedDebtRate=0),
+        dict(TAX_RATE_FORM, newPropertyValue=None, lostPropertyLevy='n/a'),
+        {'currentTotalValue': 100, 'newPropertyValue': 200},
+        dict(TAX_RATE_FORM, lastYearLevy='1,000,000', currentTotalValue='250000000 dollars', proposedMORate=True),
+        dict(TAX_RATE_FORM, lastYearLevy='Infinity', proposedMORate='-Infinity'),
+        dict(TAX_RATE_FORM, currentTotalValue='1e400'),
+        {},
+    ]
+    assert rate_engine.compute_batch(units) == rate_engine.compute_rates_loop(units)
+
+
+def test_compute_rates_endpoint(client):
+    response = client.post('/api/rates/compute', json={'units': [TAX_RATE_FORM] * 3})
+    body = response.get_json()
+    assert body['count'] == 3
+    assert body['data'][0]['proposedRate'] == pytest.approx(0.61)
+    assert client.post('/api/rates/compute', json={'units': 'nope'}).status_code == 400
+
+
+def test_compute_rates_endpoint_columnar(client):
+    columns = {key: [TAX_RATE_FORM[key], None] for key in rate_engine.INPUT_FIELDS}
+    body = client.post('/api/rates/compute', json={'columns': columns}).get_json()
+    expected = rate_engine.compute_rates_loop([TAX_RATE_FORM, {}])
+    assert body['columns']['voterApprovalRate'] == [r['voterApprovalRate'] for r in expected]
+
+    ragged = {'lastYearLevy': [1, 2], 'currentTotalValue': [1]}
+    assert client.post('/api/rates/compute', json={'columns': ragged}).status_code == 400
+
+
+def test_schema_is_migrated_and_indexed():
+    conn = server.get_conn()
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    assert migrations.migrate(conn, 'sqlite') == []
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")
+    indexes = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    assert {'idx_tax_rate_calculations_created', 'idx_form_submissions_log_form'} <= indexes
+
+
+def test_migrate_upgrades_legacy_database(tmp_path):
+    conn = server.sqlite3.connect(str(tmp_path / 'legacy.db'))
+    for sql in migrations.INITIAL_SCHEMA['sqlite']:
+        conn.execute(sql)
+    conn.execute("INSERT INTO public_notices (notice_type, taxing_unit) VALUES ('x', 'Old Town')")
+    conn.commit()
+
+    assert migrations.migrate(conn, 'sqlite') == list(range(1, migrations.LATEST_VERSION + 1))
+    assert conn.execute('SELECT COUNT(*) FROM public_notices').fetchone()[0] == 1
+    assert migrations.migrate(conn, 'sqlite') == []
+
+
+def count_rows(table_name):
+    conn = server.get_conn()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT COUNT(*) FROM {table_name}')
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_stats_counters_track_inserts_and_deletes(client):
+    form_id = client.post('/api/water-district', json={
+        'districtType': 'mud', 'districtName': 'Counter MUD'}).get_json()['id']
+    client.post('/api/water-district/batch', json=[
+        {'districtType': 'mud', 'districtName': f'Counter MUD {i}'} for i in range(3)])
+    client.delete(f'/api/submission/water/{form_id}')
+    client.delete(f'/api/submission/water/{form_id}')
+    server.audit_writer.flush()
+
+    stats = client.get('/api/stats').get_json()['data']
+    assert stats['water_district_forms'] == count_rows('water_district_forms')
+    assert stats['total_submissions'] == count_rows('form_submissions_log')
+
+
+def test_audit_events_are_spooled_then_written_in_batches(client):
+    before = count_rows('form_submissions_log')
+    client.post('/api/water-district/batch', json=[
+        {'districtType': 'mud', 'districtName': f'Audit MUD {i}'} for i in range(5)])
+    spool = os.path.join(os.environ['AUDIT_SPOOL_DIR'], f'audit-{os.getpid()}.jsonl')
+    assert os.path.exists(spool) or server.audit_writer.stats()['written'] > 0
+
+    server.audit_writer.flush()
+    assert count_rows('form_submissions_log') == before + 5
+    assert not os.path.exists(spool)
+    assert server.audit_writer.stats()['pending_segments'] == 0
+
+
+def test_audit_strict_mode_and_orphan_recovery(tmp_path):
+    strict = AuditWriter(server.get_conn, server.DB_MODE, str(tmp_path), mode='strict')
+    conn = server.get_conn()
+    cursor = conn.cursor()
+    before = count_rows('form_submissions_log')
+    strict.in_transaction(cursor, [audit_event('water', 1, 'create', '127.0.0.1')])
+    strict.after_commit([audit_event('water', 1, 'create', '127.0.0.1')])
+    conn.commit()
+    conn.close()
+    assert count_rows('form_submissions_log') == before + 1
+
+    # A spool file left by a worker that died before flushing is replayed
+    dead_pid = 2 ** 22 + 1
+    with open(tmp_path / f'audit-{dead_pid}.jsonl', 'w') as f:
+        f.write(json.dumps(list(audit_event('water', 2, 'delete', '127.0.0.1'))) + '\n')
+    writer = AuditWriter(server.get_conn, server.DB_MODE, str(tmp_path), flush_interval=60)
+    writer.after_commit([audit_event('water', 3, 'create', '127.0.0.1')])
+    assert writer.flush() == 2
+    writer.close()
+    assert writer.stats()['recovered'] == 1
+    assert count_rows('form_submissions_log') == before + 3
+    assert os.listdir(tmp_path) == []
+
+
+def test_audit_spool_left_under_a_reused_pid_is_replayed(tmp_path):
+    # A restarted container can hand the new worker its predecessor's pid
+    pid = os.getpid()
+    with open(tmp_path / f'audit-{pid}-1.seg', 'w') as f:
+        f.write(json.dumps(list(audit_event('water', 1, 'create', '127.0.0.1'))) + '\n')
+    with open(tmp_path / f'audit-{pid}.jsonl', 'w') as f:
+        f.write(json.dumps(list(audit_event('water', 2, 'create', '127.0.0.1'))) + '\n')
+    inserted = []
+    writer = AuditWriter(server.get_conn, server.DB_MODE, str(tmp_path), flush_interval=60)
+    writer._insert = inserted.extend
+    assert sorted(os.listdir(tmp_path)) == [f'audit-{pid}-1.seg', f'audit-{pid}-2.seg']
+
+    writer.after_commit([audit_event('water', 3, 'create', '127.0.0.1')])
+    writer.flush()
+    writer.close()
+    assert [event[1] for event in inserted] == [1, 2, 3]
+    assert os.listdir(tmp_path) == []
+
+
+def test_reconcile_stats_repairs_drift(client):
+    conn = server.get_conn()
+    conn.execute("UPDATE table_stats SET row_count = 999 WHERE table_name = 'public_notices'")
+    conn.commit()
+    conn.close()
+
+    result = server.app.test_cli_runner().invoke(args=['reconcile-stats'])
+    assert result.exit_code == 0, result.output
+    assert client.get('/api/stats').get_json()['data']['public_notices'] == count_rows('public_notices')
+
+
+def test_etag_revalidation_and_invalidation(client):
+    first = client.get('/api/submissions/ballots?limit=5')
+    etag = first.headers['ETag']
+    assert etag.startswith('"')
+
+    again = client.get('/api/submissions/ballots?limit=5', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+    # Unrelated tables do not invalidate the ballots listing
+    client.post('/api/public-notice', json={'noticeType': 'x', 'taxingUnit': 'Elsewhere'})
+    assert client.get('/api/submissions/ballots?limit=5', headers={'If-None-Match': etag}).status_code == 304
+
+    client.post('/api/ballot-petition', json={'ballotType': 'voter-approval', 'taxingUnit': 'ETag Town'})
+    changed = client.get('/api/submissions/ballots?limit=5', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['data'][0]['taxing_unit'] == 'ETag Town'
+
+    stats_etag = client.get('/api/stats').headers['ETag']
+    client.delete(f"/api/submission/ballots/{changed.get_json()['data'][0]['id']}")
+    assert client.get('/api/stats', headers={'If-None-Match': stats_etag}).status_code == 200
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put('a', CachedResponse('"1"', b'aaaa', 200, 'application/json'))
+    cache.put('b', CachedResponse('"1"', b'bbbb', 200, 'application/json'))
+    assert cache.get('a', '"1"') is not None
+    cache.put('c', CachedResponse('"1"', b'cccc', 200, 'application/json'))
+    assert cache.get('b', '"1"') is None
+    assert cache.get('a', '"2"') is None
+    cache.put('d', CachedResponse('"1"', b'dddddddd', 200, 'application/json'))
+    assert cache.stats()['bytes'] <= 10
+
+
+def test_frontend_build_serves_hashed_immutable_assets(client, tmp_path, monkeypatch):
+    vendor = tmp_path / 'vendor'
+    vendor.mkdir()
+    for name in ('react.production.min.js', 'react-dom.production.min.js', 'jspdf.umd.min.js'):
+        (vendor / name).write_text(f'/* {name} */')
+    out = tmp_path / 'dist'
+    manifest = build_frontend.build(
+        out_dir=str(out), transpile=lambda source: b'compiled();',
+        vendor_files=[str(p) for p in sorted(vendor.iterdir())])
+
+    html = (out / 'truth-in-taxation-complete.html').read_text()
+    assert 'text/babel' not in html and 'cdnjs' not in html
+    app_js = manifest['pages']['truth-in-taxation-complete.html']['app']
+    assert f'/dist/assets/{app_js}' in html
+
+    monkeypatch.setattr(server, 'DIST_DIR', str(out))
+    page = client.get('/')
+    assert page.headers['Cache-Control'] == 'no-cache'
+    assert app_js.encode() in page.get_data()
+    asset = client.get(f'/dist/assets/{app_js}')
+    assert asset.get_data() == b'compiled();'
+    assert 'immutable' in asset.headers['Cache-Control']
+
+    # A page without CDN tags is a clear build error, not a crash
+    pages = tmp_path / 'pages'
+    pages.mkdir()
+    for page in build_frontend.PAGES:
+        (pages / page).write_text('<script type="text/babel">App()</script>')
+    with pytest.raises(SystemExit, match='no CDN <script> tags'):
+        build_frontend.build(out_dir=str(tmp_path / 'dist2'), transpile=lambda source: b'',
+                             base_dir=str(pages), vendor_files=[str(p) for p in sorted(vendor.iterdir())])
+
+
+def test_large_json_responses_are_compressed(client):
+    client.post('/api/tax-rate-calculation/batch', json=[dict(TAX_RATE_FORM, taxingUnit=f'Gzip {i}') for i in range(50)])
+    plain = client.get('/api/submissions/tax-rate?limit=50')
+    assert 'Content-Encoding' not in plain.headers
+
+    response = client.get('/api/submissions/tax-rate?limit=50', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.get_data())) == plain.get_json()
+
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+    assert client.get('/api/submissions/tax-rate?limit=50',
+                      headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+
+    small = client.get('/api/pool', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_negotiate_encoding_respects_q_values():
+    assert compression.negotiate_encoding('gzip;q=0, deflate', ('gzip',)) is None
+    assert compression.negotiate_encoding('br;q=0.5, gzip', ('br', 'gzip')) == 'br'
+    assert compression.negotiate_encoding('*', ('gzip',)) == 'gzip'
+    assert compression.negotiate_encoding(None) is None
+
+
+def test_static_files_use_precompressed_sidecars(client, tmp_path, monkeypatch):
+    assets = tmp_path / 'assets'
+    assets.mkdir()
+    (assets / 'app.abc123.js').write_text('console.log("portal");\n' * 200)
+    assert compression.precompress_tree(str(tmp_path))
+
+    monkeypatch.setattr(server, 'DIST_DIR', str(tmp_path))
+    response = client.get('/dist/assets/app.abc123.js', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/javascript'
+    assert gzip.decompress(response.get_data()) == (assets / 'app.abc123.js').read_bytes()
+
+    response = client.get('/dist/assets/app.abc123.js')
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_metrics_endpoint_reports_route_and_db_timings(client):
+    client.post('/api/water-district', json={'districtType': 'mud', 'districtName': 'Metrics MUD'})
+    client.get('/api/submissions/water?limit=5', headers={'If-None-Match': ''})
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    route = 'route="/api/submissions/<category>"'
+    assert f'tit_http_requests_total{{method="GET",{route},status="200"}}' in text
+    assert f'tit_http_request_duration_seconds_bucket{{method="GET",{route},le="+Inf"}}' in text
+    for phase in ('acquire', 'query', 'rows', 'json'):
+        assert f'tit_http_request_phase_seconds_count{{{route},phase="{phase}"}}' in text
+    assert f'tit_db_rows_total{{{route}}}' in text
+    assert 'tit_db_pool_acquired ' in text
+    assert 'tit_audit_log_queued ' in text
+
+
+def test_synthetic_dataset_covers_every_county_and_category():
+    data = synthetic_data.generate(units_per_county=3, years=(2024, 2025))
+    calcs = data['tax-rate-calculation']
+    assert {r['county'] for r in calcs} == set(synthetic_data.TEXAS_COUNTIES)
+    assert {r['taxYear'] for r in calcs} == {'2024', '2025'}
+    assert all(data[route] for route in data)
+    assert set(data) == set(server.ROUTE_CATEGORIES)
+    for route, records in data.items():
+        spec = server.FORM_SPECS[server.ROUTE_CATEGORIES[route]]
+        for record in records[:50]:
+            assert bulk.validate_record(spec, record)[1] is None
+
+
+def test_sqlite_production_profile_and_busy_retry():
+    conn = server.get_conn()
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode')
+    assert cursor.fetchone()[0] == 'wal'
+    cursor.execute('PRAGMA synchronous')
+    assert cursor.fetchone()[0] == 1  # NORMAL
+    conn.close()
+
+    calls = []
+
+    def locked_twice():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return 'ok'
+
+    def always_locked():
+        calls.append(1)
+        raise sqlite3.OperationalError('database is locked')
+
+    assert sqlite_tuning.retry_busy(locked_twice, retries=5, base_delay=0.001) == 'ok'
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(sqlite3.OperationalError):
+        sqlite_tuning.retry_busy(always_locked, retries=2, base_delay=0.001)
+    assert len(calls) == 3
+
+    with pytest.raises(sqlite3.OperationalError, match='no such table'):
+        sqlite_tuning.retry_busy(lambda: sqlite3.connect(':memory:').execute('SELECT * FROM missing'))
+
+
+def test_search_ranks_notices_ballots_and_locations(client):
+    client.post('/api/public-notice', json={
+        'noticeType': 'nnr', 'taxingUnit': 'Search Springs',
+        'meetingLocation': 'Main St Library, Room 2',
+        'noticeText': 'The council will hold a hearing on the proposed tax rate.'})
+    client.post('/api/ballot-petition', json={
+        'ballotType': 'voter-approval', 'taxingUnit': 'Search Springs',
+        'ballotText': 'Approving the ad valorem tax rate for the public library district.'})
+    client.post('/api/water-district', json={
+        'districtType': 'mud', 'districtName': 'Search MUD', 'hearingLocation': 'Fire Station 9'})
+
+    body = client.get('/api/search?q="main st" library').get_json()
+    assert [(hit['category'], hit['title']) for hit in body['data']] == [('notices', 'Search Springs')]
+    assert body['data'][0]['matched_fields'] == ['meeting_location']
+
+    hits = client.get('/api/search?q=libraries').get_json()['data']
+    assert {hit['category'] for hit in hits} == {'notices', 'ballots'}  # stemmed
+
+    assert client.get('/api/search?q=station&category=water').get_json()['data'][0]['title'] == 'Search MUD'
+    assert client.get('/api/search?q=station&category=ballots').get_json()['data'] == []
+
+    page = client.get('/api/search?q=libraries&limit=1').get_json()
+    rest = client.get(f"/api/search?q=libraries&limit=1&cursor={page['next_cursor']}").get_json()
+    first, second = page['data'][0], rest['data'][0]
+    assert (first['category'], first['id']) != (second['category'], second['id'])
+    assert rest['next_cursor'] is None
+
+    assert client.get('/api/search?q=  ""').status_code == 400
+    assert client.get('/api/search?q=x&category=users').status_code == 400
+
+    # SQL Server without full-text indexes falls back to LIKE; _ is not a wildcard there
+    for location in ('Hall_B annex', 'HallXB annex'):
+        client.post('/api/water-district', json={'districtType': 'mud', 'districtName': 'Like MUD',
+                                                 'hearingLocation': location})
+    sql, params = search._ranked_select('sqlserver', 'water', search.parse_query('hall_b'), ())
+    conn = server.get_conn()
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT hearing_location FROM water_district_forms WHERE id IN (SELECT id FROM ({sql}))',
+                   params)
+    assert [row[0] for row in cursor.fetchall()] == ['Hall_B annex']
+    conn.close()
+
+
+def test_pdf_rendering_caches_and_streams_zip(client):
+    ids = [client.post('/api/tax-rate-calculation', json=dict(TAX_RATE_FORM, taxingUnit=f'PDF City {i}'))
+           .get_json()['id'] for i in range(3)]
+    notice_id = client.post('/api/public-notice', json={
+        'noticeType': 'exceeds-both', 'formNumber': '50-873', 'taxingUnit': 'PDF City 0',
+        'meetingDate': '2025-08-20', 'noticeText': 'Hearing text (with parentheses)'}).get_json()['id']
+
+    response = client.get(f'/api/pdf/tax-rate/{ids[0]}')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.data.startswith(b'%PDF-1.4') and response.data.rstrip().endswith(b'%%EOF')
+    hits = server.pdf_cache.hits
+    assert client.get(f'/api/pdf/tax-rate/{ids[0]}').data == response.data
+    assert server.pdf_cache.hits == hits + 1
+    assert client.get(f'/api/pdf/notices/{notice_id}').data.startswith(b'%PDF')
+
+    # An edit in the same second still renders afresh, replacing the cached file
+    client.patch(f'/api/submission/tax-rate/{ids[0]}', json={'taxingUnit': 'PDF City Renamed'})
+    edited = client.get(f'/api/pdf/tax-rate/{ids[0]}').data
+    assert edited.startswith(b'%PDF') and edited != response.data
+    record = client.get(f'/api/submission/tax-rate/{ids[0]}').get_json()['data']
+    cached = os.listdir(os.path.join(os.environ['PDF_CACHE_DIR'], 'tax-rate'))
+    assert [name for name in cached if name.startswith(f'{ids[0]}-')] == [
+        os.path.basename(server.pdf_cache.path('tax-rate', record))]
+
+    response = client.get(f"/api/pdf/tax-rate?ids={','.join(map(str, ids))}")
+    assert response.is_streamed
+    archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+    assert [name.split('-')[2] for name in archive.namelist()] == [str(i) for i in ids]
+    assert all(archive.read(name).startswith(b'%PDF') for name in archive.namelist())
+    assert server.pool.stats()['in_use'] == 0
+
+    assert client.get('/api/pdf/ballots/1').status_code == 400
+    assert client.get('/api/pdf/tax-rate?ids=x').status_code == 400
+    assert client.get('/api/pdf/tax-rate/999999').status_code == 404
+
+    # Rendering is a picklable top-level call, so it can run in worker processes
+    record = client.get(f'/api/submission/tax-rate/{ids[1]}').get_json()['data']
+    with ProcessPoolExecutor(1) as executor:
+        [(_, data)] = pdf_render.render_many('tax-rate', [record], executor, printed_on='today')
+    assert data == pdf_render.render('tax-rate', record, 'today')
+
+
+def test_pdf_disaster_footnote_states_the_5_percent_multiplier():
+    data = pdf_render.render('tax-rate', {'id': 1, 'is_disaster_area': 1}, 'today')
+    text = b''.join(zlib.decompress(stream) for stream in re.findall(rb'stream\n(.*?)\nendstream', data, re.S)
+                    if stream.startswith(b'x'))
+    assert b'uses the 5% \\(1.05\\) multiplier' in text
+    assert b'8%' not in text
+
+
+def test_notice_templates_and_batch_generation(client, tmp_path):
+    rates = {'taxing_unit': 'Notice Town', 'tax_year': 2025, 'no_new_revenue_rate': 0.5,
+             'voter_approval_rate': 0.52, 'de_minimis_rate': 0.56, 'current_total_value': 1e9}
+    assert [notice_templates.classify(dict(rates, proposed_rate=r)) for r in (0.49, 0.51, 0.55, 0.6)] == \
+        ['exceeds-none', 'exceeds-nnr', 'de-minimis', 'exceeds-both']
+    assert notice_templates.classify(dict(rates, proposed_rate=0.51, current_total_value=5e7)) == 'small-city'
+    assert notice_templates.classify(dict(rates, proposed_rate=0.54, no_new_revenue_rate=0.55,
+                                                 de_minimis_rate=None)) == 'exceeds-va'
+    text = notice_templates.render_text(dict(rates, proposed_rate=0.6, meeting_date='2025-08-20'))
+    assert 'HELD ON AUGUST 20, 2025' in text and 'both the 2024 tax year and the 2025 tax year' in text
+    assert notice_templates.is_full_notice(text)
+
+    for county in ('Notice County', 'Other County'):
+        client.post('/api/tax-rate-calculation', json=dict(
+            TAX_RATE_FORM, taxingUnit=f'{county} ESD', county=county, taxYear='2031'))
+    response = client.get('/api/notices/generate?county=Notice County&tax_year=2031'
+                          '&meeting_location=Courthouse')
+    [notice] = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert (notice['noticeType'], notice['formNumber']) == ('exceeds-both', '50-873')
+    assert 'Notice County ESD' in notice['noticeText'] and 'AT COURTHOUSE' in notice['noticeText']
+    assert client.get('/api/notices/generate?ids=x').status_code == 400
+
+    before = count_rows('public_notices')
+    result = server.app.test_cli_runner().invoke(args=[
+        'generate-notices', '--tax-year', '2031', '--save', '-o', str(tmp_path / 'n.ndjson')])
+    assert result.exit_code == 0, result.output
+    assert 'Generated 2 notices' in result.output
+    assert count_rows('public_notices') == before + 2
+    assert len((tmp_path / 'n.ndjson').read_text().splitlines()) == 2
+
+
+def test_rate_scenario_sweep_matches_single_unit_rates(client):
+    form_id = client.post('/api/tax-rate-calculation', json=TAX_RATE_FORM).get_json()['id']
+    body = client.post(f'/api/rates/scenarios/{form_id}', json={'axes': [
+        {'field': 'proposedMORate', 'start': 0.3, 'stop': 0.6, 'num': 4},
+        {'field': 'proposedDebtRate', 'values': [0.1, 0.15, 0.2]},
+        {'field': 'currentTotalValue', 'start': 2e8, 'stop': 3e8, 'step': 5e7},
+    ]}).get_json()
+    assert body['shape'] == [4, 3, 3] and body['count'] == 36
+    assert [axis['field'] for axis in body['axes']] == ['proposedMORate', 'proposedDebtRate', 'currentTotalValue']
+    columns = body['columns']
+    assert all(len(values) == 36 for values in columns.values())
+
+    # Point (1, 2, 0): proposedMORate 0.4, proposedDebtRate 0.2, currentTotalValue 2e8
+    i = 1 * 9 + 2 * 3 + 0
+    unit = dict(TAX_RATE_FORM, proposedMORate=0.4, proposedDebtRate=0.2, currentTotalValue=2e8)
+    expected = rate_engine.compute_unit_rates(unit)
+    for key in rate_engine.RATE_FIELDS:
+        assert columns[key][i] == pytest.approx(expected[key], abs=1e-6)
+    assert columns['levy'][i] == pytest.approx(2e8 * 0.6 / 100)
+    record = {'proposed_rate': expected['proposedRate'], 'no_new_revenue_rate': expected['noNewRevenueRate'],
+              'voter_approval_rate': expected['voterApprovalRate'],
+              'de_minimis_rate': expected['deMinimisRate'], 'current_total_value': 2e8}
+    assert body['noticeTypes'][columns['noticeType'][i]] == notice_templates.classify(record)
+    assert columns['thresholds'][i] & body['thresholdBits']['noNewRevenue']
+    assert sum(body['summary']['noticeTypes'].values()) == 36
+
+    only = client.post(f'/api/rates/scenarios/{form_id}', json={
+        'axes': {'proposedMORate': [0.4]}, 'outputs': ['proposedRate']}).get_json()
+    assert list(only['columns']) == ['proposedRate']
+    assert client.post(f'/api/rates/scenarios/{form_id}', json={
+        'axes': {'isDisasterArea': [True]}}).status_code == 400
+    assert client.post(f'/api/rates/scenarios/{form_id}', json={'axes': {
+        'proposedMORate': {'start': 0, 'stop': 1, 'num': 10000},
+        'proposedDebtRate': {'start': 0, 'stop': 1, 'num': 1000}}}).status_code == 400
+    assert client.post('/api/rates/scenarios/999999', json={'axes': {'proposedMORate': [0.4]}}).status_code == 404
+
+
+def rollup_rows():
+    conn = server.get_conn()
+    rows = conn.execute('SELECT * FROM tax_rate_rollups ORDER BY county, tax_year, form_type').fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def test_analytics_rollups_track_inserts_and_deletes(client):
+    unit = dict(TAX_RATE_FORM, county='Rollup', taxYear='2024')
+    first = client.post('/api/tax-rate-calculation', json=unit).get_json()['id']
+    client.post('/api/tax-rate-calculation/batch', json=[
+        dict(unit, taxingUnit='Rollup ISD', proposedRate=0.5),
+        dict(unit, taxingUnit='Rollup MUD', proposedRate=0.4, voterApprovalRate=None),
+        dict(unit, taxingUnit='Rollup Town', formType='disaster', taxYear='2025'),
+    ])
+    client.delete(f'/api/submission/tax-rate/{first}')
+    client.delete(f'/api/submission/tax-rate/{first}')
+
+    body = client.get('/api/analytics?county=Rollup').get_json()
+    assert body['group_by'] == ['county', 'tax_year', 'form_type']
+    standard, disaster = body['data']
+    assert (standard['tax_year'], standard['form_type'], standard['units']) == ('2024', 'standard', 2)
+    assert standard['total_levy'] == pytest.approx(250000000 * 0.9 / 100)
+    assert standard['avg_proposed_rate'] == pytest.approx(0.45)
+    assert standard['avg_no_new_revenue_rate'] == pytest.approx(0.404082)
+    assert standard['avg_voter_approval_rate'] == pytest.approx(0.568265)
+    assert standard['units_exceeding_no_new_revenue'] == 1
+    assert standard['units_exceeding_voter_approval'] == 0
+    assert disaster['units_exceeding_voter_approval'] == 1
+
+    statewide = client.get('/api/analytics?group_by=&county=Rollup').get_json()['data']
+    assert statewide[0]['units'] == 3 and 'county' not in statewide[0]
+    assert client.get('/api/analytics?group_by=taxing_unit').status_code == 400
+
+    # Incremental maintenance agrees with a rebuild from the raw rows
+    maintained = rollup_rows()
+    server.rebuild_rollups()
+    rebuilt = rollup_rows()
+    assert [tuple(r.values())[:4] for r in maintained] == [tuple(r.values())[:4] for r in rebuilt]
+    for before, after in zip(maintained, rebuilt):
+        assert before == pytest.approx(after)
+
+
+@pytest.mark.skipif(not snapshots.HAS_PYARROW, reason='pyarrow is not installed')
+def test_snapshots_are_typed_and_incremental(client, tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    client.post('/api/tax-rate-calculation', json=TAX_RATE_FORM)
+    first = client.get('/api/snapshot/tax-rate')
+    assert first.status_code == 200
+    table = pq.read_table(io.BytesIO(first.get_data()))
+    assert table.num_rows == count_rows('tax_rate_calculations')
+    assert table.schema.field('proposed_rate').type == pa.float64()
+    assert table.schema.field('is_disaster_area').type == pa.bool_()
+    assert table.schema.field('created_at').type == pa.timestamp('us')
+    assert table.column('proposed_rate').to_pylist()[-1] == pytest.approx(0.61)
+
+    watermark = {'after_id': first.headers['X-Snapshot-Last-Id'],
+                 'updated_since': first.headers['X-Snapshot-Updated-At']}
+    # Only rows from the watermark's second are sent again
+    again = pq.read_table(io.BytesIO(client.get('/api/snapshot/tax-rate', query_string=watermark).get_data()))
+    assert max(again.column('id').to_pylist(), default=0) <= int(watermark['after_id'])
+    client.post('/api/tax-rate-calculation', json=dict(TAX_RATE_FORM, taxingUnit='Snapshot City'))
+    later = client.get('/api/snapshot/tax-rate', query_string=dict(watermark, format='arrow'))
+    rows = pa.ipc.open_file(pa.BufferReader(later.get_data())).read_all()
+    assert 'Snapshot City' in rows.column('taxing_unit').to_pylist()
+
+    # An update in the same second as the watermark is not missed
+    watermark = {'after_id': later.headers['X-Snapshot-Last-Id'],
+                 'updated_since': later.headers['X-Snapshot-Updated-At']}
+    first_id = table.column('id').to_pylist()[0]
+    conn = server.get_conn()
+    conn.execute('UPDATE tax_rate_calculations SET taxing_unit = ?, updated_at = '
+                 '(SELECT MAX(updated_at) FROM tax_rate_calculations) WHERE id = ?', ('Same Second', first_id))
+    conn.commit()
+    conn.close()
+    same = pq.read_table(io.BytesIO(client.get('/api/snapshot/tax-rate', query_string=watermark).get_data()))
+    assert 'Same Second' in same.column('taxing_unit').to_pylist()
+
+    server.audit_writer.flush()
+    runner = server.app.test_cli_runner()
+    result = runner.invoke(args=['snapshot', 'ballots_petitions', 'form_submissions_log', '-o', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    client.post('/api/ballot-petition', json={'ballotType': 'voter-approval', 'taxingUnit': 'Snapshot ISD'})
+    runner.invoke(args=['snapshot', 'ballots_petitions', '-o', str(tmp_path)])
+    manifest = snapshots.read_manifest(str(tmp_path))
+    parts = manifest['tables']['ballots_petitions']['parts']
+    assert 'Snapshot ISD' in pq.read_table(tmp_path / parts[-1]['file']).column('taxing_unit').to_pylist()
+    ids = {i for part in parts for i in pq.read_table(tmp_path / part['file']).column('id').to_pylist()}
+    assert len(ids) == count_rows('ballots_petitions')
+    log = pq.read_table(tmp_path / manifest['tables']['form_submissions_log']['parts'][0]['file'])
+    assert log.schema.field('form_id').type == pa.int64()
+
+
+def test_patch_recomputes_changed_rates_under_if_match(client):
+    form_id = client.post('/api/tax-rate-calculation', json=dict(TAX_RATE_FORM, county='Patch')).get_json()['id']
+    fetched = client.get(f'/api/submission/tax-rate/{form_id}')
+    assert fetched.headers['ETag'] == '"v1"'
+    preflight = client.options(f'/api/submission/tax-rate/{form_id}')
+    assert 'PATCH' in preflight.headers['Access-Control-Allow-Methods']
+    assert 'If-Match' in preflight.headers['Access-Control-Allow-Headers']
+    assert fetched.get_json()['data']['updated_at'] == fetched.get_json()['data']['created_at']
+
+    patched = client.patch(f'/api/submission/tax-rate/{form_id}', json={'newPropertyValue': 9000000},
+                           headers={'If-Match': '"v1"'})
+    assert patched.status_code == 200 and patched.headers['ETag'] == '"v2"'
+    body = patched.get_json()
+    assert body['recomputed'] == ['noNewRevenueRate', 'voterApprovalRate', 'deMinimisRate']
+    expected = rate_engine.compute_unit_rates(dict(TAX_RATE_FORM, newPropertyValue=9000000))
+    assert body['data']['no_new_revenue_rate'] == pytest.approx(expected['noNewRevenueRate'])
+    assert body['data']['proposed_rate'] == TAX_RATE_FORM['proposedRate']
+
+    stale = client.patch(f'/api/submission/tax-rate/{form_id}', json={'taxingUnit': 'Stale'},
+                         headers={'If-Match': '"v1"'})
+    assert stale.status_code == 412 and stale.get_json()['row_version'] == 2
+    renamed = client.patch(f'/api/submission/tax-rate/{form_id}', json={'taxingUnit': 'Renamed City'})
+    assert renamed.get_json()['recomputed'] == [] and renamed.headers['ETag'] == '"v3"'
+    assert client.patch(f'/api/submission/tax-rate/{form_id}', json={'proposedRate': 1}).status_code == 400
+    assert client.patch(f'/api/submission/tax-rate/{form_id}', json={'bogus': 1}).status_code == 400
+    assert client.patch('/api/submission/tax-rate/999999', json={'taxingUnit': 'x'}).status_code == 404
+
+    # Moving the row to another county moves it between rollup groups
+    client.patch(f'/api/submission/tax-rate/{form_id}', json={'county': 'Patched'}, headers={'If-Match': '*'})
+    assert client.get('/api/analytics?county=Patch').get_json()['data'] == []
+    moved = client.get('/api/analytics?county=Patched').get_json()['data'][0]
+    assert moved['avg_no_new_revenue_rate'] == pytest.approx(expected['noNewRevenueRate'], abs=1e-6)
+
+
+def test_patch_accepts_the_etag_of_a_compressed_get(client, monkeypatch):
+    monkeypatch.setattr(server, 'COMPRESS_MIN_SIZE', 0)
+    form_id = client.post('/api/tax-rate-calculation', json=dict(TAX_RATE_FORM, county='Gzip')).get_json()['id']
+    fetched = client.get(f'/api/submission/tax-rate/{form_id}', headers={'Accept-Encoding': 'gzip'})
+    assert fetched.headers['ETag'] == '"v1-gzip"'
+    patched = client.patch(f'/api/submission/tax-rate/{form_id}', json={'taxingUnit': 'Gzip City'},
+                           headers={'If-Match': fetched.headers['ETag']})
+    assert patched.status_code == 200 and patched.headers['ETag'] == '"v2"'
+
+
+def test_idempotency_keys_and_content_dedup_replay_without_writing(client, monkeypatch):
+    notice = {'noticeType': 'exceeds-nnr', 'taxingUnit': 'Idempotent City'}
+    headers = {'Idempotency-Key': 'save-notice-1'}
+    first = client.post('/api/public-notice', json=notice, headers=headers)
+    assert first.status_code == 201 and 'Idempotent-Replayed' not in first.headers
+    rows = count_rows('public_notices')
+    server.audit_writer.flush()
+    log = count_rows('form_submissions_log')
+
+    again = client.post('/api/public-notice', json=notice, headers=headers)
+    assert again.status_code == 201 and again.headers['Idempotent-Replayed'] == 'true'
+    assert again.get_json()['id'] == first.get_json()['id']
+    assert client.post('/api/public-notice', json=dict(notice, taxingUnit='Other'),
+                       headers=headers).status_code == 422
+    # Same body without a key: deduplicated by content within the window
+    assert client.post('/api/public-notice', json=notice).get_json()['id'] != first.get_json()['id']
+    duplicate = client.post('/api/public-notice', json=notice)
+    assert duplicate.headers['Idempotent-Replayed'] == 'true'
+    server.audit_writer.flush()
+    assert count_rows('public_notices') == rows + 1
+    assert count_rows('form_submissions_log') == log + 1
+
+    # Behind a trusted proxy, clients are told apart by X-Forwarded-For
+    monkeypatch.setattr(server.app, 'wsgi_app', server.ProxyFix(server.app.wsgi_app, x_for=1))
+    proxied = dict(notice, taxingUnit='Proxied City')
+    ids = {client.post('/api/public-notice', json=proxied,
+                       headers={'X-Forwarded-For': address}).get_json()['id']
+           for address in ('203.0.113.1', '203.0.113.2', '203.0.113.2')}
+    assert len(ids) == 2
+    assert 'Idempotency-Key' in client.options('/api/public-notice').headers['Access-Control-Allow-Headers']
+
+    batch = [{'ballotType': 'voter-approval', 'taxingUnit': f'Idempotent ISD {i}'} for i in range(3)]
+    saved = client.post('/api/ballot-petition/batch', json=batch, headers={'Idempotency-Key': 'ballots-1'})
+    replayed = client.post('/api/ballot-petition/batch', json=batch, headers={'Idempotency-Key': 'ballots-1'})
+    assert replayed.headers['Idempotent-Replayed'] == 'true'
+    assert replayed.get_json()['results'] == saved.get_json()['results']
+
+    # Expired keys are purged and no longer replay
+    conn = server.get_conn()
+    conn.execute('UPDATE idempotency_keys SET expires_at = 0')
+    conn.commit()
+    conn.close()
+    server.idempotency_purger.last = 0
+    fresh = client.post('/api/public-notice', json=notice, headers=headers)
+    assert fresh.status_code == 201 and fresh.get_json()['id'] != first.get_json()['id']
+    assert count_rows('idempotency_keys') == 1
+
+
+async def asgi_request(app, method, path, headers=(), body=b''):
+    """(status, headers, body) of one request sent straight to an ASGI app"""
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+             'client': ('127.0.0.1', 5000), 'server': ('testserver', 80)}
+    messages = [{'type': 'http.request', 'body': body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    start = sent[0]
+    response_headers = {k.decode(): v.decode() for k, v in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def test_asgi_app_matches_flask_routes(client):
+    async def run():
+        app = asgi_server.AsyncApp(server.app)
+        try:
+            body = json.dumps(dict(TAX_RATE_FORM, taxingUnit='ASGI City', county='Asgi')).encode()
+            status, _, saved = await asgi_request(app, 'POST', '/api/tax-rate-calculation',
+                                                  [('Content-Type', 'application/json')], body)
+            assert status == 201
+            form_id = json.loads(saved)['id']
+
+            for path in (f'/api/submission/tax-rate/{form_id}', '/api/submissions/tax-rate?county=Asgi',
+                         '/api/stats', '/api/analytics?county=Asgi', '/api/submissions/bogus',
+                         '/api/submissions/notices?county=x', '/api/analytics?group_by=bogus'):
+                status, headers, data = await asgi_request(app, 'GET', path)
+                expected = client.get(path)
+                assert status == expected.status_code, path
+                assert json.loads(data) == expected.get_json(), path
+                assert headers.get('ETag') == expected.headers.get('ETag'), path
+                assert headers['Access-Control-Allow-Origin'] == '*'
+
+            _, headers, _ = await asgi_request(app, 'GET', '/api/stats')
+            status, _, _ = await asgi_request(app, 'GET', '/api/stats', [('If-None-Match', headers['ETag'])])
+            assert status == 304
+            # Streamed Flask responses come through the bridge chunk by chunk
+            status, headers, data = await asgi_request(app, 'GET', '/api/export/tax_rate_calculations?format=ndjson')
+            assert status == 200 and data == client.get('/api/export/tax_rate_calculations?format=ndjson').get_data()
+            assert app.db.driver == ('aiosqlite' if asgi_server.async_db.HAS_AIOSQLITE else 'threads')
+        finally:
+            await app.shutdown()
+    asyncio.run(run())
+
+
+def test_reads_route_to_replicas_with_stickiness_and_failover(client, tmp_path, monkeypatch):
+    # A stale copy of the database stands in for a lagging replica
+    replica_path = str(tmp_path / 'replica.db')
+    source = sqlite3.connect(server.DB_PATH)
+    with sqlite3.connect(replica_path) as copy:
+        source.backup(copy)
+    source.close()
+
+    def connect_replica():
+        conn = sqlite3.connect(replica_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def connect_down():
+        raise sqlite3.OperationalError("replica unreachable")
+
+    replica = ConnectionPool(connect_replica, name='replica-1')
+    down = ConnectionPool(connect_down, name='replica-2')
+    router = server.replicas.ReplicaRouter([down, replica], retry_interval=60)
+    monkeypatch.setattr(server, 'replica_router', router)
+
+    saved = client.post('/api/tax-rate-calculation', json=dict(TAX_RATE_FORM, taxingUnit='Replica City'))
+    assert client.get_cookie(server.PRIMARY_COOKIE) is not None
+    form_id = saved.get_json()['id']
+    # The writer reads its own write from the primary...
+    assert client.get(f'/api/submission/tax-rate/{form_id}').status_code == 200
+    assert router.stats()['replicas'][1]['reads'] == 0
+
+    # ...while other clients read the replica, which has not caught up
+    other = server.app.test_client()
+    assert other.get(f'/api/submission/tax-rate/{form_id}').status_code == 404
+    stats = router.stats()
+    assert stats['replicas'][1]['reads'] >= 1
+    assert stats['replicas'][0]['healthy'] is False and stats['replicas'][0]['failures'] == 1
+    assert 'replication' in other.get('/api/pool').get_json()['data']
+
+    # The ASGI server's native routes are routed the same way
+    async def run():
+        app = asgi_server.AsyncApp(server.app)
+        try:
+            path = f'/api/submission/tax-rate/{form_id}'
+            cookie = f'{server.PRIMARY_COOKIE}={client.get_cookie(server.PRIMARY_COOKIE).value}'
+            assert (await asgi_request(app, 'GET', path))[0] == 404
+            assert (await asgi_request(app, 'GET', path, [('Cookie', cookie)]))[0] == 200
+        finally:
+            await app.shutdown()
+    reads = router.stats()['replicas'][1]['reads']
+    asyncio.run(run())
+    assert router.stats()['replicas'][1]['reads'] == reads + 1
+
+    # With every replica down, reads fail over to the primary
+    router.mark_down(router.replicas[1], 'test')
+    assert other.get(f'/api/submission/tax-rate/{form_id}').status_code == 200
+    assert router.stats()['fallbacks'] >= 1
+    replica.close_all()
+
+    # A saturated replica is passed over quickly, without being marked down
+    busy = ConnectionPool(connect_replica, max_size=1, timeout=server.REPLICA_ACQUIRE_TIMEOUT, name='busy')
+    held = busy.acquire()
+    router = server.replicas.ReplicaRouter([busy])
+    started = time.monotonic()
+    assert router.acquire() == (None, None)
+    assert time.monotonic() - started < 2
+    assert router.stats()['replicas'][0]['healthy'] is True
+    held.close()
+    busy.close_all()
+
+
+def test_audit_log_partitions_archive_and_activity(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'AUDIT_ARCHIVE_DIR', str(tmp_path))
+    monkeypatch.setattr(server, 'AUDIT_ARCHIVE_AFTER_MONTHS', 12)
+    monkeypatch.setattr(server, 'AUDIT_ARCHIVE_RETENTION_MONTHS', 0)
+    server.audit_writer.flush()
+    today = server.now_utc().date()
+    old = [('2001-03-05 10:00:00', 'create'), ('2001-03-20 11:00:00', 'delete'), ('2001-04-02 09:00:00', 'create')]
+
+    def insert(cursor):
+        for submitted_at, action in old:
+            cursor.execute('INSERT INTO form_submissions_log (form_category, form_id, action, ip_address, '
+                           'submitted_at) VALUES (?, 1, ?, ?, ?)', ('water', action, '127.0.0.1', submitted_at))
+        server.bump_table_stats(cursor, 'form_submissions_log', len(old))
+    server.write_transaction(insert)
+    total = client.get('/api/stats').get_json()['data']['total_submissions']
+    logged = count_rows('form_submissions_log')
+
+    # Finished months move out of the current table; the view still sees every row
+    assert 'form_submissions_log_p200103' in server.maintain_audit_partitions(today)
+    assert count_rows('form_submissions_log_p200103') == 2
+    assert count_rows('form_submissions_log') == logged
+    conn = server.get_conn()
+    source = server.audit_partitions.recent_source(conn.cursor(), server.DB_MODE, today)
+    conn.close()
+    assert 'form_submissions_log_current' in source and '_p2001' not in source
+
+    archived, pruned = server.archive_audit_log(today)
+    assert archived == {'2001-03': 2, '2001-04': 1} and pruned == []
+    with gzip.open(tmp_path / 'form_submissions_log-2001-03.ndjson.gz', 'rt') as f:
+        rows = [json.loads(line) for line in f]
+    assert [row['action'] for row in rows] == ['create', 'delete']
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())
+    assert manifest['months']['2001-04']['rows'] == 1
+    assert count_rows('form_submissions_log') == logged - 3
+    conn = server.get_conn()
+    assert server.audit_partitions.list_partitions(conn.cursor(), server.DB_MODE) == []
+    conn.close()
+    assert client.get('/api/stats').get_json()['data']['total_submissions'] == total
+
+    client.post('/api/water-district', json={'districtType': 'mud', 'districtName': 'Activity MUD'})
+    server.audit_writer.flush()
+    activity = client.get('/api/activity?days=7').get_json()
+    assert activity['since'] == (today - server.timedelta(days=6)).isoformat()
+    activity = activity['data']
+    assert any(row['day'] == today.isoformat() and row['form_category'] == 'water' for row in activity)
+    assert client.get('/api/activity?days=0').status_code == 400
+
+    # Archives past their retention are deleted
+    monkeypatch.setattr(server, 'AUDIT_ARCHIVE_RETENTION_MONTHS', 24)
+    assert server.archive_audit_log(today) == ({}, ['2001-03', '2001-04'])
+    assert os.listdir(tmp_path) == ['manifest.json']